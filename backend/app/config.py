@@ -30,6 +30,8 @@ for path in [p for p in candidates if p]:
 class Settings(BaseModel):
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "ollama")
     OLLAMA_ENDPOINT: str = os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434")
+    # Timeout (seconds) for the shared HTTP client used by the OpenAI/Ollama providers
+    LLM_HTTP_TIMEOUT: float = float(os.getenv("LLM_HTTP_TIMEOUT", "30"))
     OPENAI_API_KEY: str | None = os.getenv("OPENAI_API_KEY")
     # Embeddings (OpenAI): choose model and infer dim
     OPENAI_EMBEDDING_MODEL: str = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
@@ -45,6 +47,73 @@ class Settings(BaseModel):
     EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "local")  # local|openai
     SQLITE_VEC_ENABLE: bool = os.getenv("SQLITE_VEC_ENABLE", "false").lower() == "true"
     EMBED_DIM: int = int(os.getenv("EMBED_DIM", "768"))
+    # Local embeddings and Google query embeddings: concurrent calls are coalesced into one batch
+    EMBED_BATCH_MAX_SIZE: int = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+    EMBED_BATCH_MAX_WAIT_MS: float = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+    EMBED_REQUEST_TIMEOUT: float = float(os.getenv("EMBED_REQUEST_TIMEOUT", "120"))
+    # Document vector index: switch from flat to IVF (FAISS) above this many vectors
+    VECTOR_INDEX_IVF_THRESHOLD: int = int(os.getenv("VECTOR_INDEX_IVF_THRESHOLD", "10000"))
+    VECTOR_INDEX_NPROBE: int = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+    # FAISS vector compression: none|sq8 (int8 scalar quantizer)|pq (product quantizer, IVF only)
+    VECTOR_INDEX_QUANTIZATION: str = os.getenv("VECTOR_INDEX_QUANTIZATION", "none").lower()
+    # Quantized searches fetch k * this many candidates and re-rank them with exact FP32 scores
+    VECTOR_INDEX_REFINE_FACTOR: int = int(os.getenv("VECTOR_INDEX_REFINE_FACTOR", "4"))
+    VECTOR_INDEX_USE_GPU: bool = os.getenv("VECTOR_INDEX_USE_GPU", "false").lower() == "true"
+    # Storage format of doc_embeddings vectors: float32|float16|int8 (int8 keeps a per-vector scale)
+    EMBED_STORE_DTYPE: str = os.getenv("EMBED_STORE_DTYPE", "float16").lower()
+    # Storage format of SQLite chunk embeddings: float32|float16|int8 (as EMBED_STORE_DTYPE)
+    CHUNK_EMBED_STORE_DTYPE: str = os.getenv("CHUNK_EMBED_STORE_DTYPE", "int8").lower()
+    # SQLite chunk search: documents whose parsed embedding matrix stays in memory
+    CHUNK_MATRIX_CACHE_DOCS: int = int(os.getenv("CHUNK_MATRIX_CACHE_DOCS", "32"))
+    # Explain/highlight results kept in process memory in front of the SQLite cache
+    EXPLAIN_MEMORY_CACHE_SIZE: int = int(os.getenv("EXPLAIN_MEMORY_CACHE_SIZE", "1024"))
+    EXPLAIN_MEMORY_CACHE_TTL: float = float(os.getenv("EXPLAIN_MEMORY_CACHE_TTL", "3600"))
+    # Translations kept in process memory in front of the SQLite translation_cache
+    TRANSLATE_MEMORY_CACHE_SIZE: int = int(os.getenv("TRANSLATE_MEMORY_CACHE_SIZE", "1024"))
+    # Maximum translation LLM calls in flight across all callers (lowered adaptively under pushback)
+    TRANSLATE_MAX_CONCURRENCY: int = int(os.getenv("TRANSLATE_MAX_CONCURRENCY", "8"))
+    # Document bodies are translated in chunks of whole paragraphs up to this many characters
+    TRANSLATE_CHUNK_CHARS: int = int(os.getenv("TRANSLATE_CHUNK_CHARS", "1500"))
+    # Provider quota for translation calls per rolling minute: requests and estimated tokens (0 = unlimited)
+    TRANSLATE_RPM: int = int(os.getenv("TRANSLATE_RPM", "0"))
+    TRANSLATE_TPM: int = int(os.getenv("TRANSLATE_TPM", "0"))
+    # Failed translations answered with the original text for this many seconds instead of retrying the provider
+    TRANSLATE_NEGATIVE_TTL: float = float(os.getenv("TRANSLATE_NEGATIVE_TTL", "60"))
+    # Consecutive provider failures after which all translations fall back for TRANSLATE_NEGATIVE_TTL seconds
+    TRANSLATE_BREAKER_THRESHOLD: int = int(os.getenv("TRANSLATE_BREAKER_THRESHOLD", "5"))
+    # Reuse the translation of an earlier text whose embedding has at least this cosine similarity
+    # (0 disables; near-identical embeddings can still differ in a number or a negation)
+    TRANSLATE_SEMANTIC_THRESHOLD: float = float(os.getenv("TRANSLATE_SEMANTIC_THRESHOLD", "0"))
+    # Batch explain/highlight: maximum LLM calls in flight per batch
+    EXPLAIN_BATCH_CONCURRENCY: int = int(os.getenv("EXPLAIN_BATCH_CONCURRENCY", "8"))
+    # Full-document Gemini answers kept in process memory (keyed on document version + query)
+    GEMINI_DIRECT_CACHE_SIZE: int = int(os.getenv("GEMINI_DIRECT_CACHE_SIZE", "256"))
+    GEMINI_DIRECT_CACHE_TTL: float = float(os.getenv("GEMINI_DIRECT_CACHE_TTL", "3600"))
+    # Assembled full-document contents kept in memory for direct queries (total characters)
+    GEMINI_DIRECT_CONTENT_CACHE_CHARS: int = int(os.getenv("GEMINI_DIRECT_CONTENT_CACHE_CHARS", str(32 * 1024 * 1024)))
+    # Generated RAG answers kept in process memory (keyed on document version + query)
+    RAG_ANSWER_CACHE_SIZE: int = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256"))
+    RAG_ANSWER_CACHE_TTL: float = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+    # Maximum concurrent Gemini full-document calls
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+    # Maximum concurrent Google embedding batch calls while indexing
+    RAG_EMBED_MAX_CONCURRENCY: int = int(os.getenv("RAG_EMBED_MAX_CONCURRENCY", "8"))
+    # Chunk embeddings cached by text: hot entries in memory, all of them in the embedding_cache table
+    RAG_EMBED_CACHE_SIZE: int = int(os.getenv("RAG_EMBED_CACHE_SIZE", "2048"))
+    RAG_EMBED_CACHE_PERSIST: bool = os.getenv("RAG_EMBED_CACHE_PERSIST", "true").lower() == "true"
+    RAG_EMBED_CACHE_DTYPE: str = os.getenv("RAG_EMBED_CACHE_DTYPE", "int8").lower()  # float32|float16|int8, as EMBED_STORE_DTYPE
+    # Semantic answer cache: reuse an answer when a new query embeds within this cosine similarity
+    # (0 disables; embeddings of a question and its negation, or of the same question about another
+    # entity, often score above 0.9, so a hit can be the wrong answer; if enabled keep it near 0.97)
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0"))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "64"))  # per document; 0 disables
+    SEMANTIC_CACHE_MAX_SCOPES: int = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "256"))
+    SEMANTIC_CACHE_TTL: float = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+    # PDF parsing: extract pages in worker processes for documents with at least this many pages
+    PDF_PARSE_WORKERS: int = int(os.getenv("PDF_PARSE_WORKERS", str(min(8, os.cpu_count() or 1))))
+    PDF_PARSE_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARSE_PARALLEL_MIN_PAGES", "32"))
+    # PDF text extraction flags: default (same as page.get_text()) | minimal
+    PDF_TEXT_MODE: str = os.getenv("PDF_TEXT_MODE", "default").lower()
 
     # Database configuration - support both SQLite and PostgreSQL
     DB_TYPE: str = os.getenv("DB_TYPE", "sqlite")  # sqlite|postgresql
@@ -71,6 +140,13 @@ class Settings(BaseModel):
     RAG_BLOCK_OVERLAP_TOKENS: int = int(os.getenv("RAG_BLOCK_OVERLAP_TOKENS", "80"))
     RAG_MMR_LAMBDA: float = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))
     RAG_SIMILARITY_THRESHOLD: float = float(os.getenv("RAG_SIMILARITY_THRESHOLD", "0.65"))
+    # Workspace RAG only queries the documents whose centroid is closest to the query
+    RAG_WORKSPACE_MAX_DOCS: int = int(os.getenv("RAG_WORKSPACE_MAX_DOCS", "5"))
+    # Refresh document_chunks statistics after this many stored chunks, at most once per interval
+    RAG_ANALYZE_EVERY: int = int(os.getenv("RAG_ANALYZE_EVERY", "5000"))
+    RAG_ANALYZE_MIN_INTERVAL_S: float = float(os.getenv("RAG_ANALYZE_MIN_INTERVAL_S", "60"))
+    # An indexing lock older than this is treated as left behind by a crashed worker
+    RAG_INDEX_LOCK_STALE_MINUTES: int = int(os.getenv("RAG_INDEX_LOCK_STALE_MINUTES", "10"))
 
     ALLOW_CORS: bool = True
     REQUIRE_API_KEY: bool = os.getenv("REQUIRE_API_KEY", "false").lower() == "true"
@@ -1,7 +1,11 @@
+import asyncio
+import functools
 import os
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable, TypeVar
 from loguru import logger
 
 from .config import settings
@@ -52,6 +56,44 @@ def connect() -> sqlite3.Connection:
 
 CONN = connect() if settings.DB_TYPE == "sqlite" else None
 
+T = TypeVar("T")
+
+# Repository calls are synchronous; async routes hand them to this executor so
+# the event loop keeps serving requests while a query runs. SQLite shares one
+# connection, so a single worker keeps statements from interleaving across
+# transactions. PostgreSQL draws from the connection pool and can run in parallel.
+# Every statement on CONN, from any thread, has to go through this executor.
+_db_thread = threading.local()
+
+
+def _mark_db_thread() -> None:
+    _db_thread.active = True
+
+
+_DB_EXECUTOR = ThreadPoolExecutor(
+    max_workers=1 if settings.DB_TYPE == "sqlite" else 10,
+    thread_name_prefix="db",
+    initializer=_mark_db_thread,
+)
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking repository call on the DB executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DB_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+def call_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking repository call on the DB executor from synchronous code and wait for it.
+
+    For worker threads (indexing, embedding prefetch) that must not touch the shared
+    connection themselves. On a DB worker the call runs directly, since waiting on
+    the executor from inside it would deadlock.
+    """
+    if getattr(_db_thread, "active", False):
+        return fn(*args, **kwargs)
+    return _DB_EXECUTOR.submit(fn, *args, **kwargs).result()
+
 
 def executescript(sql: str):
     if CONN is None:
@@ -75,6 +117,14 @@ def query_one(sql: str, params: Iterable[Any] | None = None) -> dict | None:
     return cur.fetchone()
 
 
+def ensure_column(table: str, column: str, declaration: str):
+    """Add a column to an existing SQLite table unless it is already there."""
+    columns = {row["name"] for row in query_all(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+        logger.info(f"Added column {table}.{column}")
+
+
 @contextmanager
 def transaction():
     if settings.DB_TYPE == "postgresql":
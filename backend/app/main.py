@@ -118,6 +118,33 @@ async def api_key_guard(request: Request):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
 
 
+def _ensure_chunk_unique_index() -> None:
+    """One-time migration: enforce a unique (document_id, chunk_index) on document_chunks.
+
+    Databases created before the index may hold duplicate chunks; the newest row of
+    each pair is kept. Skipped once the index exists, so boots do not rescan the table.
+    """
+    exists = db.query_one(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_document_chunks_doc_chunk'"
+    )
+    if exists:
+        return
+    with db.CONN:
+        db.execute("DROP INDEX IF EXISTS idx_document_chunks_doc_id")
+        db.execute("DROP INDEX IF EXISTS idx_document_chunks_doc_chunk")
+        removed = db.execute(
+            """
+            DELETE FROM document_chunks WHERE id NOT IN (
+              SELECT MAX(id) FROM document_chunks GROUP BY document_id, chunk_index
+            )
+            """
+        ).rowcount
+        db.execute(
+            "CREATE UNIQUE INDEX ux_document_chunks_doc_chunk ON document_chunks(document_id, chunk_index)"
+        )
+    logger.info("Created unique chunk index (removed {} duplicate chunks)", removed)
+
+
 @app.on_event("startup")
 async def bootstrap():
     if settings.DB_TYPE == "sqlite":
@@ -128,6 +155,10 @@ async def bootstrap():
             logger.warning("SQLite running in ephemeral temp directory; data will not persist across restarts.")
         with open(os.path.join(os.path.dirname(__file__), "schema.sql"), "r", encoding="utf-8") as f:
             db.executescript(f.read())
+        _ensure_chunk_unique_index()
+        # Columns added after the table was first created
+        db.ensure_column("document_chunks", "token_count", "INTEGER")
+        db.ensure_column("document_chunks", "embedding_dim", "INTEGER")
     else:
         logger.info("Running in {} mode; database migrations should be handled externally.", settings.DB_TYPE)
     # Optional vacuum on startup to compact DB if requested
@@ -153,6 +184,17 @@ async def bootstrap():
             settings.SQLITE_VEC_ENABLE = False
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    from app.providers.http_client import close_http_client
+    await close_http_client()
+    try:
+        from app.services.doc_parse_service import shutdown_pdf_pool
+        shutdown_pdf_pool()
+    except ImportError:
+        pass
+
+
 @app.get("/health")
 async def health():
     return {"ok": True, "vec": settings.SQLITE_VEC_ENABLE}
@@ -0,0 +1,32 @@
+"""PDF page extraction shared by the parse service and its worker processes.
+
+Kept outside app.services on purpose: PDF worker processes are spawned and import
+this module fresh, and importing app.services would load the LLM providers and
+the embedding model in every worker.
+"""
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+from .config import settings
+
+
+# TextPage extraction flags, resolved once. "minimal" drops ligature and whitespace
+# preservation (ligatures are expanded, odd whitespace becomes spaces)
+TEXT_FLAGS = (
+    fitz.TEXT_MEDIABOX_CLIP | fitz.TEXT_CID_FOR_UNKNOWN_UNICODE
+    if settings.PDF_TEXT_MODE == "minimal"
+    else fitz.TEXTFLAGS_TEXT
+)
+
+
+def extract_page(page: "fitz.Page") -> Tuple[str, List[tuple]]:
+    """Text and layout blocks of a page, both read from a single TextPage."""
+    textpage = page.get_textpage(flags=TEXT_FLAGS)
+    return textpage.extractText(), textpage.extractBLOCKS()
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[Tuple[str, List[tuple]]]:
+    """Extract pages [start, stop) of a PDF (runs in a worker process)."""
+    with fitz.open(file_path) as doc:
+        return [extract_page(doc.load_page(page_num)) for page_num in range(start, stop)]
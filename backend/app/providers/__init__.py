@@ -3,9 +3,27 @@ from .ollama import OllamaProvider
 from .openai import OpenAIProvider
 from .gemini import GeminiProvider
 from .embeddings import LocalEmbeddingProvider, OpenAIEmbeddingProvider
+from typing import Optional
+
 from ..config import settings
 
+
+_llm_provider: Optional[LLMProvider] = None
+
+
 def get_llm_provider() -> LLMProvider:
+    """Return the process-wide LLM provider, creating it on first use.
+
+    Services and several routes ask for a provider per instance or per request;
+    the providers hold no per-call state, so one instance is shared by all of them.
+    """
+    global _llm_provider
+    if _llm_provider is None:
+        _llm_provider = _create_llm_provider()
+    return _llm_provider
+
+
+def _create_llm_provider() -> LLMProvider:
     print(f"LLM_PROVIDER setting: {settings.LLM_PROVIDER}")
     if settings.LLM_PROVIDER == "openai":
         print("Using OpenAI provider")
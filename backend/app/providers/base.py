@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 import numpy as np
 
 
@@ -8,10 +8,18 @@ class LLMProvider(ABC):
     async def complete(self, prompt: str, max_tokens: int = 1000) -> str:
         pass
 
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        """Yield the completion incrementally; providers without streaming yield it whole."""
+        yield await self.complete(prompt, max_tokens)
+
     @abstractmethod
     async def translate(self, text: str, target_lang: str) -> str:
         pass
 
+    async def translate_stream(self, text: str, target_lang: str) -> AsyncIterator[str]:
+        """Yield the translation incrementally; providers without streaming yield it whole."""
+        yield await self.translate(text, target_lang)
+
     @abstractmethod
     async def summarize(self, text: str) -> str:
         pass
@@ -1,16 +1,98 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from .base import EmbeddingProvider
+from .http_client import get_http_client
 from ..config import settings
 
 
+# Model inference runs here rather than on the event loop. A thread (not a process)
+# keeps one copy of the model and its CUDA context; torch releases the GIL while
+# encoding. One worker, since batches are already coalesced before they get here.
+_ENCODE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+
+class _PendingBatch:
+    """Embedding requests collected on one event loop, waiting to be encoded together."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.items: List[Tuple[List[str], asyncio.Future]] = []
+        self.size = 0
+        self.flushed = False
+
+
 class LocalEmbeddingProvider(EmbeddingProvider):
     def __init__(self):
         self.model = SentenceTransformer('all-MiniLM-L6-v2')  # 384d
         self._dim = self.model.get_sentence_embedding_dimension()
+        self.max_batch_size = settings.EMBED_BATCH_MAX_SIZE
+        self.max_wait = settings.EMBED_BATCH_MAX_WAIT_MS / 1000.0
+        self.timeout = settings.EMBED_REQUEST_TIMEOUT
+        self._pending: Optional[_PendingBatch] = None
 
     async def embed_texts(self, texts: list[str]) -> np.ndarray:
-        return self.model.encode(texts)
+        """Embed texts, coalescing concurrent calls into a single model.encode.
+
+        Calls arriving within EMBED_BATCH_MAX_WAIT_MS of each other share one
+        forward pass (up to EMBED_BATCH_MAX_SIZE texts), instead of each running
+        a small, underutilized batch.
+        """
+        if not texts:
+            return self.model.encode(texts)
+
+        loop = asyncio.get_running_loop()
+        batch = self._pending
+        if batch is None or batch.flushed or batch.loop is not loop:
+            batch = _PendingBatch(loop)
+            self._pending = batch
+            loop.call_later(self.max_wait, self._flush, batch)
+
+        future = loop.create_future()
+        batch.items.append((list(texts), future))
+        batch.size += len(texts)
+        if batch.size >= self.max_batch_size:
+            self._flush(batch)
+
+        return await asyncio.wait_for(future, timeout=self.timeout)
+
+    def _flush(self, batch: _PendingBatch) -> None:
+        if batch.flushed:
+            return
+        batch.flushed = True
+        if self._pending is batch:
+            self._pending = None
+
+        items = [(texts, future) for texts, future in batch.items if not future.done()]
+        if not items:
+            return
+        encoded = batch.loop.run_in_executor(
+            _ENCODE_EXECUTOR, self.model.encode, [text for texts, _ in items for text in texts]
+        )
+        encoded.add_done_callback(functools.partial(self._deliver, items))
+
+    @staticmethod
+    def _deliver(items: List[Tuple[List[str], asyncio.Future]], encoded: asyncio.Future) -> None:
+        if encoded.cancelled():
+            for _, future in items:
+                future.cancel()
+            return
+        if encoded.exception() is not None:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(encoded.exception())
+            return
+
+        vectors = encoded.result()
+        offset = 0
+        for texts, future in items:
+            if not future.done():
+                future.set_result(vectors[offset:offset + len(texts)])
+            offset += len(texts)
 
     @property
     def dimension(self) -> int:
@@ -19,13 +101,11 @@ class LocalEmbeddingProvider(EmbeddingProvider):
 
 class OpenAIEmbeddingProvider(EmbeddingProvider):
     def __init__(self):
-        import httpx
         self.api_key = settings.OPENAI_API_KEY
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY required")
-        self.client = httpx.AsyncClient(
-            headers={"Authorization": f"Bearer {self.api_key}"}
-        )
+        self.client = get_http_client()
+        self.headers = {"Authorization": f"Bearer {self.api_key}"}
         # Determine model and corresponding dimension
         self.model = settings.OPENAI_EMBEDDING_MODEL
         dim_map = {
@@ -41,7 +121,8 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
         for text in texts:
             response = await self.client.post(
                 "https://api.openai.com/v1/embeddings",
-                json={"input": text, "model": self.model}
+                json={"input": text, "model": self.model},
+                headers=self.headers
             )
             response.raise_for_status()
             embeddings.append(response.json()["data"][0]["embedding"])
@@ -1,18 +1,44 @@
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import asyncio
+from typing import AsyncIterator
 from loguru import logger
 from ..config import settings
 from .base import LLMProvider
+from .genai_client import configure_genai
 import httpx
 
 
+SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+}
+
+# Language codes mapped to the names used in translation prompts
+LANGUAGE_NAMES = {
+    "en": "English",
+    "zh": "Chinese",
+    "ja": "Japanese",
+    "ko": "Korean",
+    "es": "Spanish",
+    "fr": "French",
+    "de": "German",
+    "it": "Italian",
+    "pt": "Portuguese",
+    "ru": "Russian",
+    "ar": "Arabic",
+    "hi": "Hindi",
+}
+
+
 class GeminiProvider(LLMProvider):
     def __init__(self):
         self.model = None
         if settings.GEMINI_API_KEY:
             try:
-                genai.configure(api_key=settings.GEMINI_API_KEY)
+                configure_genai(settings.GEMINI_API_KEY)
                 self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
                 # Test the connection
                 logger.info("Gemini provider initialized successfully")
@@ -35,12 +61,7 @@ class GeminiProvider(LLMProvider):
                 self.model.generate_content_async(
                     prompt,
                     generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens),
-                    safety_settings={
-                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                    }
+                    safety_settings=SAFETY_SETTINGS
                 ),
                 timeout=settings.GEMINI_REQUEST_TIMEOUT
             )
@@ -62,25 +83,32 @@ class GeminiProvider(LLMProvider):
         logger.info(f"Falling back to mock completion: {mock_result}")
         return mock_result
 
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        if self.model is None:
+            yield f"[Mock completion: {prompt[:50]}...]"
+            return
+
+        response = await asyncio.wait_for(
+            self.model.generate_content_async(
+                prompt,
+                generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens),
+                safety_settings=SAFETY_SETTINGS,
+                stream=True
+            ),
+            timeout=settings.GEMINI_REQUEST_TIMEOUT
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    @staticmethod
+    def _translate_prompt(text: str, target_lang_name: str) -> str:
+        return f"Translate the following text to {target_lang_name}. Return ONLY the translated text without any explanations or additional text:\n\n{text}"
+
     async def translate(self, text: str, target_lang: str) -> str:
-        # Map language codes to full names
-        lang_names = {
-            "en": "English",
-            "zh": "Chinese",
-            "ja": "Japanese",
-            "ko": "Korean",
-            "es": "Spanish",
-            "fr": "French",
-            "de": "German",
-            "it": "Italian",
-            "pt": "Portuguese",
-            "ru": "Russian",
-            "ar": "Arabic",
-            "hi": "Hindi",
-        }
-        target_lang_name = lang_names.get(target_lang, target_lang)
+        target_lang_name = LANGUAGE_NAMES.get(target_lang, target_lang)
         
-        prompt = f"Translate the following text to {target_lang_name}. Return ONLY the translated text without any explanations or additional text:\n\n{text}"
+        prompt = self._translate_prompt(text, target_lang_name)
         
         if self.model is None:
             # Return mock translation when no API key is available or initialization failed
@@ -93,12 +121,7 @@ class GeminiProvider(LLMProvider):
             response = await asyncio.wait_for(
                 self.model.generate_content_async(
                     prompt,
-                    safety_settings={
-                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                    }
+                    safety_settings=SAFETY_SETTINGS
                 ),
                 timeout=settings.GEMINI_REQUEST_TIMEOUT
             )
@@ -119,6 +142,15 @@ class GeminiProvider(LLMProvider):
         logger.info(f"Falling back to mock translation: {mock_result}")
         return mock_result
 
+    async def translate_stream(self, text: str, target_lang: str) -> AsyncIterator[str]:
+        if self.model is None:
+            yield await self.translate(text, target_lang)
+            return
+
+        prompt = self._translate_prompt(text, LANGUAGE_NAMES.get(target_lang, target_lang))
+        async for chunk in self.stream(prompt, max_tokens=8192):
+            yield chunk
+
     async def summarize(self, text: str) -> str:
         prompt = f"Summarize the following text in 2-3 sentences:\n\n{text}"
         
@@ -130,12 +162,7 @@ class GeminiProvider(LLMProvider):
             response = await asyncio.wait_for(
                 self.model.generate_content_async(
                     prompt,
-                    safety_settings={
-                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                    }
+                    safety_settings=SAFETY_SETTINGS
                 ),
                 timeout=settings.GEMINI_REQUEST_TIMEOUT
             )
@@ -0,0 +1,22 @@
+import threading
+from typing import Optional
+
+import google.generativeai as genai
+
+_configured_key: Optional[str] = None
+_lock = threading.Lock()
+
+
+def configure_genai(api_key: str) -> None:
+    """Configure google.generativeai for api_key unless it already is.
+
+    genai.configure discards the SDK's cached clients and with them the pooled
+    gRPC channels, so configuring per provider instance (i.e. per request) cost a
+    new connection and TLS handshake on every call. Configuring once lets every
+    service share the same long-lived, multiplexed channels.
+    """
+    global _configured_key
+    with _lock:
+        if api_key != _configured_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
@@ -0,0 +1,51 @@
+from contextvars import ContextVar
+from typing import Mapping, Optional
+
+import httpx
+
+from ..config import settings
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Rate-limit headers of the latest provider response in the current task (None if it sent none)
+rate_limit_headers: ContextVar[Optional[Mapping[str, str]]] = ContextVar("rate_limit_headers", default=None)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient shared by the HTTP-based providers.
+
+    Providers are created per request in several routes; sharing one client keeps
+    keep-alive connections (and TLS sessions) pooled across them.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(settings.LLM_HTTP_TIMEOUT),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def capture_rate_limit(response: httpx.Response) -> None:
+    """Expose the response's rate-limit headers to the caller through rate_limit_headers."""
+    headers = {
+        name: value for name, value in response.headers.items()
+        if name.startswith("x-ratelimit-") or name == "retry-after"
+    }
+    rate_limit_headers.set(headers or None)
@@ -1,12 +1,15 @@
-import httpx
+import json
+from typing import AsyncIterator
+
 from .base import LLMProvider
+from .http_client import get_http_client
 from ..config import settings
 
 
 class OllamaProvider(LLMProvider):
     def __init__(self):
         self.endpoint = settings.OLLAMA_ENDPOINT
-        self.client = httpx.AsyncClient()
+        self.client = get_http_client()
 
     async def complete(self, prompt: str, max_tokens: int = 1000) -> str:
         response = await self.client.post(
@@ -21,10 +24,37 @@ class OllamaProvider(LLMProvider):
         response.raise_for_status()
         return response.json()["response"]
 
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        # Ollama streams newline-delimited JSON objects, one per generated chunk
+        async with self.client.stream(
+            "POST",
+            f"{self.endpoint}/api/generate",
+            json={
+                "model": "llama3.2:3b",
+                "prompt": prompt,
+                "stream": True,
+                "options": {"num_predict": max_tokens}
+            }
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+
     async def translate(self, text: str, target_lang: str) -> str:
         prompt = f"Translate the following text to {target_lang}:\n\n{text}\n\nTranslation:"
         return await self.complete(prompt, max_tokens=500)
 
+    async def translate_stream(self, text: str, target_lang: str) -> AsyncIterator[str]:
+        prompt = f"Translate the following text to {target_lang}:\n\n{text}\n\nTranslation:"
+        async for chunk in self.stream(prompt, max_tokens=500):
+            yield chunk
+
     async def summarize(self, text: str) -> str:
         prompt = f"Summarize the following text in 2-3 sentences:\n\n{text}\n\nSummary:"
         return await self.complete(prompt, max_tokens=300)
@@ -1,5 +1,8 @@
-import httpx
+import json
+from typing import AsyncIterator
+
 from .base import LLMProvider
+from .http_client import capture_rate_limit, get_http_client
 from ..config import settings
 
 
@@ -8,9 +11,8 @@ class OpenAIProvider(LLMProvider):
         self.api_key = settings.OPENAI_API_KEY
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY required")
-        self.client = httpx.AsyncClient(
-            headers={"Authorization": f"Bearer {self.api_key}"}
-        )
+        self.client = get_http_client()
+        self.headers = {"Authorization": f"Bearer {self.api_key}"}
 
     async def complete(self, prompt: str, max_tokens: int = 1000) -> str:
         response = await self.client.post(
@@ -19,15 +21,46 @@ class OpenAIProvider(LLMProvider):
                 "model": "gpt-3.5-turbo",
                 "messages": [{"role": "user", "content": prompt}],
                 "max_tokens": max_tokens
-            }
+            },
+            headers=self.headers
         )
         response.raise_for_status()
+        capture_rate_limit(response)
         return response.json()["choices"][0]["message"]["content"]
 
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        async with self.client.stream(
+            "POST",
+            "https://api.openai.com/v1/chat/completions",
+            json={
+                "model": "gpt-3.5-turbo",
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens,
+                "stream": True
+            },
+            headers=self.headers
+        ) as response:
+            response.raise_for_status()
+            capture_rate_limit(response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[len("data: "):]
+                if payload == "[DONE]":
+                    break
+                delta = json.loads(payload)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
     async def translate(self, text: str, target_lang: str) -> str:
         prompt = f"Translate the following text to {target_lang}:\n\n{text}"
         return await self.complete(prompt, max_tokens=500)
 
+    async def translate_stream(self, text: str, target_lang: str) -> AsyncIterator[str]:
+        prompt = f"Translate the following text to {target_lang}:\n\n{text}"
+        async for chunk in self.stream(prompt, max_tokens=500):
+            yield chunk
+
     async def summarize(self, text: str) -> str:
         prompt = f"Summarize the following text in 2-3 sentences:\n\n{text}"
         return await self.complete(prompt, max_tokens=300)
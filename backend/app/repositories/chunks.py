@@ -1,9 +1,33 @@
-from typing import List, Dict, Any, Optional
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import numpy as np
 from loguru import logger
 
 from ..config import settings
 from .. import db
+from ..services.vector_index_service import pack_vector, unpack_vector
+
+
+# Parsed per-document embedding matrices kept for the SQLite similarity search
+_MATRIX_CACHE: "OrderedDict[str, Tuple[tuple, List[Dict[str, Any]], np.ndarray, np.ndarray]]" = OrderedDict()
+_MATRIX_CACHE_LOCK = threading.Lock()
+
+
+def _decode_embedding(value: Any, dim: Optional[int] = None) -> np.ndarray:
+    """Decode a stored chunk embedding to float32.
+    
+    Blobs with a dim were written by pack_vector; blobs without one are raw float32,
+    and text is JSON from older versions.
+    """
+    if isinstance(value, (bytes, memoryview)):
+        if dim:
+            return unpack_vector(value, dim)
+        return np.frombuffer(value, dtype=np.float32)
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(list(value), dtype=np.float32)
 
 
 class ChunksRepository:
@@ -12,13 +36,13 @@ class ChunksRepository:
     def exists(self, document_id: str) -> bool:
         """Check if chunks exist for a document."""
         try:
+            # Stops at the first matching row instead of counting them all
             if settings.DB_TYPE == "postgresql":
-                sql = "SELECT COUNT(*) as count FROM document_chunks WHERE document_id = %s"
+                sql = "SELECT 1 AS found FROM document_chunks WHERE document_id = %s LIMIT 1"
             else:
-                sql = "SELECT COUNT(*) as count FROM document_chunks WHERE document_id = ?"
+                sql = "SELECT 1 AS found FROM document_chunks WHERE document_id = ? LIMIT 1"
             
-            result = db.db_query_one(sql, [document_id])
-            return result and result.get('count', 0) > 0
+            return db.db_query_one(sql, [document_id]) is not None
         except Exception as e:
             logger.error(f"Error checking chunks existence for document {document_id}: {e}")
             return False
@@ -73,73 +97,74 @@ class ChunksRepository:
             logger.error(f"Error getting all chunks for document {document_id}: {e}")
             return []
     
+    def iter_content_ordered(self, document_id: str) -> Iterator[str]:
+        """Yield the content of each chunk of a document in chunk_index order."""
+        if settings.DB_TYPE == "postgresql":
+            sql = "SELECT content FROM document_chunks WHERE document_id = %s ORDER BY chunk_index"
+            for row in db.db_query_all(sql, [document_id]) or []:
+                yield row['content']
+        else:
+            sql = "SELECT content FROM document_chunks WHERE document_id = ? ORDER BY chunk_index"
+            # Plain tuples: skip building a dict per row
+            cur = db.CONN.cursor()
+            cur.row_factory = None
+            for (content,) in cur.execute(sql, [document_id]):
+                yield content
+    
     def bulk_upsert(self, document_id: str, items: List[Dict[str, Any]]) -> int:
         """Bulk upsert chunks for a document. Returns number of upserted chunks.
         
         Args:
             document_id: The document ID
             items: List of chunk items with keys: chunk_index, content, page_start, page_end, embedding
+                (list or 1-D array), and optionally token_count
         """
         if not items:
             return 0
         
         try:
             with db.transaction() as conn:
-                upserted_count = 0
-                
-                for item in items:
-                    chunk_index = item['chunk_index']
-                    content = item['content']
-                    page_start = item.get('page_start')
-                    page_end = item.get('page_end')
-                    embedding = item['embedding']  # List[float]
-                    
-                    if settings.DB_TYPE == "postgresql":
-                        # PostgreSQL upsert with ON CONFLICT
-                        sql = """
-                        INSERT INTO document_chunks (document_id, chunk_index, content, page_start, page_end, embedding)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (document_id, chunk_index)
-                        DO UPDATE SET
-                            content = EXCLUDED.content,
-                            page_start = EXCLUDED.page_start,
-                            page_end = EXCLUDED.page_end,
-                            embedding = EXCLUDED.embedding
-                        """
-                        params = [document_id, chunk_index, content, page_start, page_end, embedding]
-                        
-                        if hasattr(conn, 'cursor'):  # PostgreSQL connection
-                            from ..db_postgres import execute_with_connection
-                            execute_with_connection(conn, sql, params)
-                        else:  # Fallback
-                            db.db_execute(sql, params)
-                    else:
-                        # SQLite upsert with INSERT OR REPLACE
-                        # Note: SQLite doesn't have vector type, so we'll store as JSON for compatibility
-                        import json
-                        embedding_json = json.dumps(embedding)
-                        
-                        sql = """
-                        INSERT OR REPLACE INTO document_chunks 
-                        (document_id, chunk_index, content, page_start, page_end, embedding)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """
-                        params = [document_id, chunk_index, content, page_start, page_end, embedding_json]
-                        db.db_execute(sql, params)
-                    
-                    upserted_count += 1
-                
-                # For SQLite, explicitly commit the transaction
-                if settings.DB_TYPE != "postgresql" and upserted_count > 0:
-                    db.CONN.commit()
-                
-                # Run ANALYZE for PostgreSQL to update statistics
-                if settings.DB_TYPE == "postgresql" and upserted_count > 0:
-                    analyze_sql = "ANALYZE document_chunks"
-                    if hasattr(conn, 'cursor'):
-                        from ..db_postgres import execute_with_connection
-                        execute_with_connection(conn, analyze_sql)
+                if settings.DB_TYPE == "postgresql":
+                    # PostgreSQL upsert with ON CONFLICT
+                    sql = """
+                    INSERT INTO document_chunks (document_id, chunk_index, content, page_start, page_end, embedding, token_count)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (document_id, chunk_index)
+                    DO UPDATE SET
+                        content = EXCLUDED.content,
+                        page_start = EXCLUDED.page_start,
+                        page_end = EXCLUDED.page_end,
+                        embedding = EXCLUDED.embedding,
+                        token_count = EXCLUDED.token_count
+                    """
+                    from ..db_postgres import execute_with_connection
+                    for item in items:
+                        embedding = item['embedding']  # List[float] or np.ndarray
+                        if isinstance(embedding, np.ndarray):
+                            embedding = embedding.tolist()
+                        params = [
+                            document_id, item['chunk_index'], item['content'], item.get('page_start'),
+                            item.get('page_end'), embedding, item.get('token_count')
+                        ]
+                        execute_with_connection(conn, sql, params)
+                else:
+                    # SQLite upsert with INSERT OR REPLACE; embeddings are packed in
+                    # CHUNK_EMBED_STORE_DTYPE (int8 by default: a quarter of float32 to read back)
+                    sql = """
+                    INSERT OR REPLACE INTO document_chunks 
+                    (document_id, chunk_index, content, page_start, page_end, embedding, token_count, embedding_dim)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """
+                    db.CONN.executemany(sql, (
+                        (
+                            document_id, item['chunk_index'], item['content'], item.get('page_start'),
+                            item.get('page_end'), pack_vector(item['embedding'], settings.CHUNK_EMBED_STORE_DTYPE),
+                            item.get('token_count'), len(item['embedding'])
+                        )
+                        for item in items
+                    ))
                 
+                upserted_count = len(items)
                 logger.info(f"Upserted {upserted_count} chunks for document {document_id}")
                 return upserted_count
                 
@@ -147,6 +172,134 @@ class ChunksRepository:
             logger.error(f"Error upserting chunks for document {document_id}: {e}")
             raise e
     
+    def list_indexed_document_ids(self) -> List[str]:
+        """Return ids of all documents that have chunks."""
+        results = db.db_query_all("SELECT DISTINCT document_id FROM document_chunks")
+        return [row['document_id'] for row in results or []]
+
+    def get_embeddings(self, document_id: str) -> np.ndarray:
+        """Return the chunk embeddings of a document as a float32 matrix."""
+        if settings.DB_TYPE == "postgresql":
+            sql = "SELECT embedding FROM document_chunks WHERE document_id = %s ORDER BY chunk_index"
+        else:
+            sql = "SELECT embedding, embedding_dim FROM document_chunks WHERE document_id = ? ORDER BY chunk_index"
+        rows = db.db_query_all(sql, [document_id]) or []
+
+        vectors = [_decode_embedding(row['embedding'], row.get('embedding_dim')) for row in rows]
+        return np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def upsert_centroid(self, document_id: str, centroid: np.ndarray) -> None:
+        """Store the (normalized) centroid of a document's chunk embeddings."""
+        vec = np.asarray(centroid, dtype=np.float32)
+        if settings.DB_TYPE == "postgresql":
+            sql = """
+            INSERT INTO doc_centroids (document_id, dim, vec) VALUES (%s, %s, %s)
+            ON CONFLICT (document_id) DO UPDATE SET dim = EXCLUDED.dim, vec = EXCLUDED.vec
+            """
+            db.db_execute(sql, [document_id, int(vec.shape[0]), vec.tobytes()])
+        else:
+            with db.transaction():
+                db.execute(
+                    "INSERT OR REPLACE INTO doc_centroids (document_id, dim, vec) VALUES (?, ?, ?)",
+                    (document_id, int(vec.shape[0]), vec.tobytes())
+                )
+
+    def get_cached_embeddings(self, cache_keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up cached embeddings by cache key; keys without an entry are left out."""
+        found: Dict[str, np.ndarray] = {}
+        placeholder = "%s" if settings.DB_TYPE == "postgresql" else "?"
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(cache_keys), 500):
+            keys = cache_keys[start:start + 500]
+            sql = (
+                "SELECT cache_key, dim, vec FROM embedding_cache "
+                f"WHERE cache_key IN ({', '.join([placeholder] * len(keys))})"
+            )
+            for row in db.db_query_all(sql, keys) or []:
+                found[row['cache_key']] = unpack_vector(row['vec'], row['dim'])
+        return found
+    
+    def store_cached_embeddings(self, entries: Dict[str, np.ndarray]) -> None:
+        """Store embeddings under their cache keys (existing keys are kept).
+        
+        Vectors are written in the RAG_EMBED_CACHE_DTYPE format (see pack_vector).
+        """
+        rows = [
+            (key, int(vec.shape[0]), pack_vector(vec, settings.RAG_EMBED_CACHE_DTYPE))
+            for key, vec in entries.items()
+        ]
+        if not rows:
+            return
+        if settings.DB_TYPE == "postgresql":
+            sql = (
+                "INSERT INTO embedding_cache (cache_key, dim, vec) VALUES (%s, %s, %s) "
+                "ON CONFLICT (cache_key) DO NOTHING"
+            )
+            with db.transaction() as conn:
+                with conn.cursor() as cur:
+                    cur.executemany(sql, rows)
+        else:
+            with db.transaction():
+                db.CONN.executemany(
+                    "INSERT OR IGNORE INTO embedding_cache (cache_key, dim, vec) VALUES (?, ?, ?)", rows
+                )
+    
+    def get_all_centroids(self) -> List[Dict[str, Any]]:
+        """Return all stored centroids as dicts with document_id and vec (np.ndarray)."""
+        rows = db.db_query_all("SELECT document_id, dim, vec FROM doc_centroids") or []
+        return [
+            {'document_id': row['document_id'], 'vec': np.frombuffer(bytes(row['vec']), dtype=np.float32)}
+            for row in rows
+        ]
+
+    def _document_matrix(self, document_id: str) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray]:
+        """Chunk rows (without embeddings), their (n, d) float32 embedding matrix and row norms.
+        
+        Decoding the stored embeddings dominates a SQLite search, so the result is cached
+        per document and revalidated against the chunk count and highest row id
+        (INSERT OR REPLACE assigns new ids, so re-indexing changes it).
+        """
+        version = db.db_query_one(
+            "SELECT COUNT(*) AS n, MAX(id) AS last_id FROM document_chunks WHERE document_id = ?",
+            [document_id]
+        )
+        version = (version['n'], version['last_id']) if version else (0, None)
+        
+        with _MATRIX_CACHE_LOCK:
+            cached = _MATRIX_CACHE.get(document_id)
+            if cached is not None and cached[0] == version:
+                _MATRIX_CACHE.move_to_end(document_id)
+                return cached[1], cached[2], cached[3]
+        
+        sql = (
+            "SELECT chunk_index, content, page_start, page_end, token_count, embedding, embedding_dim "
+            "FROM document_chunks WHERE document_id = ?"
+        )
+        rows = []
+        vectors = []
+        for row in db.db_query_all(sql, [document_id]) or []:
+            try:
+                vector = _decode_embedding(row.pop('embedding'), row.pop('embedding_dim')).reshape(-1)
+            except Exception as e:
+                logger.warning(f"Error processing chunk {row['chunk_index']}: {e}")
+                continue
+            if vectors and vector.shape != vectors[0].shape:
+                logger.warning(f"Skipping chunk {row['chunk_index']}: embedding dimension {vector.shape[0]}")
+                continue
+            rows.append(row)
+            vectors.append(vector)
+        
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1)
+        
+        if settings.CHUNK_MATRIX_CACHE_DOCS > 0:
+            with _MATRIX_CACHE_LOCK:
+                _MATRIX_CACHE[document_id] = (version, rows, matrix, norms)
+                _MATRIX_CACHE.move_to_end(document_id)
+                while len(_MATRIX_CACHE) > settings.CHUNK_MATRIX_CACHE_DOCS:
+                    _MATRIX_CACHE.popitem(last=False)
+        return rows, matrix, norms
+    
     def topk_exact(self, document_id: str, query_vec: List[float], candidate_k: int, 
                    return_embeddings: bool = False) -> List[Dict[str, Any]]:
         """Get top-k most similar chunks using exact cosine similarity search.
@@ -158,12 +311,13 @@ class ChunksRepository:
             return_embeddings: Whether to include embeddings in results
         
         Returns:
-            List of chunks with keys: chunk_index, content, page_start, page_end, score, embedding?
+            List of chunks with keys: chunk_index, content, page_start, page_end, token_count, score, embedding?,
+            ordered by descending score
         """
         try:
             if settings.DB_TYPE == "postgresql":
                 # PostgreSQL with pgvector cosine similarity
-                select_fields = "chunk_index, content, page_start, page_end"
+                select_fields = "chunk_index, content, page_start, page_end, token_count"
                 if return_embeddings:
                     select_fields += ", embedding"
                 
@@ -187,6 +341,7 @@ class ChunksRepository:
                         'content': row['content'],
                         'page_start': row['page_start'],
                         'page_end': row['page_end'],
+                        'token_count': row.get('token_count'),
                         'score': float(row['score'])
                     }
                     if return_embeddings and 'embedding' in row:
@@ -196,54 +351,32 @@ class ChunksRepository:
                 return formatted_results
             
             else:
-                # SQLite fallback with manual cosine similarity calculation
-                import json
-                
-                sql = "SELECT chunk_index, content, page_start, page_end, embedding FROM document_chunks WHERE document_id = ?"
-                rows = db.db_query_all(sql, [document_id])
-                
+                # SQLite fallback: exact cosine similarity over the document's cached
+                # embedding matrix (one matrix-vector product)
+                rows, matrix, norms = self._document_matrix(document_id)
                 if not rows:
                     return []
                 
-                # Calculate cosine similarities
-                query_vec_np = np.array(query_vec, dtype=np.float32)
-                results = []
+                query_vec_np = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+                if matrix.shape[1] != query_vec_np.shape[0]:
+                    logger.warning(
+                        f"Query dimension {query_vec_np.shape[0]} does not match chunk embeddings "
+                        f"({matrix.shape[1]}) for document {document_id}"
+                    )
+                    return []
                 
-                for row in rows:
-                    try:
-                        embedding_data = json.loads(row['embedding'])
-                        embedding_np = np.array(embedding_data, dtype=np.float32)
-                        
-                        # Ensure both vectors are 1D for dot product
-                        if embedding_np.ndim > 1:
-                            embedding_np = embedding_np.flatten()
-                        if query_vec_np.ndim > 1:
-                            query_vec_np = query_vec_np.flatten()
-                        
-                        # Cosine similarity
-                        similarity = np.dot(query_vec_np, embedding_np) / (
-                            np.linalg.norm(query_vec_np) * np.linalg.norm(embedding_np)
-                        )
-                        
-                        result_item = {
-                            'chunk_index': row['chunk_index'],
-                            'content': row['content'],
-                            'page_start': row['page_start'],
-                            'page_end': row['page_end'],
-                            'score': float(similarity)
-                        }
-                        
-                        if return_embeddings:
-                            result_item['embedding'] = embedding_data
-                        
-                        results.append(result_item)
-                    except Exception as e:
-                        logger.warning(f"Error processing chunk {row['chunk_index']}: {e}")
-                        continue
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    similarities = (matrix @ query_vec_np) / (norms * np.linalg.norm(query_vec_np))
                 
-                # Sort by similarity score (descending) and take top-k
-                results.sort(key=lambda x: x['score'], reverse=True)
-                return results[:candidate_k]
+                # Stable sort keeps DB order among equal scores; NaN (zero vectors) sorts last
+                order = np.argsort(-similarities, kind='stable')[:candidate_k]
+                results = []
+                for i in order:
+                    result_item = {**rows[i], 'score': float(similarities[i])}
+                    if return_embeddings:
+                        result_item['embedding'] = matrix[i]
+                    results.append(result_item)
+                return results
                 
         except Exception as e:
             logger.error(f"Error in topk_exact search for document {document_id}: {e}")
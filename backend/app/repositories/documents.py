@@ -4,6 +4,7 @@ from .. import db
 from .translations import TranslationRepository
 from ..config import settings
 from ..services.storage_service import get_storage_service
+from ..services.vector_index_service import vector_index_service
 
 
 class DocumentsRepository:
@@ -72,6 +73,7 @@ class DocumentsRepository:
             db.execute("DELETE FROM document_bodies WHERE doc_id = ?", (doc_id,))
             # Finally delete from the main documents table
             db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        vector_index_service.invalidate()
         
         # Delete the actual file from filesystem
         if doc:
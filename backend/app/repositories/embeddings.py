@@ -2,6 +2,7 @@ import numpy as np
 from typing import List, Tuple, Optional
 from .. import db
 from ..config import settings
+from ..services.vector_index_service import vector_index_service, pack_vector, unpack_vector
 
 
 class EmbeddingsRepository:
@@ -14,13 +15,14 @@ class EmbeddingsRepository:
                 (hash(doc_id) % (2**63), vec_bytes)  # hash to int for rowid
             )
         else:
-            # Fallback to BLOB storage
-            vec_bytes = embedding.astype(np.float32).tobytes()
+            # Fallback to BLOB storage, in the configured (possibly quantized) format
+            vec_bytes = pack_vector(embedding, settings.EMBED_STORE_DTYPE)
             db.execute(
                 "INSERT OR REPLACE INTO doc_embeddings (doc_id, dim, vec) VALUES (?, ?, ?)",
                 (doc_id, embedding.shape[0], vec_bytes)
             )
         db.CONN.commit()
+        vector_index_service.invalidate()
 
     def get_embedding(self, doc_id: str) -> Optional[np.ndarray]:
         if settings.SQLITE_VEC_ENABLE:
@@ -30,13 +32,14 @@ class EmbeddingsRepository:
             )
         else:
             result = db.query_one(
-                "SELECT vec FROM doc_embeddings WHERE doc_id = ?",
+                "SELECT dim, vec FROM doc_embeddings WHERE doc_id = ?",
                 (doc_id,)
             )
         
         if result:
-            vec_bytes = result['embedding'] if settings.SQLITE_VEC_ENABLE else result['vec']
-            return np.frombuffer(vec_bytes, dtype=np.float32)
+            if settings.SQLITE_VEC_ENABLE:
+                return np.frombuffer(result['embedding'], dtype=np.float32)
+            return unpack_vector(result['vec'], result['dim'])
         return None
 
     def similarity_search(self, query_embedding: np.ndarray, k: int = 10, doc_ids: List[str] = None) -> List[Tuple[str, float]]:
@@ -51,26 +54,8 @@ class EmbeddingsRepository:
             # For now, return empty results
             return []
         else:
-            # Python fallback: read all embeddings and compute cosine similarity
-            if doc_ids:
-                # Filter by specific doc_ids
-                placeholders = ",".join("?" * len(doc_ids))
-                embeddings_data = db.query_all(
-                    f"SELECT doc_id, vec FROM doc_embeddings WHERE doc_id IN ({placeholders})",
-                    doc_ids
-                )
-            else:
-                embeddings_data = db.query_all("SELECT doc_id, vec FROM doc_embeddings")
-
-            similarities = []
-            for row in embeddings_data:
-                doc_embedding = np.frombuffer(row['vec'], dtype=np.float32)
-                similarity = self._cosine_similarity(query_embedding, doc_embedding)
-                similarities.append((row['doc_id'], similarity))
-
-            # Sort by similarity (descending) and return top k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return similarities[:k]
+            # Fallback: in-memory ANN index built from doc_embeddings
+            return vector_index_service.search(query_embedding, k=k, doc_ids=doc_ids)
 
     def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
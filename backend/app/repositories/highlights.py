@@ -10,9 +10,13 @@ class HighlightsRepository:
         highlight_id = str(uuid.uuid4())
         print(f"Creating highlight with ID: {highlight_id}")
         print(f"Data: {doc_id, page_number, start_offset, end_offset, selected_text, color, note}")
+        # Millisecond timestamps, as in update(): the schema default datetime('now') has
+        # one-second precision, and get_version's (COUNT, MAX(updated_at)) would not change
+        # when a highlight is deleted and another created within the same second
         with db.transaction():
             db.execute(
-                "INSERT INTO highlights (id, doc_id, page_number, start_offset, end_offset, selected_text, color, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                "INSERT INTO highlights (id, doc_id, page_number, start_offset, end_offset, selected_text, color, note, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'), strftime('%Y-%m-%d %H:%M:%f', 'now'))",
                 (highlight_id, doc_id, page_number, start_offset, end_offset, selected_text, color, note)
             )
         return highlight_id
@@ -38,17 +42,31 @@ class HighlightsRepository:
             (doc_id, page_number)
         )
 
+    def get_version(self, doc_id: str, page_number: Optional[int] = None) -> tuple:
+        """Cheap change marker for a document's (or page's) highlights, used for ETags"""
+        if page_number is None:
+            row = db.query_one(
+                "SELECT COUNT(*) AS n, MAX(updated_at) AS ts FROM highlights WHERE doc_id = ?",
+                (doc_id,)
+            )
+        else:
+            row = db.query_one(
+                "SELECT COUNT(*) AS n, MAX(updated_at) AS ts FROM highlights WHERE doc_id = ? AND page_number = ?",
+                (doc_id, page_number)
+            )
+        return (row['n'], row['ts']) if row else (0, None)
+
     def update(self, highlight_id: str, color: Optional[str] = None, note: Optional[str] = None):
         """Update highlight color and/or note"""
         with db.transaction():
             if color is not None:
                 db.execute(
-                    "UPDATE highlights SET color = ?, updated_at = datetime('now') WHERE id = ?",
+                    "UPDATE highlights SET color = ?, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = ?",
                     (color, highlight_id)
                 )
             if note is not None:
                 db.execute(
-                    "UPDATE highlights SET note = ?, updated_at = datetime('now') WHERE id = ?",
+                    "UPDATE highlights SET note = ?, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = ?",
                     (note, highlight_id)
             )
 
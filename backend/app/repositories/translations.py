@@ -71,6 +71,23 @@ class TranslationRepository:
         ).fetchall()
         return [dict(row) for row in results]
 
+    def get_document_translations_version(self, doc_id: str) -> tuple:
+        """Cheap change marker for a document's translations, used for ETags."""
+        result = self.db.execute(
+            "SELECT COUNT(*) AS n, MAX(updated_at) AS ts FROM translations WHERE doc_id = ?",
+            (doc_id,),
+        ).fetchone()
+        return (result["n"], result["ts"]) if result else (0, None)
+
+    def get_document_translation_version(
+        self, doc_id: str, target_language: str
+    ) -> Optional[str]:
+        result = self.db.execute(
+            "SELECT updated_at AS v FROM translations WHERE doc_id = ? AND target_language = ?",
+            (doc_id, target_language),
+        ).fetchone()
+        return result["v"] if result else None
+
     def get_document_translation_by_language(
         self, doc_id: str, target_language: str
     ) -> Optional[dict]:
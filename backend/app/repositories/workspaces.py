@@ -1,7 +1,19 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from .. import db
 
 
+def make_cursor(row: dict) -> str:
+    """Keyset cursor pointing just past a row in (created_at, id) descending order."""
+    return f"{row['created_at']}|{row['id']}"
+
+
+def _parse_cursor(cursor: str) -> Tuple[str, str]:
+    created_at, sep, row_id = cursor.rpartition("|")
+    if not sep or not row_id:
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+
 class WorkspacesRepository:
     def create(self, workspace_id: str, name: Optional[str] = None) -> str:
         db.execute(
@@ -14,13 +26,29 @@ class WorkspacesRepository:
     def get(self, workspace_id: str) -> Optional[dict]:
         return db.query_one("SELECT * FROM workspaces WHERE id = ?", (workspace_id,))
 
-    def list(self, limit: int = 100, offset: int = 0) -> List[dict]:
+    def list(self, limit: int = 100, offset: int = 0, cursor: Optional[str] = None) -> List[dict]:
+        """List workspaces newest first.
+
+        With a cursor (see make_cursor) the page starts after that row using the
+        (created_at, id) index instead of skipping `offset` rows.
+        """
+        if cursor:
+            return db.query_all(
+                """
+                SELECT * FROM workspaces
+                WHERE (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+                """,
+                (*_parse_cursor(cursor), limit)
+            )
         return db.query_all(
-            "SELECT * FROM workspaces ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            "SELECT * FROM workspaces ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
             (limit, offset)
         )
 
-    def delete(self, workspace_id: str):
+    def delete(self, workspace_id: str) -> bool:
+        """Delete a workspace and its documents. Returns False if the workspace did not exist."""
         # First get all documents in this workspace
         docs = self.list_documents(workspace_id)
         
@@ -36,12 +64,47 @@ class WorkspacesRepository:
                     print(f"Warning: Failed to delete document {doc['id']}: {e}")
         
         # Finally delete the workspace (ON DELETE CASCADE will remove workspace_documents entries)
-        db.execute("DELETE FROM workspaces WHERE id = ?", (workspace_id,))
+        cur = db.execute("DELETE FROM workspaces WHERE id = ?", (workspace_id,))
         db.CONN.commit()
+        return cur.rowcount > 0
 
-    def update_name(self, workspace_id: str, name: str):
-        db.execute("UPDATE workspaces SET name = ? WHERE id = ?", (name, workspace_id))
+    def update_name(self, workspace_id: str, name: str) -> bool:
+        """Rename a workspace. Returns False if it does not exist."""
+        cur = db.execute("UPDATE workspaces SET name = ? WHERE id = ?", (name, workspace_id))
+        db.CONN.commit()
+        return cur.rowcount > 0
+
+    def add_document_checked(self, workspace_id: str, doc_id: str) -> Optional[str]:
+        """Link a document to a workspace in one statement when both exist.
+
+        Returns None on success (including an existing link), otherwise "workspace"
+        or "document" naming what is missing.
+        """
+        cur = db.execute(
+            """
+            INSERT OR IGNORE INTO workspace_documents (workspace_id, doc_id)
+            SELECT ?, ?
+            WHERE EXISTS (SELECT 1 FROM workspaces WHERE id = ?)
+              AND EXISTS (SELECT 1 FROM documents WHERE id = ?)
+            """,
+            (workspace_id, doc_id, workspace_id, doc_id)
+        )
         db.CONN.commit()
+        if cur.rowcount > 0:
+            return None
+        # Nothing inserted: already linked, or one side is missing
+        row = db.query_one(
+            """
+            SELECT EXISTS (SELECT 1 FROM workspaces WHERE id = ?) AS ws,
+                   EXISTS (SELECT 1 FROM documents WHERE id = ?) AS doc
+            """,
+            (workspace_id, doc_id)
+        )
+        if not row['ws']:
+            return "workspace"
+        if not row['doc']:
+            return "document"
+        return None
 
     def add_document(self, workspace_id: str, doc_id: str):
         db.execute(
@@ -50,12 +113,14 @@ class WorkspacesRepository:
         )
         db.CONN.commit()
 
-    def remove_document(self, workspace_id: str, doc_id: str):
-        db.execute(
+    def remove_document(self, workspace_id: str, doc_id: str) -> bool:
+        """Unlink a document. Returns False only if the workspace does not exist."""
+        cur = db.execute(
             "DELETE FROM workspace_documents WHERE workspace_id = ? AND doc_id = ?",
             (workspace_id, doc_id)
         )
         db.CONN.commit()
+        return cur.rowcount > 0 or self.get(workspace_id) is not None
 
     def list_documents(self, workspace_id: str, limit: int = 100, offset: int = 0) -> List[dict]:
         return db.query_all(
@@ -70,3 +135,41 @@ class WorkspacesRepository:
             """,
             (workspace_id, limit, offset)
         )
+
+    def list_documents_checked(self, workspace_id: str, limit: int = 100, offset: int = 0,
+                               cursor: Optional[str] = None) -> Optional[List[dict]]:
+        """Like list_documents, but returns None when the workspace does not exist.
+
+        The workspace row drives the join, so existence and the page of documents
+        come back in one query. A cursor (see make_cursor) pages by keyset on the
+        documents' (created_at, id) instead of by offset.
+        """
+        cursor_clause = ""
+        params: tuple = ()
+        if cursor:
+            cursor_clause = "AND (d.created_at, d.id) < (?, ?)"
+            params = _parse_cursor(cursor)
+            offset = 0
+        rows = db.query_all(
+            f"""
+            SELECT w.id AS _workspace_id, d.*, dm.color
+            FROM workspaces w
+            LEFT JOIN (workspace_documents wd
+                       JOIN documents d ON d.id = wd.doc_id {cursor_clause})
+              ON wd.workspace_id = w.id
+            LEFT JOIN document_meta dm ON dm.doc_id = d.id
+            WHERE w.id = ?
+            ORDER BY d.created_at DESC, d.id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (*params, workspace_id, limit, offset)
+        )
+        if not rows:
+            # Empty page: either no such workspace or offset past the end
+            return None if offset == 0 or self.get(workspace_id) is None else []
+        docs = []
+        for row in rows:
+            del row['_workspace_id']
+            if row['id'] is not None:
+                docs.append(row)
+        return docs
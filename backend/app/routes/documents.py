@@ -1,5 +1,6 @@
 import os
 import uuid
+import asyncio
 import shutil
 from pathlib import Path
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
@@ -10,7 +11,9 @@ from loguru import logger
 from ..services.doc_parse_service import DocParseService
 from ..repositories.documents import DocumentsRepository
 from ..repositories.tags import TagsRepository
+from ..db import run_db
 from ..providers import get_llm_provider
+from ..providers.genai_client import configure_genai
 import google.generativeai as genai
 from ..config import settings
 from ..services.storage_service import get_storage_service, SignedUpload
@@ -82,56 +85,135 @@ def _link_workspace(doc_id: str, workspace_id: Optional[str]) -> None:
         logger.warning(f"Failed to link document {doc_id} to workspace {workspace_id}: {exc}")
 
 
-@router.post("/documents/upload")
-async def upload_document(file: UploadFile = File(...), workspace_id: Optional[str] = Form(default=None)):
-    if settings.GCS_BUCKET:
-        raise HTTPException(status_code=400, detail="Direct upload disabled; use signed upload endpoint")
+def _set_document_color(doc_id: str, color: str) -> None:
+    from .. import db
+    db.execute(
+        "INSERT OR REPLACE INTO document_meta (doc_id, color) VALUES (?, ?)",
+        (doc_id, color)
+    )
+    db.CONN.commit()
 
-    try:
-        doc_id = str(uuid.uuid4())
-        storage_dir = Path("storage/doc_files").resolve()
-        storage_dir.mkdir(parents=True, exist_ok=True)
 
-        file_extension = Path(file.filename).suffix if file.filename else ""
-        stored_filename = f"{doc_id}{file_extension}"
-        file_path = storage_dir / stored_filename
+def _store_summary(doc_id: str, summary: str, outline: List[str]) -> None:
+    from .. import db
+    db.execute(
+        "INSERT OR REPLACE INTO summaries (doc_id, summary, outline) VALUES (?, ?, ?)",
+        (doc_id, summary, '\n'.join(outline))
+    )
+    db.CONN.commit()
 
-        content = await file.read()
-        file_size = len(content)
 
-        with open(file_path, "wb") as f:
-            f.write(content)
+def _document_exists(doc_id: str) -> bool:
+    from ..db import query_one
+    return query_one("SELECT id FROM documents WHERE id = ?", [doc_id]) is not None
+
+
+def _get_note(doc_id: str) -> Optional[dict]:
+    from ..db import query_one
+    return query_one(
+        "SELECT doc_id, content, created_at FROM notes WHERE doc_id = ?",
+        [doc_id]
+    )
+
+
+def _upsert_note(doc_id: str, content: str) -> Optional[dict]:
+    """Update the document's note, inserting it if missing, and return the stored row."""
+    from ..db import execute, transaction
+    with transaction():
+        cursor = execute(
+            "UPDATE notes SET content = ?, created_at = datetime('now') WHERE doc_id = ?",
+            [content, doc_id]
+        )
+        if cursor.rowcount == 0:
+            execute(
+                "INSERT INTO notes (doc_id, content) VALUES (?, ?)",
+                [doc_id, content]
+            )
+        return _get_note(doc_id)
+
+
+def _list_workspace_documents(workspace_id: str, limit: int, offset: int) -> Optional[list]:
+    from ..repositories.workspaces import WorkspacesRepository
+    wr = WorkspacesRepository()
+    if not wr.get(workspace_id):
+        return None
+    return wr.list_documents(workspace_id, limit=limit, offset=offset)
+
+
+async def _store_upload(filename: Optional[str], content_type: str, content: bytes,
+                        workspace_id: Optional[str]) -> dict:
+    doc_id = str(uuid.uuid4())
+    storage_dir = Path("storage/doc_files").resolve()
+    storage_dir.mkdir(parents=True, exist_ok=True)
+
+    file_extension = Path(filename).suffix if filename else ""
+    stored_filename = f"{doc_id}{file_extension}"
+    file_path = storage_dir / stored_filename
+    file_size = len(content)
+
+    try:
+        await asyncio.to_thread(file_path.write_bytes, content)
 
         try:
-            parsed = doc_parse_service.parse_document(str(file_path), file.content_type)
+            parsed = await doc_parse_service.parse_document_async(str(file_path), content_type)
         except Exception:
             parsed = {"text": "", "pages": [{"page": 1, "text": ""}], "page_count": 1}
 
-        title = file.filename or f"Document {doc_id[:8]}"
-        documents_repo.create(
+        title = filename or f"Document {doc_id[:8]}"
+        await run_db(
+            documents_repo.create,
             doc_id,
             title,
-            file.content_type,
+            content_type,
             parsed['text'],
             file_path=str(file_path),
             file_size=file_size,
-            original_filename=file.filename
+            original_filename=filename
         )
+    except Exception:
+        try:
+            file_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+        raise
+
+    await run_db(_link_workspace, doc_id, workspace_id)
+
+    logger.info(f"Document uploaded successfully: {filename} (ID: {doc_id}, Size: {file_size} bytes)")
+    return {"doc_id": doc_id, "filename": filename, "size": file_size}
 
-        _link_workspace(doc_id, workspace_id)
 
-        logger.info(f"Document uploaded successfully: {file.filename} (ID: {doc_id}, Size: {file_size} bytes)")
-        return {"doc_id": doc_id, "filename": file.filename, "size": file_size}
+@router.post("/documents/upload")
+async def upload_document(file: UploadFile = File(...), workspace_id: Optional[str] = Form(default=None)):
+    if settings.GCS_BUCKET:
+        raise HTTPException(status_code=400, detail="Direct upload disabled; use signed upload endpoint")
+
+    try:
+        content = await file.read()
+        return await _store_upload(file.filename, file.content_type, content, workspace_id)
     except Exception as e:
         logger.error(f"Upload failed: {e}")
-        try:
-            if 'file_path' in locals() and file_path.exists():
-                file_path.unlink(missing_ok=True)
-        except Exception:
-            pass
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/documents/upload-batch")
+async def upload_documents_batch(files: List[UploadFile] = File(...), workspace_id: Optional[str] = Form(default=None)):
+    """Upload several files in one request; a failing file does not abort the others."""
+    if settings.GCS_BUCKET:
+        raise HTTPException(status_code=400, detail="Direct upload disabled; use signed upload endpoint")
+
+    contents = await asyncio.gather(*(file.read() for file in files))
+
+    documents = []
+    for file, content in zip(files, contents):
+        try:
+            documents.append(await _store_upload(file.filename, file.content_type, content, workspace_id))
+        except Exception as e:
+            logger.error(f"Upload failed for {file.filename}: {e}")
+            documents.append({"doc_id": None, "filename": file.filename, "error": str(e)})
+    return {"documents": documents}
+
+
 @router.post("/documents/signed-upload", response_model=SignedUploadResponse)
 async def create_signed_upload(req: SignedUploadRequest):
     if not settings.GCS_BUCKET:
@@ -171,13 +253,14 @@ async def complete_signed_upload(req: CompleteUploadRequest):
 
     try:
         try:
-            parsed = doc_parse_service.parse_document(temp_path, req.content_type)
+            parsed = await doc_parse_service.parse_document_async(temp_path, req.content_type)
         except Exception:
             parsed = {"text": "", "pages": [{"page": 1, "text": ""}], "page_count": 1}
 
         title = req.original_filename or f"Document {req.doc_id[:8]}"
         gcs_path = f"gs://{settings.GCS_BUCKET}/{object_name}"
-        documents_repo.create(
+        await run_db(
+            documents_repo.create,
             req.doc_id,
             title,
             req.content_type,
@@ -187,7 +270,7 @@ async def complete_signed_upload(req: CompleteUploadRequest):
             original_filename=req.original_filename,
         )
 
-        _link_workspace(req.doc_id, req.workspace_id)
+        await run_db(_link_workspace, req.doc_id, req.workspace_id)
 
         logger.info("Completed signed upload for %s", req.doc_id)
         return {"doc_id": req.doc_id, "filename": req.original_filename, "size": req.size}
@@ -224,7 +307,8 @@ async def create_note(req: CreateNoteRequest):
       body = req.content or ""
 
       # Store document with markdown mime
-      documents_repo.create(
+      await run_db(
+          documents_repo.create,
           doc_id,
           title,
           "text/markdown",
@@ -235,24 +319,12 @@ async def create_note(req: CreateNoteRequest):
       )
 
       # Optionally link to workspace
-      if req.workspace_id:
-          try:
-              from ..repositories.workspaces import WorkspacesRepository
-              wr = WorkspacesRepository()
-              if wr.get(req.workspace_id):
-                  wr.add_document(req.workspace_id, doc_id)
-          except Exception as e:
-              logger.warning(f"Failed to link note to workspace: {e}")
+      await run_db(_link_workspace, doc_id, req.workspace_id)
 
       # Optionally store color metadata
       if req.color:
           try:
-              from .. import db
-              db.execute(
-                  "INSERT OR REPLACE INTO document_meta (doc_id, color) VALUES (?, ?)",
-                  (doc_id, req.color)
-              )
-              db.CONN.commit()
+              await run_db(_set_document_color, doc_id, req.color)
           except Exception as e:
               logger.warning(f"Failed to set note color: {e}")
 
@@ -264,7 +336,7 @@ async def create_note(req: CreateNoteRequest):
 
 @router.get("/documents/{doc_id}", response_model=DocumentResponse)
 async def get_document(doc_id: str):
-    doc = documents_repo.get(doc_id)
+    doc = await run_db(documents_repo.get, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     return DocumentResponse(**doc)
@@ -274,7 +346,7 @@ async def get_document(doc_id: str):
 async def delete_document(doc_id: str):
     try:
         # Get document info first
-        doc = documents_repo.get(doc_id)
+        doc = await run_db(documents_repo.get, doc_id)
         
         # Track what we've successfully deleted
         document_file_deleted = False
@@ -319,7 +391,7 @@ async def delete_document(doc_id: str):
         # Delete from database if document exists
         if doc:
             try:
-                documents_repo.delete(doc_id)
+                await run_db(documents_repo.delete, doc_id)
                 database_record_deleted = True
                 return {"message": "Document deleted successfully"}
             except Exception as e:
@@ -352,14 +424,14 @@ async def delete_document(doc_id: str):
 async def list_documents(limit: int = 100, offset: int = 0, workspace_id: Optional[str] = None):
     try:
         if workspace_id:
-            from ..repositories.workspaces import WorkspacesRepository
-            wr = WorkspacesRepository()
-            if not wr.get(workspace_id):
+            docs = await run_db(_list_workspace_documents, workspace_id, limit, offset)
+            if docs is None:
                 raise HTTPException(status_code=404, detail="Workspace not found")
-            docs = wr.list_documents(workspace_id, limit=limit, offset=offset)
         else:
-            docs = documents_repo.list(limit=limit, offset=offset)
+            docs = await run_db(documents_repo.list, limit=limit, offset=offset)
         return {"documents": docs}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -368,7 +440,7 @@ async def list_documents(limit: int = 100, offset: int = 0, workspace_id: Option
 async def download_document(doc_id: str):
     try:
         # Get document info
-        doc = documents_repo.get(doc_id)
+        doc = await run_db(documents_repo.get, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
         
@@ -402,7 +474,7 @@ async def download_document(doc_id: str):
 
 @router.post("/documents/{doc_id}/summarize", response_model=SummaryResponse)
 async def summarize_document(doc_id: str):
-    doc = documents_repo.get(doc_id)
+    doc = await run_db(documents_repo.get, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -413,12 +485,7 @@ async def summarize_document(doc_id: str):
         outline = [line.strip() for line in summary.split('.') if line.strip()]
         
         # Store summary
-        from .. import db
-        db.execute(
-            "INSERT OR REPLACE INTO summaries (doc_id, summary, outline) VALUES (?, ?, ?)",
-            (doc_id, summary, '\n'.join(outline))
-        )
-        db.CONN.commit()
+        await run_db(_store_summary, doc_id, summary, outline)
         
         return SummaryResponse(summary=summary, outline=outline)
     except Exception as e:
@@ -427,7 +494,7 @@ async def summarize_document(doc_id: str):
 
 @router.post("/documents/{doc_id}/classify", response_model=ClassifyResponse)
 async def classify_document(doc_id: str):
-    doc = documents_repo.get(doc_id)
+    doc = await run_db(documents_repo.get, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -442,7 +509,7 @@ async def classify_document(doc_id: str):
         tags = [tag for tag in tags if len(tag) > 1]  # Filter out single chars
         
         # Store tags
-        tags_repo.add_to_document(doc_id, tags)
+        await run_db(tags_repo.add_to_document, doc_id, tags)
         
         return ClassifyResponse(tags=tags)
     except Exception as e:
@@ -461,9 +528,6 @@ class SaveNoteToFileRequest(BaseModel):
 async def save_note_to_file(doc_id: str, request: SaveNoteToFileRequest):
     """Save document note to a markdown file in note_files directory"""
     try:
-        from .. import db
-        import os
-        
         # Create note_files directory if it doesn't exist
         note_files_dir = Path("storage/note_files").resolve()
         note_files_dir.mkdir(parents=True, exist_ok=True)
@@ -485,7 +549,7 @@ async def save_note_to_file(doc_id: str, request: SaveNoteToFileRequest):
 @router.post("/documents/{doc_id}/upload-to-gemini", response_model=GeminiUploadResponse)
 async def upload_document_to_gemini(doc_id: str, request: GeminiSummaryRequest):
     """Upload document to Google Gemini for processing"""
-    doc = documents_repo.get(doc_id)
+    doc = await run_db(documents_repo.get, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -498,7 +562,7 @@ async def upload_document_to_gemini(doc_id: str, request: GeminiSummaryRequest):
             )
         
         # Configure Gemini
-        genai.configure(api_key=settings.GEMINI_API_KEY)
+        configure_genai(settings.GEMINI_API_KEY)
         
         # Get document file path
         storage_dir = Path("storage/doc_files").resolve()
@@ -577,11 +641,7 @@ class NoteRequest(BaseModel):
 async def get_document_note(doc_id: str):
     """Get the note for a document"""
     try:
-        from ..db import query_one
-        note = query_one(
-            "SELECT doc_id, content, created_at FROM notes WHERE doc_id = ?",
-            [doc_id]
-        )
+        note = await run_db(_get_note, doc_id)
         if not note:
             # Return empty note if none exists
             return {"doc_id": doc_id, "content": "", "created_at": ""}
@@ -596,38 +656,15 @@ async def create_document_note(doc_id: str, request: NoteRequest):
     """Create a new note for a document"""
     logger.info(f"Creating note for document {doc_id} with content: {request.content[:50]}...")
     try:
-        from ..db import execute, query_one, transaction, CONN
-        
         # Check if document exists
         logger.info(f"Checking if document {doc_id} exists")
-        doc = query_one("SELECT id FROM documents WHERE id = ?", [doc_id])
-        if not doc:
+        if not await run_db(_document_exists, doc_id):
             logger.error(f"Document {doc_id} not found")
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Insert or update note
         logger.info(f"Inserting or updating note for document {doc_id}")
-        with transaction():
-            # Try to update first
-            cursor = execute(
-                "UPDATE notes SET content = ?, created_at = datetime('now') WHERE doc_id = ?",
-                [request.content, doc_id]
-            )
-            
-            # If no rows were affected, insert a new note
-            if cursor.rowcount == 0:
-                cursor = execute(
-                    "INSERT INTO notes (doc_id, content) VALUES (?, ?)",
-                    [doc_id, request.content]
-                )
-            
-            logger.info(f"Note {'updated' if cursor.rowcount > 0 else 'inserted'} for document {doc_id}")
-            
-            # Fetch the note
-            note = query_one(
-                "SELECT doc_id, content, created_at FROM notes WHERE doc_id = ?",
-                [doc_id]
-            )
+        note = await run_db(_upsert_note, doc_id, request.content)
         
         if not note:
             logger.error(f"Failed to retrieve note for document {doc_id}")
@@ -649,31 +686,12 @@ async def create_document_note(doc_id: str, request: NoteRequest):
 async def update_document_note(doc_id: str, request: NoteRequest):
     """Update the note for a document"""
     try:
-        from ..db import execute, query_one
-        
         # Check if document exists
-        doc = query_one("SELECT id FROM documents WHERE id = ?", [doc_id])
-        if not doc:
+        if not await run_db(_document_exists, doc_id):
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Update or insert note
-        cursor = execute(
-            "UPDATE notes SET content = ?, created_at = datetime('now') WHERE doc_id = ?",
-            [request.content, doc_id]
-        )
-        
-        # If no rows were affected, insert a new note
-        if cursor.rowcount == 0:
-            cursor = execute(
-                "INSERT INTO notes (doc_id, content) VALUES (?, ?)",
-                [doc_id, request.content]
-            )
-        
-        # Get updated note
-        updated_note = query_one(
-            "SELECT doc_id, content, created_at FROM notes WHERE doc_id = ?",
-            [doc_id]
-        )
+        updated_note = await run_db(_upsert_note, doc_id, request.content)
         
         if not updated_note:
             raise HTTPException(status_code=500, detail="Failed to retrieve updated note")
@@ -692,15 +710,14 @@ async def update_document_note(doc_id: str, request: NoteRequest):
 async def delete_document_note(doc_id: str):
     """Delete the note for a document"""
     try:
-        from ..db import execute, query_one
+        from ..db import execute
         
         # Check if document exists
-        doc = query_one("SELECT id FROM documents WHERE id = ?", [doc_id])
-        if not doc:
+        if not await run_db(_document_exists, doc_id):
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Delete note
-        execute("DELETE FROM notes WHERE doc_id = ?", [doc_id])
+        await run_db(execute, "DELETE FROM notes WHERE doc_id = ?", [doc_id])
         
         logger.info(f"Deleted note for document {doc_id}")
         return {"message": "Note deleted successfully"}
@@ -716,12 +733,12 @@ class DocumentUpdateRequest(BaseModel):
 
 @router.patch("/documents/{doc_id}")
 async def update_document(doc_id: str, req: DocumentUpdateRequest):
-    doc = documents_repo.get(doc_id)
+    doc = await run_db(documents_repo.get, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     try:
         if req.title is not None:
-            documents_repo.update(doc_id, title=req.title)
+            await run_db(documents_repo.update, doc_id, title=req.title)
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,40 @@
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Header, Response
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a weak ETag from a cheap version key (e.g. row count + MAX(updated_at))."""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def if_none_match(if_none_match: Optional[str] = Header(default=None)) -> Optional[str]:
+    """Dependency exposing the request's If-None-Match header."""
+    return if_none_match
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    if "*" in tags:
+        return True
+    # Weak comparison (RFC 9110): ignore the W/ prefix on both sides
+    opaque = etag.removeprefix("W/")
+    return any(tag.removeprefix("W/") == opaque for tag in tags)
+
+
+def not_modified(header: Optional[str], etag: str, response: Response) -> Optional[Response]:
+    """Return a 304 response if the client already has this version.
+
+    Otherwise attach the ETag to `response` and return None so the handler
+    builds the body as usual. `no-cache` makes clients revalidate every time
+    instead of serving a possibly stale copy.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(header, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from loguru import logger
 from ..services.explain_service import ExplainService
@@ -29,6 +29,31 @@ class HighlightResponse(BaseModel):
     highlight: str
     metadata: Optional[Dict[str, Any]] = None
 
+# Upper bound on texts per batch request (also keeps the cache IN (...) query small)
+MAX_BATCH_TEXTS = 50
+
+class BatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_TEXTS)
+    context: Optional[ExplainContext] = None
+
+class BatchItem(BaseModel):
+    explanation: Optional[str] = None
+    highlight: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+
+def _batch_response(results: List[Any]) -> BatchResponse:
+    items = []
+    for result in results:
+        if isinstance(result, Exception):
+            items.append(BatchItem(error=str(result)))
+        else:
+            items.append(BatchItem(**result))
+    return BatchResponse(results=items)
+
 @router.post("/explain", response_model=ExplainResponse)
 async def explain_text(request: ExplainRequest):
     """
@@ -77,6 +102,40 @@ async def highlight_text(request: HighlightRequest):
         logger.error("Highlight failed with error: {}", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/explain/batch", response_model=BatchResponse, response_model_exclude_none=True)
+async def explain_texts(request: BatchRequest):
+    """
+    Explain several selections in one request.
+    LLM calls run concurrently; each result carries either an explanation or an error.
+    """
+    logger.info("Batch explain request received: {} texts", len(request.texts))
+    try:
+        results = await explain_service.explain_texts(
+            texts=request.texts,
+            context=request.context.dict() if request.context else None
+        )
+        return _batch_response(results)
+    except Exception as e:
+        logger.error("Batch explanation failed with error: {}", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/highlight/batch", response_model=BatchResponse, response_model_exclude_none=True)
+async def highlight_texts(request: BatchRequest):
+    """
+    Highlight several selections in one request.
+    LLM calls run concurrently; each result carries either a highlight or an error.
+    """
+    logger.info("Batch highlight request received: {} texts", len(request.texts))
+    try:
+        results = await explain_service.highlight_texts(
+            texts=request.texts,
+            context=request.context.dict() if request.context else None
+        )
+        return _batch_response(results)
+    except Exception as e:
+        logger.error("Batch highlight failed with error: {}", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/models")
 async def get_available_models():
     """
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from loguru import logger
 from ..repositories.highlights import HighlightsRepository
+from ..db import run_db
+from .etag import make_etag, if_none_match, not_modified
 
-router = APIRouter(tags=["highlights"])
+router = APIRouter(tags=["highlights"], default_response_class=ORJSONResponse)
 highlights_repo = HighlightsRepository()
 
 
@@ -42,7 +45,8 @@ async def create_highlight(request: CreateHighlightRequest):
     try:
         logger.info(f"Creating highlight with request: {request.dict()}")
         
-        highlight_id = highlights_repo.create(
+        highlight_id = await run_db(
+            highlights_repo.create,
             doc_id=request.doc_id,
             page_number=request.page_number,
             start_offset=request.start_offset,
@@ -54,7 +58,7 @@ async def create_highlight(request: CreateHighlightRequest):
         
         logger.info(f"Highlight created with ID: {highlight_id}")
         
-        highlight = highlights_repo.get(highlight_id)
+        highlight = await run_db(highlights_repo.get, highlight_id)
         if not highlight:
             raise HTTPException(status_code=500, detail="Failed to create highlight")
         
@@ -69,7 +73,7 @@ async def create_highlight(request: CreateHighlightRequest):
 @router.get("/highlights/{highlight_id}", response_model=HighlightResponse)
 async def get_highlight(highlight_id: str):
     """Get a specific highlight by ID"""
-    highlight = highlights_repo.get(highlight_id)
+    highlight = await run_db(highlights_repo.get, highlight_id)
     if not highlight:
         raise HTTPException(status_code=404, detail="Highlight not found")
     
@@ -77,35 +81,49 @@ async def get_highlight(highlight_id: str):
 
 
 @router.get("/documents/{doc_id}/highlights", response_model=List[HighlightResponse])
-async def get_document_highlights(doc_id: str):
+async def get_document_highlights(doc_id: str, response: Response,
+                                  etag_header: Optional[str] = Depends(if_none_match)):
     """Get all highlights for a specific document"""
-    highlights = highlights_repo.get_by_document(doc_id)
-    return [HighlightResponse(**highlight) for highlight in highlights]
+    etag = make_etag(doc_id, await run_db(highlights_repo.get_version, doc_id))
+    cached = not_modified(etag_header, etag, response)
+    if cached:
+        return cached
+
+    highlights = await run_db(highlights_repo.get_by_document, doc_id)
+    # Rows already match HighlightResponse; skip per-row model validation
+    return ORJSONResponse(highlights, headers=response.headers)
 
 
 @router.get("/documents/{doc_id}/highlights/page/{page_number}", response_model=List[HighlightResponse])
-async def get_page_highlights(doc_id: str, page_number: int):
+async def get_page_highlights(doc_id: str, page_number: int, response: Response,
+                              etag_header: Optional[str] = Depends(if_none_match)):
     """Get all highlights for a specific page of a document"""
-    highlights = highlights_repo.get_by_page(doc_id, page_number)
-    return [HighlightResponse(**highlight) for highlight in highlights]
+    etag = make_etag(doc_id, page_number, await run_db(highlights_repo.get_version, doc_id, page_number))
+    cached = not_modified(etag_header, etag, response)
+    if cached:
+        return cached
+
+    highlights = await run_db(highlights_repo.get_by_page, doc_id, page_number)
+    return ORJSONResponse(highlights, headers=response.headers)
 
 
 @router.put("/highlights/{highlight_id}", response_model=HighlightResponse)
 async def update_highlight(highlight_id: str, request: UpdateHighlightRequest):
     """Update a highlight's color and/or note"""
     # Check if highlight exists
-    existing_highlight = highlights_repo.get(highlight_id)
+    existing_highlight = await run_db(highlights_repo.get, highlight_id)
     if not existing_highlight:
         raise HTTPException(status_code=404, detail="Highlight not found")
     
     try:
-        highlights_repo.update(
+        await run_db(
+            highlights_repo.update,
             highlight_id=highlight_id,
             color=request.color,
             note=request.note
         )
         
-        updated_highlight = highlights_repo.get(highlight_id)
+        updated_highlight = await run_db(highlights_repo.get, highlight_id)
         logger.info(f"Highlight updated: {highlight_id}")
         return HighlightResponse(**updated_highlight)
     
@@ -118,12 +136,12 @@ async def update_highlight(highlight_id: str, request: UpdateHighlightRequest):
 async def delete_highlight(highlight_id: str):
     """Delete a highlight"""
     # Check if highlight exists
-    existing_highlight = highlights_repo.get(highlight_id)
+    existing_highlight = await run_db(highlights_repo.get, highlight_id)
     if not existing_highlight:
         raise HTTPException(status_code=404, detail="Highlight not found")
     
     try:
-        highlights_repo.delete(highlight_id)
+        await run_db(highlights_repo.delete, highlight_id)
         logger.info(f"Highlight deleted: {highlight_id}")
         return {"message": "Highlight deleted successfully"}
     
@@ -136,7 +154,7 @@ async def delete_highlight(highlight_id: str):
 async def delete_document_highlights(doc_id: str):
     """Delete all highlights for a document"""
     try:
-        highlights_repo.delete_by_document(doc_id)
+        await run_db(highlights_repo.delete_by_document, doc_id)
         logger.info(f"All highlights deleted for document: {doc_id}")
         return {"message": "All highlights deleted successfully"}
     
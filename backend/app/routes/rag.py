@@ -1,14 +1,27 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import heapq
+import time
+from operator import itemgetter
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from loguru import logger
 
 from ..services.rag_service import rag_service
+from ..services.rag_embedding_service import rag_embedding_service
 from ..config import settings
 from ..repositories.documents import DocumentsRepository
+from ..db import run_db
+from .etag import make_etag, if_none_match, not_modified
+from .sse import sse_response
 
 router = APIRouter(tags=["rag"])
 
+# rag_service.answer always sets similarity_score on its citations
+_similarity_score = itemgetter('similarity_score')
+
 
 class RAGQueryRequest(BaseModel):
     query: str
@@ -40,11 +53,37 @@ class RAGIndexResponse(BaseModel):
     error: Optional[str] = None
 
 
+async def _ensure_indexed(document_id: str) -> None:
+    """Index the document if needed; raise 202/400 when it cannot be queried yet."""
+    index_result = await asyncio.to_thread(rag_service.ensure_index, document_id)
+    
+    if index_result['status'] == 'indexing_in_progress':
+        logger.info(f"Document {document_id} is being indexed by another process")
+        raise HTTPException(
+            status_code=202,
+            detail="Document is being indexed. Please try again in a few moments.",
+            headers={"Retry-After": "3"}  # Suggest retry after 3 seconds
+        )
+    
+    if index_result['status'] in ['error', 'no_content', 'no_text_content', 'no_chunks_generated']:
+        error_msg = {
+            'error': 'Document indexing failed',
+            'no_content': 'Document has no content to index',
+            'no_text_content': 'Document has no readable text content',
+            'no_chunks_generated': 'Failed to generate chunks from document content'
+        }.get(index_result['status'], 'Document indexing failed')
+        
+        logger.error(f"Document {document_id} indexing failed: {index_result['status']}")
+        raise HTTPException(
+            status_code=400,
+            detail=error_msg
+        )
+
+
 async def query_workspace_rag(query: str) -> RAGQueryResponse:
     """
     Query all documents in the workspace using RAG.
     """
-    import time
     start_time = time.time()
     
     try:
@@ -52,7 +91,7 @@ async def query_workspace_rag(query: str) -> RAGQueryResponse:
         documents_repo = DocumentsRepository()
         
         # Get all documents in the workspace
-        all_documents = documents_repo.list(limit=1000)
+        all_documents = await run_db(documents_repo.list, limit=1000)
         
         if not all_documents:
             return RAGQueryResponse(
@@ -63,23 +102,22 @@ async def query_workspace_rag(query: str) -> RAGQueryResponse:
                 contexts_used=0
             )
         
-        # Collect results from all indexed documents
+        # Only run the full pipeline on the indexed documents whose centroid is closest to the query
+        query_embedding = await rag_embedding_service.embed_query(query)
+        documents_by_id = {doc['id']: doc for doc in all_documents}
+        candidate_ids = await run_db(rag_service.rank_documents, query_embedding, list(documents_by_id))
+        
+        # Collect results from the candidate documents
         all_citations = []
         best_answer = ""
         best_score = 0
         total_contexts = 0
         
-        for doc in all_documents:
+        for doc_id in candidate_ids:
+            doc = documents_by_id[doc_id]
             try:
-                # Check if document is indexed
-                from ..repositories.chunks import ChunksRepository
-                chunks_repo = ChunksRepository()
-                
-                if not chunks_repo.exists(doc['id']):
-                    continue
-                
                 # Query this document
-                result = await rag_service.answer(query, doc['id'])
+                result = await rag_service.answer(query, doc['id'], query_embedding=query_embedding)
                 
                 if result and not result.get('fallback', True):
                     # Add document title to citations
@@ -93,7 +131,9 @@ async def query_workspace_rag(query: str) -> RAGQueryResponse:
                     
                     # Use the answer from the document with highest average similarity
                     if doc_citations:
-                        avg_score = sum(c.get('similarity_score', 0) for c in doc_citations) / len(doc_citations)
+                        scores = np.fromiter(map(_similarity_score, doc_citations), dtype=np.float32,
+                                             count=len(doc_citations))
+                        avg_score = float(scores.mean())
                         if avg_score > best_score:
                             best_score = avg_score
                             best_answer = result['answer']
@@ -102,11 +142,8 @@ async def query_workspace_rag(query: str) -> RAGQueryResponse:
                 logger.warning(f"Failed to query document {doc['id']}: {str(e)}")
                 continue
         
-        # Sort citations by similarity score
-        all_citations.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-        
-        # Limit to top citations to avoid overwhelming response
-        top_citations = all_citations[:10]
+        # Keep the top citations by similarity score to avoid overwhelming response
+        top_citations = heapq.nlargest(10, all_citations, key=_similarity_score)
         
         if not best_answer:
             best_answer = "I couldn't find relevant information in the indexed documents to answer your question."
@@ -165,29 +202,7 @@ async def query_rag(request: RAGQueryRequest):
             )
         
         # Check if document needs indexing first
-        index_result = rag_service.ensure_index(request.document_id)
-        
-        if index_result['status'] == 'indexing_in_progress':
-            logger.info(f"Document {request.document_id} is being indexed by another process")
-            raise HTTPException(
-                status_code=202,
-                detail="Document is being indexed. Please try again in a few moments.",
-                headers={"Retry-After": "3"}  # Suggest retry after 3 seconds
-            )
-        
-        if index_result['status'] in ['error', 'no_content', 'no_text_content', 'no_chunks_generated']:
-            error_msg = {
-                'error': 'Document indexing failed',
-                'no_content': 'Document has no content to index',
-                'no_text_content': 'Document has no readable text content',
-                'no_chunks_generated': 'Failed to generate chunks from document content'
-            }.get(index_result['status'], 'Document indexing failed')
-            
-            logger.error(f"Document {request.document_id} indexing failed: {index_result['status']}")
-            raise HTTPException(
-                status_code=400,
-                detail=error_msg
-            )
+        await _ensure_indexed(request.document_id)
         
         # Perform RAG query
         result = await rag_service.answer(request.query, request.document_id)
@@ -228,6 +243,28 @@ async def query_rag(request: RAGQueryRequest):
         )
 
 
+@router.post("/rag/query/stream")
+async def query_rag_stream(request: RAGQueryRequest):
+    """
+    Stream a RAG answer for a document as Server-Sent Events.
+    
+    Emits `token` events ({"text": ...}) while the answer is generated, then a
+    `done` event with citations and timing, or an `error` event.
+    
+    Returns:
+    - 200: text/event-stream
+    - 202: Document is being indexed, retry later
+    - 400: Invalid request
+    """
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if not request.document_id or not request.document_id.strip():
+        raise HTTPException(status_code=400, detail="Streaming requires a document ID")
+    
+    await _ensure_indexed(request.document_id)
+    return sse_response(rag_service.answer_stream(request.query, request.document_id))
+
+
 @router.post("/rag/index", response_model=RAGIndexResponse)
 async def index_document(document_id: str):
     """
@@ -249,7 +286,7 @@ async def index_document(document_id: str):
                 detail="Document ID cannot be empty"
             )
         
-        result = rag_service.ensure_index(document_id)
+        result = await asyncio.to_thread(rag_service.ensure_index, document_id)
         
         if result['status'] == 'indexing_in_progress':
             logger.info(f"Document {document_id} is being indexed by another process")
@@ -298,12 +335,14 @@ async def index_document(document_id: str):
 
 
 @router.get("/rag/status/{document_id}")
-async def get_rag_status(document_id: str):
+async def get_rag_status(document_id: str, response: Response,
+                         etag_header: Optional[str] = Depends(if_none_match)):
     """
     Get the RAG indexing status for a document.
     
     Returns:
     - 200: Status information
+    - 304: Status unchanged since the client's If-None-Match
     - 400: Invalid document ID
     - 500: Internal server error
     """
@@ -314,19 +353,16 @@ async def get_rag_status(document_id: str):
                 detail="Document ID cannot be empty"
             )
         
-        # Check if document is indexed
+        # The chunk count is the whole status, so it doubles as the ETag version
         from ..repositories.chunks import ChunksRepository
         chunks_repo = ChunksRepository()
         
-        is_indexed = chunks_repo.exists(document_id)
+        chunk_count = await run_db(chunks_repo.count_by_document, document_id)
+        cached = not_modified(etag_header, make_etag(document_id, chunk_count), response)
+        if cached:
+            return cached
         
-        if is_indexed:
-            # Get chunk count using count_by_document instead of topk_exact with zero vector
-            try:
-                chunk_count = chunks_repo.count_by_document(document_id)
-            except Exception:
-                chunk_count = 0
-            
+        if chunk_count > 0:
             return {
                 "document_id": document_id,
                 "indexed": True,
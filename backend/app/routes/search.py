@@ -1,12 +1,14 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from ..repositories.documents import DocumentsRepository
 from ..repositories.tags import TagsRepository
 from ..repositories.embeddings import EmbeddingsRepository
 from ..providers import get_embedding_provider
+from ..db import run_db
 
-router = APIRouter(tags=["search"])
+router = APIRouter(tags=["search"], default_response_class=ORJSONResponse)
 documents_repo = DocumentsRepository()
 tags_repo = TagsRepository()
 embeddings_repo = EmbeddingsRepository()
@@ -35,11 +37,11 @@ class VectorSearchRequest(BaseModel):
 async def text_search(request: TextSearchRequest):
     try:
         # Get FTS results
-        results = documents_repo.search_fts(request.q)
+        results = await run_db(documents_repo.search_fts, request.q)
         
         # Filter by tags if specified
         if request.tags:
-            tag_filtered_ids = tags_repo.search_by_tags(request.tags, request.match)
+            tag_filtered_ids = await run_db(tags_repo.search_by_tags, request.tags, request.match)
             results = [r for r in results if r['id'] in tag_filtered_ids]
         
         # Format response
@@ -66,11 +68,12 @@ async def vector_search(request: VectorSearchRequest):
         # Get candidate doc_ids if tags specified
         candidate_ids = None
         if request.tags:
-            candidate_ids = tags_repo.search_by_tags(request.tags, "OR")
+            candidate_ids = await run_db(tags_repo.search_by_tags, request.tags, "OR")
         
         # Perform similarity search
-        similarities = embeddings_repo.similarity_search(
-            query_embedding[0], 
+        similarities = await run_db(
+            embeddings_repo.similarity_search,
+            query_embedding[0],
             k=request.k, 
             doc_ids=candidate_ids
         )
@@ -78,7 +81,7 @@ async def vector_search(request: VectorSearchRequest):
         # Get document details
         results = []
         for doc_id, score in similarities:
-            doc = documents_repo.get(doc_id)
+            doc = await run_db(documents_repo.get, doc_id)
             if doc:
                 results.append(SearchResult(
                     doc_id=doc_id,
@@ -5,6 +5,7 @@ from loguru import logger
 from pydantic import BaseModel
 
 from ..services.chat_service import ChatService
+from .sse import sse_response
 
 router = APIRouter(tags=["simulate"])
 chat_service = ChatService()
@@ -59,3 +60,21 @@ async def simulate(req: SimulateRequest):
             source=fallback.source,
             metadata=fallback.metadata,
         )
+
+
+@router.post("/simulate/stream")
+async def simulate_stream(req: SimulateRequest):
+    """Stream the chat answer as Server-Sent Events (`token` events, then `done`)."""
+    message = (req.message or "").strip()
+    if not message:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    return sse_response(chat_service.stream(
+        question=message,
+        context=req.context,
+        metadata={
+            "client_source": req.source,
+            "workspace_id": req.workspace_id,
+            "document_id": req.document_id,
+        },
+    ))
@@ -0,0 +1,23 @@
+import json
+from typing import Any, AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def sse_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Stream {'event': ..., 'data': ...} items to the client as text/event-stream."""
+    async def body():
+        async for item in events:
+            yield format_sse(item['event'], item['data'])
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so each event is flushed as soon as it is produced
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from ..repositories.tags import TagsRepository
+from ..db import run_db
 
-router = APIRouter(tags=["tags"])
+router = APIRouter(tags=["tags"], default_response_class=ORJSONResponse)
 tags_repo = TagsRepository()
 
 
@@ -20,8 +22,8 @@ class DocumentTagsRequest(BaseModel):
 @router.get("/tags", response_model=List[TagInfo])
 async def list_tags():
     try:
-        tags = tags_repo.list_all()
-        return [TagInfo(name=tag['name'], count=tag['count']) for tag in tags]
+        tags = await run_db(tags_repo.list_all)
+        return ORJSONResponse([{"name": tag['name'], "count": tag['count']} for tag in tags])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -30,13 +32,13 @@ async def list_tags():
 async def manage_document_tags(doc_id: str, request: DocumentTagsRequest):
     try:
         if request.add:
-            tags_repo.add_to_document(doc_id, request.add)
+            await run_db(tags_repo.add_to_document, doc_id, request.add)
         
         if request.remove:
-            tags_repo.remove_from_document(doc_id, request.remove)
+            await run_db(tags_repo.remove_from_document, doc_id, request.remove)
         
         # Return current tags
-        current_tags = tags_repo.get_document_tags(doc_id)
+        current_tags = await run_db(tags_repo.get_document_tags, doc_id)
         return {"tags": current_tags}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,17 +1,25 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from loguru import logger
 from ..services.translate_service import TranslateService
+from .etag import make_etag, if_none_match, not_modified
+from .sse import sse_response
+from ..db import run_db
 import httpx
 
-router = APIRouter(tags=["translate"])
+router = APIRouter(tags=["translate"], default_response_class=ORJSONResponse)
 translate_service = TranslateService()
 
 class TranslationRequest(BaseModel):
     text: str
     target_langs: List[str]
 
+class TranslationStreamRequest(BaseModel):
+    text: str
+    target_lang: str
+
 class TranslationResponse(BaseModel):
     text: str
     source: str
@@ -28,10 +36,7 @@ async def translate_text(request: TranslationRequest):
                 request.text[:50] + "..." if len(request.text) > 50 else request.text, 
                 request.target_langs)
     try:
-        translations = {}
-        for lang in request.target_langs:
-            translation_result = await translate_service._translate_text(request.text, lang)
-            translations[lang] = translation_result
+        translations = await translate_service.translate_languages(request.text, request.target_langs)
         logger.info("Translation completed successfully: {}", translations)
         return {"translations": translations}
     except httpx.ConnectError as e:
@@ -42,6 +47,13 @@ async def translate_text(request: TranslationRequest):
         logger.error("Translation failed with error: {}", str(e))
         raise HTTPException(status_code=500, detail="Translation service error. Please try again later.")
 
+@router.post("/translate/stream")
+async def translate_text_stream(request: TranslationStreamRequest):
+    """
+    Stream a translation as Server-Sent Events (`token` events, then `done`).
+    """
+    return sse_response(translate_service.translate_stream(request.text, request.target_lang))
+
 @router.post("/documents/{doc_id}/translate/{target_lang}")
 async def translate_document(doc_id: str, target_lang: str):
     """
@@ -62,27 +74,42 @@ async def translate_document(doc_id: str, target_lang: str):
         raise HTTPException(status_code=500, detail="Document translation service error. Please try again later.")
 
 @router.get("/documents/{doc_id}/translations")
-def get_document_translations(doc_id: str) -> List[dict]:
+async def get_document_translations(doc_id: str, response: Response,
+                                    etag_header: Optional[str] = Depends(if_none_match)) -> List[dict]:
     """
     Get all available translations for a document.
     """
     try:
-        translations = translate_service.translation_repo.get_document_translations(doc_id)
+        repo = translate_service.translation_repo
+        version = await run_db(repo.get_document_translations_version, doc_id)
+        cached = not_modified(etag_header, make_etag(doc_id, version), response)
+        if cached:
+            return cached
+        translations = await run_db(repo.get_document_translations, doc_id)
         return translations
     except Exception as e:
         logger.error(f"Error getting translations for document {doc_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/documents/{doc_id}/translations/{target_lang}")
-def get_document_translation(doc_id: str, target_lang: str):
+async def get_document_translation(doc_id: str, target_lang: str, response: Response,
+                                   etag_header: Optional[str] = Depends(if_none_match)):
     """
     Get a specific translation for a document.
     """
     try:
-        translation = translate_service.translation_repo.get_document_translation_by_language(doc_id, target_lang)
+        repo = translate_service.translation_repo
+        version = await run_db(repo.get_document_translation_version, doc_id, target_lang)
+        if version is not None:
+            cached = not_modified(etag_header, make_etag(doc_id, target_lang, version), response)
+            if cached:
+                return cached
+        translation = await run_db(repo.get_document_translation_by_language, doc_id, target_lang)
         if translation is None:
             raise HTTPException(status_code=404, detail="Translation not found")
         return translation
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting translation for document {doc_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
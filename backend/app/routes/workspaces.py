@@ -1,13 +1,15 @@
 import uuid
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import Optional
-from ..repositories.workspaces import WorkspacesRepository
-from ..repositories.documents import DocumentsRepository
+from ..repositories.workspaces import WorkspacesRepository, make_cursor
+from ..db import run_db
 
 router = APIRouter(tags=["workspaces"])
 workspaces_repo = WorkspacesRepository()
-documents_repo = DocumentsRepository()
+
+# Upper bound for the page size of the list endpoints
+MAX_PAGE_SIZE = 500
 
 
 class WorkspaceCreateRequest(BaseModel):
@@ -17,7 +19,7 @@ class WorkspaceCreateRequest(BaseModel):
 @router.post("/workspaces")
 async def create_workspace(req: WorkspaceCreateRequest):
     ws_id = str(uuid.uuid4())
-    workspaces_repo.create(ws_id, req.name)
+    await run_db(workspaces_repo.create, ws_id, req.name)
     return {"workspace_id": ws_id, "name": req.name}
 
 
@@ -27,49 +29,61 @@ class WorkspaceUpdateRequest(BaseModel):
 
 @router.patch("/workspaces/{workspace_id}")
 async def update_workspace(workspace_id: str, req: WorkspaceUpdateRequest):
-    ws = workspaces_repo.get(workspace_id)
-    if not ws:
-        raise HTTPException(status_code=404, detail="Workspace not found")
     if req.name is not None:
-        workspaces_repo.update_name(workspace_id, req.name)
+        found = await run_db(workspaces_repo.update_name, workspace_id, req.name)
+    else:
+        found = await run_db(workspaces_repo.get, workspace_id) is not None
+    if not found:
+        raise HTTPException(status_code=404, detail="Workspace not found")
     return {"ok": True}
 
 
+def _next_cursor(items: list, limit: int) -> Optional[str]:
+    return make_cursor(items[-1]) if len(items) == limit else None
+
+
 @router.get("/workspaces")
-async def list_workspaces(limit: int = 100, offset: int = 0):
-    items = workspaces_repo.list(limit=limit, offset=offset)
-    return {"workspaces": items}
+async def list_workspaces(limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+                          cursor: Optional[str] = None):
+    try:
+        items = await run_db(workspaces_repo.list, limit=limit, offset=offset, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"workspaces": items, "next_cursor": _next_cursor(items, limit)}
 
 
 @router.delete("/workspaces/{workspace_id}")
 async def delete_workspace(workspace_id: str):
-    if not workspaces_repo.get(workspace_id):
+    if not await run_db(workspaces_repo.delete, workspace_id):
         raise HTTPException(status_code=404, detail="Workspace not found")
-    workspaces_repo.delete(workspace_id)
     return {"deleted": True}
 
 
 @router.get("/workspaces/{workspace_id}/documents")
-async def list_workspace_documents(workspace_id: str, limit: int = 100, offset: int = 0):
-    if not workspaces_repo.get(workspace_id):
+async def list_workspace_documents(workspace_id: str, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                                   offset: int = Query(0, ge=0), cursor: Optional[str] = None):
+    try:
+        docs = await run_db(workspaces_repo.list_documents_checked, workspace_id,
+                            limit=limit, offset=offset, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if docs is None:
         raise HTTPException(status_code=404, detail="Workspace not found")
-    docs = workspaces_repo.list_documents(workspace_id, limit=limit, offset=offset)
-    return {"documents": docs}
+    return {"documents": docs, "next_cursor": _next_cursor(docs, limit)}
 
 
 @router.post("/workspaces/{workspace_id}/documents/{doc_id}")
 async def add_document_to_workspace(workspace_id: str, doc_id: str):
-    if not workspaces_repo.get(workspace_id):
+    missing = await run_db(workspaces_repo.add_document_checked, workspace_id, doc_id)
+    if missing == "workspace":
         raise HTTPException(status_code=404, detail="Workspace not found")
-    if not documents_repo.get(doc_id):
+    if missing == "document":
         raise HTTPException(status_code=404, detail="Document not found")
-    workspaces_repo.add_document(workspace_id, doc_id)
     return {"ok": True}
 
 
 @router.delete("/workspaces/{workspace_id}/documents/{doc_id}")
 async def remove_document_from_workspace(workspace_id: str, doc_id: str):
-    if not workspaces_repo.get(workspace_id):
+    if not await run_db(workspaces_repo.remove_document, workspace_id, doc_id):
         raise HTTPException(status_code=404, detail="Workspace not found")
-    workspaces_repo.remove_document(workspace_id, doc_id)
     return {"ok": True}
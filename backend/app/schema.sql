@@ -10,6 +10,8 @@ CREATE TABLE IF NOT EXISTS documents (
   updated_at TEXT DEFAULT (datetime('now'))
 );
 
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at);
+
 -- Workspaces and association (workspace is a higher-level container for documents)
 CREATE TABLE IF NOT EXISTS workspaces (
   id TEXT PRIMARY KEY,
@@ -17,6 +19,8 @@ CREATE TABLE IF NOT EXISTS workspaces (
   created_at TEXT DEFAULT (datetime('now'))
 );
 
+CREATE INDEX IF NOT EXISTS idx_workspaces_created_at ON workspaces(created_at, id);
+
 -- Association table linking documents to a workspace
 -- Using a separate table avoids altering existing documents schema
 CREATE TABLE IF NOT EXISTS workspace_documents (
@@ -68,6 +72,9 @@ CREATE TABLE IF NOT EXISTS document_tags (
   PRIMARY KEY (doc_id, tag_id)
 );
 
+-- Reverse lookup for tag searches (the primary key only serves doc_id-first lookups); tags(name) is indexed by UNIQUE
+CREATE INDEX IF NOT EXISTS idx_document_tags_tag ON document_tags(tag_id, doc_id);
+
 CREATE TABLE IF NOT EXISTS summaries (
   doc_id TEXT PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
   summary TEXT,
@@ -94,8 +101,10 @@ CREATE TABLE IF NOT EXISTS highlights (
   updated_at TEXT DEFAULT (datetime('now'))
 );
 
-CREATE INDEX IF NOT EXISTS idx_highlights_doc_id ON highlights(doc_id);
-CREATE INDEX IF NOT EXISTS idx_highlights_page ON highlights(doc_id, page_number);
+-- (doc_id, page_number, start_offset) serves the per-document and per-page lookups including their ORDER BY
+DROP INDEX IF EXISTS idx_highlights_doc_id;
+DROP INDEX IF EXISTS idx_highlights_page;
+CREATE INDEX IF NOT EXISTS idx_highlights_doc_page_offset ON highlights(doc_id, page_number, start_offset);
 
 -- Fallback embeddings table (when sqlite-vec disabled)
 CREATE TABLE IF NOT EXISTS doc_embeddings (
@@ -139,8 +148,26 @@ CREATE TABLE IF NOT EXISTS document_chunks (
   page_start INTEGER,
   page_end INTEGER,
   embedding BLOB,
+  token_count INTEGER,
+  embedding_dim INTEGER, -- set for packed (float32/float16/int8) embeddings; NULL for legacy JSON
   created_at TEXT DEFAULT (datetime('now'))
 );
 
-CREATE INDEX IF NOT EXISTS idx_document_chunks_doc_id ON document_chunks(document_id);
-CREATE INDEX IF NOT EXISTS idx_document_chunks_doc_chunk ON document_chunks(document_id, chunk_index);
+-- The unique (document_id, chunk_index) index that bulk_upsert's INSERT OR REPLACE relies on
+-- is created by main.bootstrap, which first removes duplicates left by the old non-unique index
+
+-- Per-document centroid of chunk embeddings (float32 bytes), used to pick candidate documents for workspace RAG
+CREATE TABLE IF NOT EXISTS doc_centroids (
+  document_id TEXT PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
+  dim INT,
+  vec BLOB
+);
+
+-- Chunk embeddings keyed by a hash of embedding model and text, so re-indexing skips repeated texts.
+-- vec is written by pack_vector in the RAG_EMBED_CACHE_DTYPE format (default int8: a float32 scale
+-- followed by one signed byte per dimension; float16 or float32 otherwise); decode with unpack_vector(vec, dim)
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  cache_key TEXT PRIMARY KEY,
+  dim INT,
+  vec BLOB
+);
@@ -16,6 +16,8 @@ CREATE TABLE IF NOT EXISTS documents (
   updated_at TIMESTAMPTZ DEFAULT now()
 );
 
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at);
+
 -- Workspaces and association
 CREATE TABLE IF NOT EXISTS workspaces (
   id TEXT PRIMARY KEY,
@@ -23,6 +25,8 @@ CREATE TABLE IF NOT EXISTS workspaces (
   created_at TIMESTAMPTZ DEFAULT now()
 );
 
+CREATE INDEX IF NOT EXISTS idx_workspaces_created_at ON workspaces(created_at, id);
+
 -- Association table linking documents to a workspace
 CREATE TABLE IF NOT EXISTS workspace_documents (
   workspace_id TEXT REFERENCES workspaces(id) ON DELETE CASCADE,
@@ -47,14 +51,32 @@ CREATE TABLE IF NOT EXISTS document_chunks (
   page_start INT,
   page_end INT,
   embedding vector(3072) NOT NULL,
+  token_count INT,
   created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
+-- Prompt-token count of each chunk, computed at ingest (older tables lack the column)
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS token_count INT;
+
 -- Indexes for document_chunks
 CREATE UNIQUE INDEX IF NOT EXISTS ux_doc_chunks ON document_chunks(document_id, chunk_index);
 CREATE INDEX IF NOT EXISTS idx_doc_chunks_doc ON document_chunks(document_id);
 -- Note: For MVP, we use exact search. Later add: CREATE INDEX ON document_chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
 
+-- Per-document centroid of chunk embeddings (float32 bytes), used to pick candidate documents for workspace RAG
+CREATE TABLE IF NOT EXISTS doc_centroids (
+  document_id TEXT PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
+  dim INT,
+  vec BYTEA
+);
+
+-- Chunk embeddings keyed by a hash of embedding model and text (float32 bytes), so re-indexing skips repeated texts
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  cache_key TEXT PRIMARY KEY,
+  dim INT,
+  vec BYTEA
+);
+
 -- Tags
 CREATE TABLE IF NOT EXISTS tags (
   id SERIAL PRIMARY KEY,
@@ -67,6 +89,9 @@ CREATE TABLE IF NOT EXISTS document_tags (
   PRIMARY KEY (doc_id, tag_id)
 );
 
+-- Reverse lookup for tag searches (the primary key only serves doc_id-first lookups); tags(name) is indexed by UNIQUE
+CREATE INDEX IF NOT EXISTS idx_document_tags_tag ON document_tags(tag_id, doc_id);
+
 CREATE TABLE IF NOT EXISTS summaries (
   doc_id TEXT PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
   summary TEXT,
@@ -93,8 +118,10 @@ CREATE TABLE IF NOT EXISTS highlights (
   updated_at TIMESTAMPTZ DEFAULT now()
 );
 
-CREATE INDEX IF NOT EXISTS idx_highlights_doc_id ON highlights(doc_id);
-CREATE INDEX IF NOT EXISTS idx_highlights_page ON highlights(doc_id, page_number);
+-- (doc_id, page_number, start_offset) serves the per-document and per-page lookups including their ORDER BY
+DROP INDEX IF EXISTS idx_highlights_doc_id;
+DROP INDEX IF EXISTS idx_highlights_page;
+CREATE INDEX IF NOT EXISTS idx_highlights_doc_page_offset ON highlights(doc_id, page_number, start_offset);
 
 -- Embeddings table (for non-chunk embeddings)
 CREATE TABLE IF NOT EXISTS doc_embeddings (
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Optional, Dict, Any
 
 from loguru import logger
 
@@ -100,3 +100,43 @@ class ChatService:
             )
         except Exception as exc:  # pragma: no cover - defensive guard
             return self._fallback(question, context, error=exc)
+
+    async def stream(self, question: str, context: Optional[str] = None,
+                     metadata: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Like ask(), but yields 'token' events as the provider generates text and a final
+        'done' event with source/metadata. Fallback answers are emitted as a single token."""
+        question = (question or "").strip()
+        if not question:
+            raise ValueError("Question cannot be empty")
+
+        prompt = self._build_prompt(question, context)
+        fallback: Optional[ChatResult] = None
+
+        if not self.llm:
+            logger.warning("No LLM provider configured; using fallback")
+            fallback = self._fallback(question, context)
+        else:
+            streamed = False
+            try:
+                async for text in self.llm.stream(prompt):
+                    streamed = True
+                    yield {"event": "token", "data": {"text": text}}
+                yield {"event": "done", "data": {
+                    "source": self._provider_name(),
+                    "metadata": {
+                        "provider": self._provider_name(),
+                        "fallback": False,
+                        "context_present": bool(context),
+                        "extra": metadata or {},
+                    },
+                }}
+                return
+            except Exception as exc:  # pragma: no cover - defensive guard
+                if streamed:
+                    logger.error("Chat stream failed mid-answer: {}", exc)
+                    yield {"event": "error", "data": {"error": str(exc)}}
+                    return
+                fallback = self._fallback(question, context, error=exc)
+
+        yield {"event": "token", "data": {"text": fallback.answer}}
+        yield {"event": "done", "data": {"source": fallback.source, "metadata": fallback.metadata}}
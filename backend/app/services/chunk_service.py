@@ -1,10 +1,24 @@
 import re
-from typing import List, Dict, Any
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from loguru import logger
 
 from ..config import settings
 
 
+# Sentence terminators (Latin and CJK) plus the whitespace after them
+_SENTENCE_END = re.compile(r'[.!?。！？]+\s*')
+
+# CJK ideographs, extension A, hiragana and katakana
+_CJK_CHAR = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\u3040-\u309f\u30a0-\u30ff]')
+
+
+def _has_cjk(text: str) -> bool:
+    # ASCII-only text (most English pages) is answered without scanning for CJK
+    return not text.isascii() and _CJK_CHAR.search(text) is not None
+
+
 class ChunkService:
     """Service for chunking document text into manageable pieces for RAG."""
     
@@ -13,18 +27,21 @@ class ChunkService:
         self.max_tokens = settings.RAG_BLOCK_MAX_TOKENS  # 800 (hard limit)
         self.overlap_tokens = settings.RAG_BLOCK_OVERLAP_TOKENS  # 80
     
-    def estimate_tokens(self, text: str) -> int:
+    def estimate_tokens(self, text: str, has_cjk: Optional[bool] = None) -> int:
         """Estimate token count for text.
         
         For CJK languages: tokens ≈ characters × 1.25 / 4
         For English: tokens ≈ words × 1.3
+        
+        Pass has_cjk when it is already known (e.g. False for a page without any
+        CJK) to skip detection.
         """
         if not text:
             return 0
         
         # Check if text contains CJK characters
-        cjk_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\u3040-\u309f\u30a0-\u30ff]')
-        has_cjk = bool(cjk_pattern.search(text))
+        if has_cjk is None:
+            has_cjk = _has_cjk(text)
         
         if has_cjk:
             # CJK token estimation
@@ -39,104 +56,87 @@ class ChunkService:
         if not text:
             return []
         
-        # Enhanced sentence splitting pattern
-        # Handles periods, exclamation marks, question marks, and CJK punctuation
-        sentence_pattern = re.compile(
-            r'([.!?。！？]+)\s*',
-            re.MULTILINE | re.DOTALL
-        )
-        
-        sentences = sentence_pattern.split(text)
-        
-        # Reconstruct sentences with their punctuation
+        # Each sentence runs up to and including its terminating punctuation
         result = []
-        for i in range(0, len(sentences) - 1, 2):
-            sentence = sentences[i]
-            if i + 1 < len(sentences):
-                punctuation = sentences[i + 1]
-                sentence += punctuation
-            
-            sentence = sentence.strip()
+        prev = 0
+        for match in _SENTENCE_END.finditer(text):
+            sentence = text[prev:match.end()].strip()
             if sentence:
                 result.append(sentence)
+            prev = match.end()
         
         # Handle the last part if it doesn't end with punctuation
-        if len(sentences) % 2 == 1 and sentences[-1].strip():
-            result.append(sentences[-1].strip())
+        tail = text[prev:].strip()
+        if tail:
+            result.append(tail)
         
         return result
     
-    def create_chunk(self, sentences: List[str], start_idx: int, target_tokens: int) -> tuple[str, int]:
+    def prefix_tokens(self, sentences: List[str], has_cjk: Optional[bool] = None) -> List[int]:
+        """Cumulative token counts: prefix[i] is the total for sentences[:i]."""
+        counts = (self.estimate_tokens(sentence, has_cjk) for sentence in sentences)
+        return list(accumulate(counts, initial=0))
+    
+    def create_chunk(self, sentences: List[str], start_idx: int, target_tokens: int,
+                     prefix: Optional[List[int]] = None) -> tuple[str, int]:
         """Create a chunk from sentences starting at start_idx.
         
+        Args:
+            sentences: Sentences of the page being chunked
+            start_idx: Index of the first sentence in the chunk
+            target_tokens: Soft token budget for the chunk
+            prefix: Optional result of prefix_tokens(sentences), to avoid recounting
+        
         Returns:
             tuple: (chunk_text, end_idx)
         """
         if start_idx >= len(sentences):
             return "", start_idx
         
-        chunk_text = ""
-        current_tokens = 0
-        end_idx = start_idx
-        
-        for i in range(start_idx, len(sentences)):
-            sentence = sentences[i]
-            sentence_tokens = self.estimate_tokens(sentence)
-            
-            # Check if adding this sentence would exceed limits
-            if current_tokens + sentence_tokens > target_tokens and chunk_text:
-                break
-            
-            # Hard limit check
-            if sentence_tokens > self.max_tokens:
-                # Split long sentence
-                words = sentence.split()
-                if words:
-                    # Take as many words as possible within max_tokens
-                    partial_sentence = ""
-                    for word in words:
-                        test_sentence = partial_sentence + (" " if partial_sentence else "") + word
-                        if self.estimate_tokens(test_sentence) <= self.max_tokens:
-                            partial_sentence = test_sentence
-                        else:
-                            break
-                    
-                    if partial_sentence:
-                        if chunk_text:
-                            chunk_text += " " + partial_sentence
-                        else:
-                            chunk_text = partial_sentence
-                        current_tokens = self.estimate_tokens(chunk_text)
-                break
-            
-            # Add sentence to chunk
-            if chunk_text:
-                chunk_text += " " + sentence
+        if prefix is None:
+            prefix = self.prefix_tokens(sentences)
+        
+        first_tokens = prefix[start_idx + 1] - prefix[start_idx]
+        if first_tokens <= self.max_tokens:
+            # Largest end with prefix[end] - prefix[start_idx] <= target_tokens; the first
+            # sentence is always taken. Any later sentence over max_tokens is also over
+            # the target, so it can never be pulled into the chunk.
+            end_idx = bisect_right(prefix, prefix[start_idx] + target_tokens, start_idx + 1) - 1
+            end_idx = max(end_idx, start_idx + 1)
+            return " ".join(sentences[start_idx:end_idx]), end_idx
+        
+        # Hard limit: the sentence alone is over max_tokens, so split it and
+        # take as many words as possible. Track the character/word counts
+        # estimate_tokens would see for the growing prefix instead of
+        # re-estimating the joined string for every word.
+        taken_words = []
+        chars = -1  # no joining space before the first word
+        has_cjk = False
+        for word in sentences[start_idx].split():
+            chars += len(word) + 1
+            has_cjk = has_cjk or _has_cjk(word)
+            if has_cjk:
+                tokens = int(chars * 1.25 / 4)
             else:
-                chunk_text = sentence
-            
-            current_tokens += sentence_tokens
-            end_idx = i + 1
+                tokens = int((len(taken_words) + 1) * 1.3)
+            if tokens > self.max_tokens:
+                break
+            taken_words.append(word)
         
-        return chunk_text, end_idx
+        # end_idx stays at start_idx; make_chunks always advances by at least one
+        return " ".join(taken_words), start_idx
     
-    def calculate_overlap_start(self, sentences: List[str], end_idx: int, overlap_tokens: int) -> int:
+    def calculate_overlap_start(self, sentences: List[str], end_idx: int, overlap_tokens: int,
+                                prefix: Optional[List[int]] = None) -> int:
         """Calculate the starting index for the next chunk considering overlap."""
         if end_idx <= 0:
             return end_idx
         
-        # Work backwards from end_idx to find overlap start
-        current_tokens = 0
-        overlap_start = end_idx
-        
-        for i in range(end_idx - 1, -1, -1):
-            sentence_tokens = self.estimate_tokens(sentences[i])
-            if current_tokens + sentence_tokens > overlap_tokens:
-                break
-            current_tokens += sentence_tokens
-            overlap_start = i
+        if prefix is None:
+            prefix = self.prefix_tokens(sentences)
         
-        return overlap_start
+        # Earliest start whose sentences up to end_idx still fit in overlap_tokens
+        return bisect_left(prefix, prefix[end_idx] - overlap_tokens, 0, end_idx)
     
     def make_chunks(self, document_id: str, pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Create chunks from document pages.
@@ -148,12 +148,27 @@ class ChunkService:
         Returns:
             List of chunk dictionaries with keys: chunk_index, content, page_start, page_end
         """
-        if not pages:
-            return []
+        return list(self.iter_chunks(document_id, pages))
+    
+    def iter_chunks(self, document_id: str, pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield chunks from document pages one at a time.
+        
+        Same output as make_chunks, but lets callers embed and store chunks while
+        later pages are still being chunked instead of holding the whole list.
+        
+        Args:
+            document_id: The document ID
+            pages: Page dictionaries with keys: page_num, text
         
+        Yields:
+            Chunk dictionaries with keys: chunk_index, content, page_start, page_end
+        """
         try:
-            chunks = []
             chunk_index = 0
+            # Running statistics, logged once the last chunk has been produced
+            total_tokens = 0
+            max_tokens = 0
+            min_tokens = None
             
             for page in pages:
                 page_num = page.get('page_num', 1)
@@ -167,26 +182,40 @@ class ChunkService:
                 if not sentences:
                     continue
                 
+                # A page without CJK has none in any sentence either, so detection
+                # runs once here; otherwise each sentence is still checked on its own
+                sentence_cjk = None if _has_cjk(page_text) else False
+                
+                # Token counts are computed once per page and reused via prefix sums
+                prefix = self.prefix_tokens(sentences, sentence_cjk)
+                
                 # Create chunks from this page
                 sentence_idx = 0
                 
                 while sentence_idx < len(sentences):
                     chunk_text, next_idx = self.create_chunk(
-                        sentences, sentence_idx, self.target_tokens
+                        sentences, sentence_idx, self.target_tokens, prefix
                     )
                     
                     if not chunk_text:
                         break
                     
-                    # Create chunk record
-                    chunk = {
+                    # Whole-sentence chunks reuse the per-sentence counts; only a
+                    # split over-long sentence has to be measured again
+                    if next_idx > sentence_idx:
+                        chunk_tokens = prefix[next_idx] - prefix[sentence_idx]
+                    else:
+                        chunk_tokens = self.estimate_tokens(chunk_text, sentence_cjk)
+                    total_tokens += chunk_tokens
+                    max_tokens = max(max_tokens, chunk_tokens)
+                    min_tokens = chunk_tokens if min_tokens is None else min(min_tokens, chunk_tokens)
+                    
+                    yield {
                         'chunk_index': chunk_index,
                         'content': chunk_text,
                         'page_start': page_num,
                         'page_end': page_num  # Single page for now
                     }
-                    
-                    chunks.append(chunk)
                     chunk_index += 1
                     
                     # Calculate next starting position with overlap
@@ -194,26 +223,19 @@ class ChunkService:
                         break
                     
                     overlap_start = self.calculate_overlap_start(
-                        sentences, next_idx, self.overlap_tokens
+                        sentences, next_idx, self.overlap_tokens, prefix
                     )
                     sentence_idx = max(overlap_start, sentence_idx + 1)
             
-            logger.info(f"Created {len(chunks)} chunks for document {document_id}")
+            logger.info(f"Created {chunk_index} chunks for document {document_id}")
             
             # Log chunk statistics
-            if chunks:
-                token_counts = [self.estimate_tokens(chunk['content']) for chunk in chunks]
-                avg_tokens = sum(token_counts) / len(token_counts)
-                max_tokens = max(token_counts)
-                min_tokens = min(token_counts)
-                
+            if chunk_index:
                 logger.info(
-                    f"Chunk statistics - Avg: {avg_tokens:.1f}, "
+                    f"Chunk statistics - Avg: {total_tokens / chunk_index:.1f}, "
                     f"Max: {max_tokens}, Min: {min_tokens} tokens"
                 )
             
-            return chunks
-            
         except Exception as e:
             logger.error(f"Error creating chunks for document {document_id}: {e}")
             raise e
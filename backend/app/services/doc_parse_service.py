@@ -1,10 +1,57 @@
 import fitz  # PyMuPDF
+import asyncio
+import multiprocessing
 import os
-from typing import Dict, Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
 
+from ..config import settings
+from ..pdf_extract import extract_page as _extract_page, extract_page_range as _extract_page_range
+
+
+# PyMuPDF is not thread-safe, so large PDFs are split across processes that
+# each open the file themselves; the pool is created on first use
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+_PDF_POOL_LOCK = threading.Lock()
+# Serializes every PyMuPDF call made in this process, since uploads and indexing
+# parse on several threads: opening a PDF and reading its page count, sequential
+# extraction of small PDFs, and the sequential fallback after a pool failure. For
+# a large PDF it is released once the page count is known; the page ranges are
+# then extracted by the spawned worker processes, each with its own PyMuPDF, and
+# this thread only waits on their results
+_FITZ_LOCK = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            # Spawned, not forked: this server runs many threads (DB and embedding
+            # executors, PyMuPDF under _FITZ_LOCK), and a fork taken while one of them
+            # holds a lock leaves that lock held forever in the child
+            _PDF_POOL = ProcessPoolExecutor(
+                max_workers=settings.PDF_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _PDF_POOL
+
+
+def shutdown_pdf_pool() -> None:
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is not None:
+            _PDF_POOL.shutdown(wait=False, cancel_futures=True)
+            _PDF_POOL = None
+
+
 
 class DocParseService:
+    async def parse_document_async(self, file_path: str, mime_type: str) -> Dict:
+        """parse_document on a worker thread, keeping the event loop free."""
+        return await asyncio.to_thread(self.parse_document, file_path, mime_type)
+
     def parse_document(self, file_path: str, mime_type: str) -> Dict:
         try:
             if mime_type == "application/pdf":
@@ -25,24 +72,24 @@ class DocParseService:
 
     def _parse_pdf(self, file_path: str) -> Dict:
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            pages = []
-            page_count = len(doc)
+            with _FITZ_LOCK, fitz.open(file_path) as doc:
+                page_count = len(doc)
+                if (settings.PDF_PARSE_WORKERS > 1
+                        and page_count >= settings.PDF_PARSE_PARALLEL_MIN_PAGES):
+                    extracted = None
+                else:
+                    extracted = [_extract_page(doc.load_page(page_num)) for page_num in range(page_count)]
             
-            for page_num in range(page_count):
-                page = doc.load_page(page_num)
-                page_text = page.get_text()
-                text += page_text + "\n"
-                pages.append({
-                    "page": page_num + 1,
-                    "text": page_text
-                })
+            if extracted is None:
+                extracted = self._extract_pages_parallel(file_path, page_count)
             
-            doc.close()
+            pages = [
+                {"page": page_num + 1, "text": page_text, "blocks": blocks}
+                for page_num, (page_text, blocks) in enumerate(extracted)
+            ]
             
             return {
-                "text": text.strip(),
+                "text": "\n".join(page_text for page_text, _ in extracted).strip(),
                 "pages": pages,
                 "page_count": page_count
             }
@@ -55,6 +102,21 @@ class DocParseService:
                 "page_count": 1
             }
 
+    def _extract_pages_parallel(self, file_path: str, page_count: int) -> List[Tuple[str, List[tuple]]]:
+        """Extract pages with one contiguous page range per worker process."""
+        workers = min(settings.PDF_PARSE_WORKERS, page_count)
+        step = -(-page_count // workers)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        try:
+            pool = _get_pdf_pool()
+            futures = [pool.submit(_extract_page_range, file_path, start, stop) for start, stop in ranges]
+            return [page for future in futures for page in future.result()]
+        except Exception as e:
+            logger.warning(f"Parallel PDF extraction failed for {file_path}, falling back to sequential: {e}")
+            shutdown_pdf_pool()
+            with _FITZ_LOCK:
+                return _extract_page_range(file_path, 0, page_count)
+
     def _parse_text(self, file_path: str) -> Dict:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
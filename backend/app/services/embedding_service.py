@@ -1,11 +1,17 @@
-import numpy as np
+from bisect import bisect_right
+from itertools import accumulate
 from typing import List
+
+import numpy as np
 from loguru import logger
 from ..providers import get_embedding_provider
 from ..repositories.embeddings import EmbeddingsRepository
 
 
 class EmbeddingService:
+    # Chunks embedded per provider call when building a document embedding
+    BATCH_SIZE = 64
+
     def __init__(self):
         self.embedding_provider = get_embedding_provider()
         self.embeddings_repo = EmbeddingsRepository()
@@ -15,12 +21,24 @@ class EmbeddingService:
         try:
             # Split text into chunks if too long
             chunks = self._chunk_text(text, max_length=1000)
+            if not chunks:
+                logger.warning(f"No text to embed for document {doc_id}")
+                return False
             
-            # Generate embeddings for chunks
-            embeddings = await self.embedding_provider.embed_texts(chunks)
+            # Use mean of chunk embeddings as document embedding, accumulated one
+            # batch at a time so the full chunk matrix is never held in memory
+            total = None
+            for start in range(0, len(chunks), self.BATCH_SIZE):
+                batch = await self.embedding_provider.embed_texts(chunks[start:start + self.BATCH_SIZE])
+                batch_sum = np.asarray(batch, dtype=np.float32).sum(axis=0)
+                total = batch_sum if total is None else total + batch_sum
+            doc_embedding = total / len(chunks)
             
-            # Use mean of chunk embeddings as document embedding
-            doc_embedding = np.mean(embeddings, axis=0)
+            # Normalize before storing so reduced-precision formats keep the most
+            # significant bits; search is cosine, so the direction is all that matters
+            norm = np.linalg.norm(doc_embedding)
+            if norm > 0:
+                doc_embedding /= norm
             
             # Store embedding
             self.embeddings_repo.store_embedding(doc_id, doc_embedding)
@@ -35,26 +53,28 @@ class EmbeddingService:
     def _chunk_text(self, text: str, max_length: int = 1000) -> List[str]:
         """Split text into chunks of max_length"""
         words = text.split()
+        # offsets[i] is the length of the first i words, each counted with one separator
+        offsets = list(accumulate((len(word) + 1 for word in words), initial=0))
         chunks = []
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            if current_length + len(word) + 1 > max_length:
-                if current_chunk:
-                    chunks.append(" ".join(current_chunk))
-                    current_chunk = [word]
-                    current_length = len(word)
-                else:
-                    # Single word is too long, truncate it
-                    chunks.append(word[:max_length])
-                    current_chunk = []
-                    current_length = 0
-            else:
-                current_chunk.append(word)
-                current_length += len(word) + 1
+        start = 0
+        # A chunk opened after a truncated word (or at the start) counts its first
+        # separator; one opened by a word that overflowed the previous chunk does not
+        fresh = True
         
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+        while start < len(words):
+            first = words[start]
+            if fresh and len(first) + 1 > max_length:
+                # Single word is too long, truncate it
+                chunks.append(first[:max_length])
+                start += 1
+                continue
+            
+            # Furthest end whose words still fit after the first one
+            used = len(first) + (1 if fresh else 0)
+            end = bisect_right(offsets, offsets[start + 1] + max_length - used, start + 1) - 1
+            end = max(end, start + 1)
+            chunks.append(" ".join(words[start:end]))
+            start = end
+            fresh = False
         
         return chunks
@@ -1,6 +1,13 @@
-from typing import List, Dict, Optional, Any
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from loguru import logger
 from .. import db
+from ..config import settings
 from ..repositories.documents import DocumentsRepository as DocumentRepository
 
 # Handle optional LLM provider
@@ -11,7 +18,17 @@ except ImportError:
     LLM_AVAILABLE = False
 
 
+# Runs of whitespace are collapsed before hashing so reflowed selections share a cache entry
+_WHITESPACE = re.compile(r'\s+')
+
+
 class ExplainService:
+    _SELECT_SQL = "SELECT explanation, metadata FROM explanation_cache WHERE cache_key = ?"
+    _UPSERT_SQL = (
+        "INSERT OR REPLACE INTO explanation_cache (cache_key, explanation, explanation_type, metadata) "
+        "VALUES (?, ?, ?, ?)"
+    )
+
     def __init__(self):
         if LLM_AVAILABLE:
             try:
@@ -25,6 +42,10 @@ class ExplainService:
             logger.warning("LLM not available for explain service")
         
         self.document_repo = DocumentRepository()
+        # Hot cache entries in front of explanation_cache: cache_key -> (stored_at, entry)
+        self._mem: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._mem_max = settings.EXPLAIN_MEMORY_CACHE_SIZE
+        self._mem_ttl = settings.EXPLAIN_MEMORY_CACHE_TTL
         self._init_cache_table()
 
     def _init_cache_table(self):
@@ -56,54 +77,104 @@ class ExplainService:
         """
         Generate a cache key for explanation requests.
         """
-        import hashlib
-        
-        # Create a string representation of the request
-        cache_data = {
-            'text': text.strip(),
-            'type': explanation_type,
-            'context': context or {}
-        }
-        
-        # Create hash
-        cache_str = str(sorted(cache_data.items()))
-        return hashlib.md5(cache_str.encode()).hexdigest()
+        # Canonical JSON of the normalized request
+        payload = json.dumps(
+            {
+                't': _WHITESPACE.sub(' ', text).strip(),
+                'k': explanation_type,
+                'c': context or {}
+            },
+            sort_keys=True,
+            separators=(',', ':'),
+            ensure_ascii=False,
+            default=str
+        ).encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
 
-    def _get_cached_explanation(self, cache_key: str) -> Optional[Dict[str, Any]]:
+    async def _get_cached_explanation(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """
         Get cached explanation if available.
         """
+        hit = self._mem.get(cache_key)
+        if hit is not None:
+            if time.monotonic() - hit[0] < self._mem_ttl:
+                self._mem.move_to_end(cache_key)
+                return hit[1]
+            del self._mem[cache_key]
+        
         try:
-            result = db.execute(
-                "SELECT explanation, metadata FROM explanation_cache WHERE cache_key = ?",
-                (cache_key,)
-            ).fetchone()
-            
-            if result:
-                import json
-                return {
-                    'explanation': result[0],
-                    'metadata': json.loads(result[1]) if result[1] else {}
-                }
+            entry = await db.run_db(self._select_cached, cache_key)
+            if entry:
+                self._remember(cache_key, entry)
+                return entry
         except Exception as e:
             logger.error(f"Error getting cached explanation: {e}")
         
         return None
 
-    def _cache_explanation(self, cache_key: str, explanation: str, explanation_type: str, metadata: Optional[Dict] = None):
+    def _select_cached(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        result = db.CONN.execute(self._SELECT_SQL, (cache_key,)).fetchone()
+        if not result:
+            return None
+        return {
+            'explanation': result['explanation'],
+            'metadata': json.loads(result['metadata']) if result['metadata'] else {}
+        }
+
+    async def _cache_explanation(self, cache_key: str, explanation: str, explanation_type: str, metadata: Optional[Dict] = None):
         """
         Cache explanation result.
         """
+        self._remember(cache_key, {'explanation': explanation, 'metadata': metadata or {}})
         try:
-            import json
-            db.execute(
-                "INSERT OR REPLACE INTO explanation_cache (cache_key, explanation, explanation_type, metadata) VALUES (?, ?, ?, ?)",
-                (cache_key, explanation, explanation_type, json.dumps(metadata or {}))
+            await db.run_db(
+                self._store_cached,
+                [(cache_key, explanation, explanation_type, json.dumps(metadata or {}))]
             )
-            db.CONN.commit()
         except Exception as e:
             logger.error(f"Error caching explanation: {e}")
 
+    def _store_cached(self, rows: List[tuple]):
+        # The connection context manager commits (or rolls back) the whole batch
+        with db.CONN:
+            db.CONN.executemany(self._UPSERT_SQL, rows)
+
+    async def _prefetch_cached(self, cache_keys: List[str]):
+        """Load the given keys from explanation_cache into the LRU with one query."""
+        missing = [key for key in cache_keys if key not in self._mem]
+        if not missing:
+            return
+        try:
+            entries = await db.run_db(self._select_cached_many, missing)
+        except Exception as e:
+            logger.error(f"Error prefetching cached explanations: {e}")
+            return
+        for key, entry in entries.items():
+            self._remember(key, entry)
+
+    def _select_cached_many(self, cache_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = ",".join("?" * len(cache_keys))
+        rows = db.CONN.execute(
+            f"SELECT cache_key, explanation, metadata FROM explanation_cache WHERE cache_key IN ({placeholders})",
+            cache_keys
+        ).fetchall()
+        return {
+            row['cache_key']: {
+                'explanation': row['explanation'],
+                'metadata': json.loads(row['metadata']) if row['metadata'] else {}
+            }
+            for row in rows
+        }
+
+    def _remember(self, cache_key: str, entry: Dict[str, Any]):
+        """Put an entry in the in-memory LRU, evicting the least recently used."""
+        if self._mem_max <= 0:
+            return
+        self._mem[cache_key] = (time.monotonic(), entry)
+        self._mem.move_to_end(cache_key)
+        while len(self._mem) > self._mem_max:
+            self._mem.popitem(last=False)
+
     async def explain_text(self, text: str, context: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Explain the given text using AI.
@@ -113,7 +184,7 @@ class ExplainService:
         
         # Check cache first
         cache_key = self._generate_cache_key(text, "explain", context)
-        cached_result = self._get_cached_explanation(cache_key)
+        cached_result = await self._get_cached_explanation(cache_key)
         if cached_result:
             logger.info("Using cached explanation")
             return cached_result
@@ -156,7 +227,7 @@ Provide a comprehensive but accessible explanation:"""
             }
             
             # Cache the result
-            self._cache_explanation(cache_key, explanation, "explain", result['metadata'])
+            await self._cache_explanation(cache_key, explanation, "explain", result['metadata'])
             
             return result
             
@@ -173,7 +244,7 @@ Provide a comprehensive but accessible explanation:"""
         
         # Check cache first
         cache_key = self._generate_cache_key(text, "highlight", context)
-        cached_result = self._get_cached_explanation(cache_key)
+        cached_result = await self._get_cached_explanation(cache_key)
         if cached_result:
             logger.info("Using cached highlight")
             return {'highlight': cached_result['explanation'], 'metadata': cached_result['metadata']}
@@ -218,7 +289,7 @@ Provide clear, concise highlights:"""
             }
             
             # Cache the result
-            self._cache_explanation(cache_key, highlight, "highlight", result['metadata'])
+            await self._cache_explanation(cache_key, highlight, "highlight", result['metadata'])
             
             return result
             
@@ -226,6 +297,40 @@ Provide clear, concise highlights:"""
             logger.error(f"Error highlighting text: {e}")
             raise Exception(f"Failed to highlight text: {str(e)}")
 
+    async def explain_texts(self, texts: List[str], context: Optional[Dict] = None) -> List[Any]:
+        """
+        Explain several texts at once. Results are in input order; a failed item
+        is returned as its exception instead of failing the whole batch.
+        """
+        return await self._run_batch(texts, context, "explain", self.explain_text)
+
+    async def highlight_texts(self, texts: List[str], context: Optional[Dict] = None) -> List[Any]:
+        """
+        Highlight several texts at once. Results are in input order; a failed item
+        is returned as its exception instead of failing the whole batch.
+        """
+        return await self._run_batch(texts, context, "highlight", self.highlight_text)
+
+    async def _run_batch(self, texts: List[str], context: Optional[Dict], explanation_type: str,
+                         run_one: Callable[..., Awaitable[Dict[str, Any]]]) -> List[Any]:
+        if not self.llm:
+            raise Exception("LLM provider not available")
+        
+        # Identical texts share one call; cached ones are loaded in a single query
+        keys = [self._generate_cache_key(text, explanation_type, context) for text in texts]
+        unique = dict(zip(keys, texts))
+        await self._prefetch_cached(list(unique))
+        
+        semaphore = asyncio.Semaphore(settings.EXPLAIN_BATCH_CONCURRENCY)
+        
+        async def run(text: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await run_one(text, context)
+        
+        results = await asyncio.gather(*(run(text) for text in unique.values()), return_exceptions=True)
+        by_key = dict(zip(unique, results))
+        return [by_key[key] for key in keys]
+
     async def get_available_models(self) -> List[str]:
         """
         Get list of available AI models.
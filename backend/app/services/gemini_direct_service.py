@@ -1,15 +1,46 @@
+import hashlib
+import io
 import time
 import asyncio
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
 from loguru import logger
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 from ..config import settings
+from ..db import run_db
+from ..providers.genai_client import configure_genai
 from ..repositories.documents import DocumentsRepository
 from ..repositories.chunks import ChunksRepository
+from .semantic_cache import semantic_cache
 
 
+# Static parts of the full-document prompt, joined around the per-query values
+_PROMPT_HEAD = (
+    "You are an AI assistant helping to answer questions about a document. The user asked a question that couldn't be answered using the standard search method, so I'm providing you with the full document content to analyze.\n"
+    "\n"
+    "Document Title: "
+)
+_PROMPT_QUESTION = "\nUser Question: "
+_PROMPT_INSTRUCTIONS = (
+    "\n"
+    "\n"
+    "Please analyze the full document content below and provide a helpful answer to the user's question. \n"
+    "\n"
+    "IMPORTANT: You MUST respond in the SAME LANGUAGE as the user's question. If the question is in Chinese, respond in Chinese. If the question is in English, respond in English. If the question is in Japanese, respond in Japanese, etc.\n"
+    "\n"
+    "Guidelines:\n"
+    "- If the question is a simple greeting (like \"你好\", \"hello\", \"hi\"), respond naturally and briefly in the same language\n"
+    "- If the question is about the document content, provide a relevant answer based on the content in the same language\n"
+    "- If the answer is not in the document, give a brief, friendly response in the same language\n"
+    "- Keep responses concise and natural, not overly formal\n"
+    "- ALWAYS maintain language consistency with the user's question\n"
+    "\n"
+    "Document Content:\n"
+)
+_PROMPT_TAIL = "\n\nPlease provide a helpful and natural response in the same language as the user's question."
+
 class GeminiDirectService:
     """Service for direct Gemini queries when RAG fails to find relevant information."""
     
@@ -22,7 +53,7 @@ class GeminiDirectService:
         self._gemini_enabled = bool(api_key)
         if self._gemini_enabled:
             try:
-                genai.configure(api_key=api_key)
+                configure_genai(api_key)
                 self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
                 logger.info("Gemini direct service initialized successfully")
             except Exception as e:
@@ -32,147 +63,296 @@ class GeminiDirectService:
         else:
             logger.warning("Gemini API key not configured, direct service will return fallback responses")
             self.model = None
+        
+        # In-memory LRU of successful answers: key -> (monotonic time, result)
+        self._cache: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._cache_max = settings.GEMINI_DIRECT_CACHE_SIZE
+        self._cache_ttl = settings.GEMINI_DIRECT_CACHE_TTL
+        
+        # Assembled document contents by document version, bounded by total characters
+        self._content_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._content_cache_chars = 0
+        self._content_cache_max_chars = settings.GEMINI_DIRECT_CONTENT_CACHE_CHARS
+        
+        # Caps Gemini calls in flight across all callers (provider rate limits)
+        self._semaphore = asyncio.Semaphore(max(1, settings.GEMINI_MAX_CONCURRENCY))
+    
+    @staticmethod
+    def _cache_key(document_id: str, updated_at: Any, query: str) -> str:
+        """Cache key for a query against one version of a document."""
+        return hashlib.sha256(f"{document_id}:{updated_at}:{query}".encode('utf-8')).hexdigest()
+    
+    def _get_cached(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached result, dropping it if expired."""
+        hit = self._cache.get(cache_key)
+        if hit is None:
+            return None
+        if time.monotonic() - hit[0] >= self._cache_ttl:
+            del self._cache[cache_key]
+            return None
+        self._cache.move_to_end(cache_key)
+        return hit[1]
+    
+    def _remember(self, cache_key: str, result: Dict[str, Any]):
+        """Put a result in the LRU, evicting the least recently used."""
+        if self._cache_max <= 0:
+            return
+        self._cache[cache_key] = (time.monotonic(), result)
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self._cache_max:
+            self._cache.popitem(last=False)
     
-    def _get_full_document_content(self, document_id: str) -> Optional[str]:
-        """Retrieve the full text content of a document from its chunks."""
+    def _write_full_document_content(self, buf: io.StringIO, document_id: str) -> int:
+        """Write the full text content of a document, chunk by chunk, into buf.
+        
+        Returns the number of chunks written (0 when none were found or on error).
+        """
+        count = 0
         try:
-            # Get all chunks for the document
-            chunks = self.chunks_repo.get_all_chunks(document_id)
+            # Chunk contents come back already ordered by chunk_index
+            for content in self.chunks_repo.iter_content_ordered(document_id):
+                if count:
+                    buf.write('\n\n')
+                buf.write(content)
+                count += 1
             
-            if not chunks:
+            if not count:
                 logger.warning(f"No chunks found for document {document_id}")
-                return None
-            
-            # Sort chunks by their order/position
-            sorted_chunks = sorted(chunks, key=lambda x: x.get('chunk_index', 0))
-            
-            # Combine all chunk content
-            full_content = '\n\n'.join(chunk.get('content', '') for chunk in sorted_chunks)
-            
-            logger.debug(f"Retrieved {len(chunks)} chunks for document {document_id}, total length: {len(full_content)}")
-            return full_content
+            else:
+                logger.debug(f"Retrieved {count} chunks for document {document_id}")
+            return count
             
         except Exception as e:
             logger.error(f"Failed to retrieve full document content for {document_id}: {e}")
+            return 0
+    
+    async def _get_document_content(self, document_id: str, updated_at: Any) -> Optional[str]:
+        """Full text of one document version, served from the content cache when possible."""
+        cache_key = f"{document_id}:{updated_at}"
+        content = self._content_cache.get(cache_key)
+        if content is not None:
+            self._content_cache.move_to_end(cache_key)
+            return content
+        
+        buf = io.StringIO()
+        if not await run_db(self._write_full_document_content, buf, document_id):
             return None
+        content = buf.getvalue()
+        
+        if len(content) <= self._content_cache_max_chars:
+            # A concurrent miss may have stored the same version meanwhile
+            previous = self._content_cache.pop(cache_key, None)
+            if previous is not None:
+                self._content_cache_chars -= len(previous)
+            self._content_cache[cache_key] = content
+            self._content_cache_chars += len(content)
+            while self._content_cache_chars > self._content_cache_max_chars:
+                _, evicted = self._content_cache.popitem(last=False)
+                self._content_cache_chars -= len(evicted)
+        return content
+    
+    @staticmethod
+    def _copy_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a result so callers can annotate its citations without touching the cache."""
+        return {**result, 'citations': [dict(citation) for citation in result['citations']]}
+    
+    async def _prepare(self, query: str, document_id: str, query_embedding: Optional[List[float]],
+                       start_time: float) -> tuple:
+        """Resolve a direct query up to the Gemini call.
+        
+        Returns:
+            (result, None) when the query is answered without calling Gemini (disabled,
+            document missing, cache hit, no content), otherwise (None, request) where
+            request carries the prompt and cache keys for _finish.
+        """
+        if not self._gemini_enabled:
+            return ({
+                'answer': 'Gemini API is not configured. Please configure GEMINI_API_KEY to use direct document queries.',
+                'citations': [],
+                'latency_ms': int((time.time() - start_time) * 1000),
+                'fallback': True,
+                'method': 'gemini_direct_disabled'
+            }, None)
+        
+        # Get document info
+        document = await run_db(self.documents_repo.get, document_id)
+        if not document:
+            return ({
+                'answer': 'Document not found.',
+                'citations': [],
+                'latency_ms': int((time.time() - start_time) * 1000),
+                'fallback': True,
+                'method': 'gemini_direct_doc_not_found'
+            }, None)
+        
+        # Same question on the same document version: skip the LLM round-trip
+        cache_key = self._cache_key(document_id, document.get('updated_at'), query)
+        cached = self._get_cached(cache_key)
+        # Otherwise, a paraphrase of an earlier question
+        cache_scope = f"{document_id}:{document.get('updated_at')}"
+        if cached is None and query_embedding is not None and semantic_cache.answers_enabled:
+            cached = semantic_cache.lookup(cache_scope, query_embedding)
+        if cached is not None:
+            logger.info(f"Gemini direct query cache hit for document {document_id}")
+            return ({
+                **self._copy_result(cached),
+                'latency_ms': int((time.time() - start_time) * 1000),
+                'cache_hit': True
+            }, None)
+        
+        # Get full document content
+        full_content = await self._get_document_content(document_id, document.get('updated_at'))
+        if not full_content:
+            return ({
+                'answer': 'Unable to retrieve document content for direct query.',
+                'citations': [],
+                'latency_ms': int((time.time() - start_time) * 1000),
+                'fallback': True,
+                'method': 'gemini_direct_no_content'
+            }, None)
+        
+        # Create prompt for Gemini
+        document_title = document.get('title', 'Untitled Document')
+        prompt = ''.join([
+            _PROMPT_HEAD, document_title, _PROMPT_QUESTION, query,
+            _PROMPT_INSTRUCTIONS, full_content, _PROMPT_TAIL
+        ])
+        
+        logger.info(f"Sending full document query to Gemini for document {document_id}")
+        return None, {
+            'prompt': prompt,
+            'document_id': document_id,
+            'document_title': document_title,
+            'cache_key': cache_key,
+            'cache_scope': cache_scope,
+            'query_embedding': query_embedding
+        }
+    
+    def _generate_async(self, prompt: str, stream: bool = False):
+        """Start the Gemini call (awaitable) with the direct-query settings."""
+        return self.model.generate_content_async(
+            prompt,
+            generation_config=genai.types.GenerationConfig(
+                max_output_tokens=2000,
+                temperature=0.1
+            ),
+            safety_settings={
+                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+            },
+            stream=stream
+        )
     
-    def query_with_full_document(self, query: str, document_id: str) -> Dict[str, Any]:
-        """Query Gemini with the full document content when RAG fails."""
+    def _finish(self, request: Dict[str, Any], answer: str, start_time: float) -> Dict[str, Any]:
+        """Build the result for a generated answer and cache it."""
+        document_title = request['document_title']
+        
+        # Create a citation for the full document
+        citation = {
+            'content': f"Full document: {document_title}",
+            'text': f"Full document: {document_title}",
+            'page_number': 1,
+            'similarity_score': 1.0,  # High score since we used the full document
+            'chunk_index': 0,
+            'document_title': document_title,
+            'document_id': request['document_id']
+        }
+        
+        result = {
+            'answer': answer,
+            'citations': [citation],
+            'latency_ms': int((time.time() - start_time) * 1000),
+            'fallback': False,  # This is a successful direct query, not a fallback
+            'method': 'gemini_direct',
+            'contexts_used': 1,
+            'tokens_in_est': len(request['prompt'].split()) + len(answer.split())
+        }
+        
+        logger.info(
+            f"Gemini direct query completed: {result['latency_ms']}ms, "
+            f"method={result['method']}, tokens_est={result['tokens_in_est']}"
+        )
+        
+        stored = self._copy_result(result)
+        self._remember(request['cache_key'], stored)
+        if request['query_embedding'] is not None and semantic_cache.answers_enabled:
+            semantic_cache.insert(request['cache_scope'], request['query_embedding'], stored)
+        return result
+    
+    async def query_with_full_document(self, query: str, document_id: str,
+                                       query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """Query Gemini with the full document content when RAG fails.
+        
+        When query_embedding is given, answers to earlier, semantically equivalent
+        queries on the same document version are reused.
+        """
         start_time = time.time()
         
         try:
-            if not self._gemini_enabled:
-                return {
-                    'answer': 'Gemini API is not configured. Please configure GEMINI_API_KEY to use direct document queries.',
-                    'citations': [],
-                    'latency_ms': int((time.time() - start_time) * 1000),
-                    'fallback': True,
-                    'method': 'gemini_direct_disabled'
-                }
-            
-            # Get document info
-            document = self.documents_repo.get(document_id)
-            if not document:
-                return {
-                    'answer': 'Document not found.',
-                    'citations': [],
-                    'latency_ms': int((time.time() - start_time) * 1000),
-                    'fallback': True,
-                    'method': 'gemini_direct_doc_not_found'
-                }
-            
-            # Get full document content
-            full_content = self._get_full_document_content(document_id)
-            if not full_content:
-                return {
-                    'answer': 'Unable to retrieve document content for direct query.',
-                    'citations': [],
-                    'latency_ms': int((time.time() - start_time) * 1000),
-                    'fallback': True,
-                    'method': 'gemini_direct_no_content'
-                }
-            
-            # Create prompt for Gemini
-            document_title = document.get('title', 'Untitled Document')
-            prompt = f"""You are an AI assistant helping to answer questions about a document. The user asked a question that couldn't be answered using the standard search method, so I'm providing you with the full document content to analyze.
-
-Document Title: {document_title}
-User Question: {query}
-
-Please analyze the full document content below and provide a helpful answer to the user's question. 
-
-IMPORTANT: You MUST respond in the SAME LANGUAGE as the user's question. If the question is in Chinese, respond in Chinese. If the question is in English, respond in English. If the question is in Japanese, respond in Japanese, etc.
-
-Guidelines:
-- If the question is a simple greeting (like "你好", "hello", "hi"), respond naturally and briefly in the same language
-- If the question is about the document content, provide a relevant answer based on the content in the same language
-- If the answer is not in the document, give a brief, friendly response in the same language
-- Keep responses concise and natural, not overly formal
-- ALWAYS maintain language consistency with the user's question
-
-Document Content:
-{full_content}
-
-Please provide a helpful and natural response in the same language as the user's question."""
-
-            logger.info(f"Sending full document query to Gemini for document {document_id}")
+            result, request = await self._prepare(query, document_id, query_embedding, start_time)
+            if result is not None:
+                return result
             
             # Query Gemini
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=2000,
-                    temperature=0.1
-                ),
-                safety_settings={
-                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                }
-            )
+            async with self._semaphore:
+                response = await self._generate_async(request['prompt'])
             
-            answer = response.text.strip()
-            
-            # Create a citation for the full document
-            citation = {
-                'content': f"Full document: {document_title}",
-                'text': f"Full document: {document_title}",
-                'page_number': 1,
-                'similarity_score': 1.0,  # High score since we used the full document
-                'chunk_index': 0,
-                'document_title': document_title,
-                'document_id': document_id
-            }
-            
-            result = {
-                'answer': answer,
-                'citations': [citation],
-                'latency_ms': int((time.time() - start_time) * 1000),
-                'fallback': False,  # This is a successful direct query, not a fallback
-                'method': 'gemini_direct',
-                'contexts_used': 1,
-                'tokens_in_est': len(prompt.split()) + len(answer.split())
-            }
-            
-            logger.info(
-                f"Gemini direct query completed: {result['latency_ms']}ms, "
-                f"method={result['method']}, tokens_est={result['tokens_in_est']}"
-            )
-            
-            return result
+            return self._finish(request, response.text.strip(), start_time)
             
         except Exception as e:
             logger.error(f"Error in Gemini direct query for document {document_id}: {e}")
-            
-            return {
-                'answer': f'An error occurred while querying the full document: {str(e)}',
-                'citations': [],
-                'latency_ms': int((time.time() - start_time) * 1000),
-                'fallback': True,
-                'method': 'gemini_direct_error',
-                'error': str(e)
-            }
+            return self._error_result(e, start_time)
+    
+    async def query_stream(self, query: str, document_id: str,
+                           query_embedding: Optional[List[float]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a full-document answer as it is generated.
+        
+        Yields 'token' events ({'text': ...}) followed by one 'done' event with the
+        remaining query_with_full_document fields. Answers that need no Gemini call
+        (cache hits, errors before generation) arrive as a single token event.
+        """
+        start_time = time.time()
+        streamed = False
+        
+        try:
+            result, request = await self._prepare(query, document_id, query_embedding, start_time)
+            if result is None:
+                parts = []
+                async with self._semaphore:
+                    response = await self._generate_async(request['prompt'], stream=True)
+                    async for chunk in response:
+                        text = chunk.text
+                        if text:
+                            streamed = True
+                            parts.append(text)
+                            yield {'event': 'token', 'data': {'text': text}}
+                result = self._finish(request, ''.join(parts).strip(), start_time)
+                # Tokens already went out; the done event carries only the rest
+                yield {'event': 'done', 'data': {k: v for k, v in result.items() if k != 'answer'}}
+                return
+        
+        except Exception as e:
+            if streamed:
+                raise
+            logger.error(f"Error in Gemini direct query for document {document_id}: {e}")
+            result = self._error_result(e, start_time)
+        
+        yield {'event': 'token', 'data': {'text': result.get('answer', '')}}
+        yield {'event': 'done', 'data': {k: v for k, v in result.items() if k != 'answer'}}
+    
+    @staticmethod
+    def _error_result(error: BaseException, start_time: float) -> Dict[str, Any]:
+        """Fallback result for a failed direct query."""
+        return {
+            'answer': f'An error occurred while querying the full document: {str(error)}',
+            'citations': [],
+            'latency_ms': int((time.time() - start_time) * 1000),
+            'fallback': True,
+            'method': 'gemini_direct_error',
+            'error': str(error)
+        }
 
 
 # Global instance
@@ -2,6 +2,11 @@ import numpy as np
 from typing import List, Dict, Any
 from loguru import logger
 
+# Precompute the full candidate similarity matrix when it stays below this size (bytes)
+FULL_SIMILARITY_MAX_BYTES = 4 * 1024 * 1024
+# ...and when k is large enough that one GEMM beats k matrix-vector products
+FULL_SIMILARITY_MAX_N_PER_K = 4
+
 
 class MMRService:
     """Service for Maximum Marginal Relevance (MMR) selection.
@@ -22,14 +27,14 @@ class MMRService:
         Returns:
             float: Cosine similarity score
         """
-        # Ensure vectors are normalized (they should be from embedding service)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+        vec1 = np.asarray(vec1)
+        vec2 = np.asarray(vec2)
         
-        if norm1 == 0 or norm2 == 0:
+        # A zero vector has no direction; any() answers that without computing norms
+        if not vec1.any() or not vec2.any():
             return 0.0
         
-        # For normalized vectors, dot product equals cosine similarity
+        # Vectors are normalized by the embedding service, so the dot product equals cosine similarity
         return float(np.dot(vec1, vec2))
     
     def _calculate_max_similarity(self, candidate_embedding: np.ndarray, 
@@ -46,12 +51,80 @@ class MMRService:
         if not selected_embeddings:
             return 0.0
         
-        similarities = [
-            self._cosine_similarity(candidate_embedding, selected_emb)
-            for selected_emb in selected_embeddings
-        ]
+        # One matrix-vector product instead of a call per selected item
+        candidate = np.asarray(candidate_embedding)
+        if not candidate.any():
+            return 0.0
+        selected = np.asarray(selected_embeddings)
+        similarities = selected @ candidate
+        similarities[~selected.any(axis=1)] = 0.0
+        
+        return float(similarities.max())
+    
+    def mmr_matrix(self, embeddings: np.ndarray, scores: np.ndarray, k: int,
+                   lambda_: float = 0.5) -> List[int]:
+        """Select k rows of an embedding matrix using Maximum Marginal Relevance.
+        
+        Args:
+            embeddings: (n, d) candidate embeddings, one row per candidate
+            scores: (n,) relevance scores
+            k: Number of items to select (must be < n)
+            lambda_: Balance parameter (0.0 = pure diversity, 1.0 = pure relevance)
+        
+        Returns:
+            List[int]: Row indices of selected candidates in order of selection
+        """
+        # Row-normalize (into a new array) so similarities to a newly selected item
+        # are a single matrix-vector product
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+        
+        # Normalize relevance scores to [0, 1] range
+        relevance = np.asarray(scores, dtype=np.float32)
+        min_score = relevance.min()
+        max_score = relevance.max()
+        if max_score > min_score:
+            relevance = (relevance - min_score) / (max_score - min_score)
+        else:
+            relevance = np.ones_like(relevance)
+        
+        n = matrix.shape[0]
+        # Small candidate sets: one GEMM up front, then each step is a row lookup
+        use_full = n * n * 4 < FULL_SIMILARITY_MAX_BYTES and n <= FULL_SIMILARITY_MAX_N_PER_K * k
+        similarity_matrix = matrix @ matrix.T if use_full else None
+        selected_indices = []
+        remaining = np.ones(n, dtype=bool)
+        # Maximum similarity of each candidate to the items selected so far
+        max_sim = np.zeros(n, dtype=np.float32)
+        
+        # MMR score: λ * relevance - (1-λ) * max_similarity. The relevance term is
+        # loop-invariant; selected items get -inf there, which removes them from argmax.
+        relevance_term = lambda_ * relevance
+        diversity_weight = 1 - lambda_
+        mmr_scores = np.empty(n, dtype=np.float32)
+        
+        # Select k items iteratively
+        for step in range(k):
+            np.multiply(max_sim, diversity_weight, out=mmr_scores)
+            np.subtract(relevance_term, mmr_scores, out=mmr_scores)
+            best_idx = int(mmr_scores.argmax())
+            if not remaining[best_idx]:
+                # Fallback (no finite score left): select by position
+                best_idx = int(np.flatnonzero(remaining)[0])
+            
+            selected_indices.append(best_idx)
+            remaining[best_idx] = False
+            relevance_term[best_idx] = -np.inf
+            
+            if similarity_matrix is not None:
+                similarities = similarity_matrix[best_idx]
+            else:
+                similarities = matrix @ matrix[best_idx]
+            max_sim = similarities if step == 0 else np.maximum(max_sim, similarities)
         
-        return max(similarities)
+        return selected_indices
     
     def mmr(self, candidates: List[Dict[str, Any]], k: int, lambda_: float = 0.5) -> List[int]:
         """Select k items using Maximum Marginal Relevance.
@@ -83,69 +156,11 @@ class MMRService:
                 if not isinstance(candidate['embedding'], (list, np.ndarray)):
                     raise ValueError(f"Candidate {i} embedding must be list or numpy array")
             
-            # Convert embeddings to numpy arrays
-            embeddings = []
-            for candidate in candidates:
-                emb = candidate['embedding']
-                if isinstance(emb, list):
-                    emb = np.array(emb, dtype=np.float32)
-                embeddings.append(emb)
-            
-            # Get relevance scores
-            relevance_scores = [candidate['score'] for candidate in candidates]
-            
-            # Normalize relevance scores to [0, 1] range
-            min_score = min(relevance_scores)
-            max_score = max(relevance_scores)
-            if max_score > min_score:
-                normalized_scores = [
-                    (score - min_score) / (max_score - min_score)
-                    for score in relevance_scores
-                ]
-            else:
-                normalized_scores = [1.0] * len(relevance_scores)
-            
-            selected_indices = []
-            selected_embeddings = []
-            remaining_indices = list(range(len(candidates)))
-            
-            # Select k items iteratively
-            for _ in range(k):
-                if not remaining_indices:
-                    break
-                
-                best_score = float('-inf')
-                best_idx = None
-                best_remaining_pos = None
-                
-                # Calculate MMR score for each remaining candidate
-                for pos, idx in enumerate(remaining_indices):
-                    relevance = normalized_scores[idx]
-                    
-                    # Calculate maximum similarity to already selected items
-                    max_sim = self._calculate_max_similarity(
-                        embeddings[idx], selected_embeddings
-                    )
-                    
-                    # MMR score: λ * relevance - (1-λ) * max_similarity
-                    mmr_score = lambda_ * relevance - (1 - lambda_) * max_sim
-                    
-                    if mmr_score > best_score:
-                        best_score = mmr_score
-                        best_idx = idx
-                        best_remaining_pos = pos
-                
-                # Select the best candidate
-                if best_idx is not None:
-                    selected_indices.append(best_idx)
-                    selected_embeddings.append(embeddings[best_idx])
-                    remaining_indices.pop(best_remaining_pos)
-                else:
-                    # Fallback: select by relevance
-                    best_idx = remaining_indices[0]
-                    selected_indices.append(best_idx)
-                    selected_embeddings.append(embeddings[best_idx])
-                    remaining_indices.pop(0)
+            # Stack the embeddings into one (n, d) matrix and select on that
+            matrix = np.stack([np.asarray(candidate['embedding'], dtype=np.float32) for candidate in candidates])
+            scores = np.fromiter((candidate['score'] for candidate in candidates), dtype=np.float32,
+                                 count=len(candidates))
+            selected_indices = self.mmr_matrix(matrix, scores, k, lambda_)
             
             logger.debug(
                 f"MMR selected {len(selected_indices)} items from {len(candidates)} candidates "
@@ -156,13 +171,14 @@ class MMRService:
             
         except Exception as e:
             logger.error(f"Error in MMR selection: {e}")
-            # Fallback: return top-k by relevance score
-            sorted_indices = sorted(
-                range(len(candidates)), 
-                key=lambda i: candidates[i]['score'], 
-                reverse=True
-            )
-            return sorted_indices[:k]
+            # Fallback: return top-k by relevance score (ties keep candidate order)
+            scores = np.fromiter((candidate['score'] for candidate in candidates), dtype=np.float64,
+                                 count=len(candidates))
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]  # k-th largest, O(n)
+            above = np.flatnonzero(scores > kth)
+            ties = np.flatnonzero(scores == kth)[:k - len(above)]
+            top = np.concatenate([above, ties])
+            return top[np.lexsort((top, -scores[top]))].tolist()
     
     def mmr_with_page_grouping(self, candidates: List[Dict[str, Any]], k: int, 
                               lambda_: float = 0.5) -> List[int]:
@@ -1,9 +1,26 @@
+import os
+
 import tiktoken
-from typing import List, Dict, Any, Tuple
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from loguru import logger
 
 from ..config import settings
 
+# Number of distinct texts whose token counts are memoized per packer
+TOKEN_CACHE_SIZE = 4096
+
+# Instruction shared by every answer prompt. It is sent as the model's system
+# instruction rather than inside each prompt, so every request starts with the
+# same prefix and the backend can reuse it across queries.
+ANSWER_SYSTEM_INSTRUCTION = (
+    "IMPORTANT: You MUST respond in the SAME LANGUAGE as the user's question. "
+    "If the question is in Chinese, answer in Chinese. "
+    "If the question is in English, answer in English. "
+    "If the question is in Japanese, answer in Japanese, etc. "
+    "ALWAYS maintain language consistency."
+)
+
 
 class PromptPacker:
     """Service for packing query and contexts into prompts with strict token budgets."""
@@ -21,9 +38,12 @@ class PromptPacker:
         self.max_context_tokens = settings.RAG_MAX_CONTEXT_TOKENS  # 1800
         self.block_max_tokens = settings.RAG_BLOCK_MAX_TOKENS  # 300
         self.target_context_tokens = 1400  # Leave room for query and response
+        
+        # The same texts are re-estimated within and across pack() calls
+        self._cached_token_count = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._count_tokens)
     
     def _estimate_tokens(self, text: str) -> int:
-        """Estimate token count for text.
+        """Estimate token count for text (memoized).
         
         Args:
             text: Input text
@@ -33,7 +53,17 @@ class PromptPacker:
         """
         if not text:
             return 0
+        return self._cached_token_count(text)
+    
+    def _count_tokens(self, text: str) -> int:
+        """Count tokens for text without caching.
+        
+        Args:
+            text: Input text
         
+        Returns:
+            int: Estimated token count
+        """
         if self.tokenizer:
             try:
                 return len(self.tokenizer.encode(text))
@@ -42,18 +72,51 @@ class PromptPacker:
         
         # Fallback: character-based estimation
         # For mixed CJK/English: CJK chars ≈ 1.25 tokens, English ≈ 0.25 tokens per char
-        cjk_chars = sum(1 for char in text if ord(char) > 127)
-        ascii_chars = len(text) - cjk_chars
+        # Count ASCII characters in C: encoding with 'ignore' drops everything else
+        ascii_chars = len(text) if text.isascii() else len(text.encode('ascii', 'ignore'))
+        cjk_chars = len(text) - ascii_chars
         
         estimated_tokens = int(cjk_chars * 1.25 + ascii_chars * 0.25)
         return max(1, estimated_tokens)  # At least 1 token
     
-    def _truncate_text(self, text: str, max_tokens: int) -> str:
+    def _encode_batch(self, texts: List[str]) -> Optional[List[List[int]]]:
+        """Tokenize several texts in one tiktoken call.
+        
+        Args:
+            texts: Input texts
+        
+        Returns:
+            Optional[List[List[int]]]: Token ids per text, or None without a tokenizer
+        """
+        if not self.tokenizer:
+            return None
+        try:
+            return self.tokenizer.encode_batch(texts, num_threads=os.cpu_count() or 4)
+        except Exception:
+            return None
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token counts of several texts, with the same estimate pack() uses.
+        
+        Args:
+            texts: Input texts
+        
+        Returns:
+            List[int]: Token count per text
+        """
+        batch_ids = self._encode_batch(texts)
+        if batch_ids is not None:
+            return [len(ids) for ids in batch_ids]
+        return [self._estimate_tokens(text) for text in texts]
+    
+    def _truncate_text(self, text: str, max_tokens: int,
+                       token_ids: Optional[List[int]] = None) -> str:
         """Truncate text to fit within token limit.
         
         Args:
             text: Input text
             max_tokens: Maximum allowed tokens
+            token_ids: Token ids of text, if already encoded
         
         Returns:
             str: Truncated text
@@ -61,11 +124,45 @@ class PromptPacker:
         if not text or max_tokens <= 0:
             return ""
         
-        current_tokens = self._estimate_tokens(text)
-        if current_tokens <= max_tokens:
+        if self.tokenizer:
+            try:
+                # Tokenize once and cut in token space
+                if token_ids is None:
+                    token_ids = self.tokenizer.encode(text)
+                if len(token_ids) <= max_tokens:
+                    return text
+                # A cut inside a multi-byte character decodes to U+FFFD; drop it
+                best_text = self.tokenizer.decode(token_ids[:max_tokens]).rstrip('\ufffd')
+            except Exception:
+                best_text = self._truncate_by_estimate(text, max_tokens)
+        else:
+            best_text = self._truncate_by_estimate(text, max_tokens)
+        
+        if best_text is None:
             return text
         
-        # Binary search for optimal truncation point
+        # Try to end at a word boundary
+        if best_text and not best_text.endswith(' '):
+            last_space = best_text.rfind(' ')
+            if last_space > len(best_text) * 0.8:  # Only if we don't lose too much
+                best_text = best_text[:last_space]
+        
+        return best_text.strip()
+    
+    def _truncate_by_estimate(self, text: str, max_tokens: int) -> Optional[str]:
+        """Longest prefix of text within max_tokens by the character-based estimate.
+        
+        Args:
+            text: Input text
+            max_tokens: Maximum allowed tokens
+        
+        Returns:
+            Optional[str]: The prefix, or None if the whole text already fits
+        """
+        if self._estimate_tokens(text) <= max_tokens:
+            return None
+        
+        # Binary search for optimal truncation point; prefixes are one-off, so skip the cache
         left, right = 0, len(text)
         best_text = ""
         
@@ -73,19 +170,13 @@ class PromptPacker:
             mid = (left + right) // 2
             candidate = text[:mid]
             
-            if self._estimate_tokens(candidate) <= max_tokens:
+            if not candidate or self._count_tokens(candidate) <= max_tokens:
                 best_text = candidate
                 left = mid + 1
             else:
                 right = mid - 1
         
-        # Try to end at a word boundary
-        if best_text and not best_text.endswith(' '):
-            last_space = best_text.rfind(' ')
-            if last_space > len(best_text) * 0.8:  # Only if we don't lose too much
-                best_text = best_text[:last_space]
-        
-        return best_text.strip()
+        return best_text
     
     def _format_citation(self, context: Dict[str, Any], index: int) -> str:
         """Format a citation for a context.
@@ -116,7 +207,8 @@ class PromptPacker:
             config: Optional configuration overrides
         
         Returns:
-            Dict with 'prompt', 'citations', 'tokens_in_est', 'contexts_used'
+            Dict with 'prompt', 'citations', 'tokens_in_est', 'contexts_used'. The prompt
+            is meant to follow ANSWER_SYSTEM_INSTRUCTION as the model's system instruction.
         """
         if not query:
             return {
@@ -131,8 +223,15 @@ class PromptPacker:
             max_context_tokens = config.get('max_context_tokens', self.target_context_tokens) if config else self.target_context_tokens
             block_max_tokens = config.get('block_max_tokens', self.block_max_tokens) if config else self.block_max_tokens
             
+            # Tokenize the query and the contexts without a stored token_count in one batch
+            contents = [context.get('content', '').strip() for context in contexts]
+            stored_counts = [context.get('token_count') for context in contexts]
+            unknown = [i for i, count in enumerate(stored_counts) if count is None]
+            batch_ids = self._encode_batch([query] + [contents[i] for i in unknown])
+            ids_by_index = dict(zip(unknown, batch_ids[1:])) if batch_ids else {}
+            
             # Estimate query tokens
-            query_tokens = self._estimate_tokens(query)
+            query_tokens = len(batch_ids[0]) if batch_ids else self._estimate_tokens(query)
             
             # Calculate available tokens for contexts
             # Reserve tokens for prompt template and formatting
@@ -154,16 +253,26 @@ class PromptPacker:
             used_tokens = 0
             
             for i, context in enumerate(contexts):
-                content = context.get('content', '').strip()
+                content = contents[i]
                 if not content:
                     continue
+                content_ids = ids_by_index.get(i)
+                stored_count = stored_counts[i]
                 
                 # Truncate content to block limit
-                truncated_content = self._truncate_text(content, block_max_tokens)
+                if stored_count is not None and stored_count <= block_max_tokens:
+                    truncated_content = content
+                else:
+                    truncated_content = self._truncate_text(content, block_max_tokens, content_ids)
                 if not truncated_content:
                     continue
                 
-                content_tokens = self._estimate_tokens(truncated_content)
+                if truncated_content is content and stored_count is not None:
+                    content_tokens = stored_count
+                elif truncated_content is content and content_ids is not None:
+                    content_tokens = len(content_ids)
+                else:
+                    content_tokens = self._estimate_tokens(truncated_content)
                 
                 # Check if we can fit this context
                 if used_tokens + content_tokens <= available_tokens:
@@ -181,7 +290,7 @@ class PromptPacker:
                     # Try to fit a smaller portion
                     remaining_tokens = available_tokens - used_tokens
                     if remaining_tokens > 50:  # Only if meaningful space left
-                        partial_content = self._truncate_text(content, remaining_tokens)
+                        partial_content = self._truncate_text(content, remaining_tokens, content_ids)
                         if partial_content and len(partial_content) > 20:  # Minimum useful length
                             selected_contexts.append({
                                 **context,
@@ -202,9 +311,7 @@ class PromptPacker:
                     for i, ctx in enumerate(selected_contexts)
                 ])
                 
-                prompt = f"""Based on the following context, please answer the user's question. 
-
-IMPORTANT: You MUST respond in the SAME LANGUAGE as the user's question. If the question is in Chinese, answer in Chinese. If the question is in English, answer in English. If the question is in Japanese, answer in Japanese, etc. ALWAYS maintain language consistency.
+                prompt = f"""Based on the following context, please answer the user's question.
 
 Context:
 {context_section}
@@ -213,16 +320,14 @@ Question: {query}
 
 Answer (be concise, cite sources, and use the same language as the question):"""
             else:
-                prompt = f"""No relevant context found for the question. Please provide a general response based on your knowledge. 
-
-IMPORTANT: You MUST respond in the SAME LANGUAGE as the user's question. If the question is in Chinese, answer in Chinese. If the question is in English, answer in English. If the question is in Japanese, answer in Japanese, etc. ALWAYS maintain language consistency.
+                prompt = f"""No relevant context found for the question. Please provide a general response based on your knowledge.
 
 Question: {query}
 
 Answer (use the same language as the question):"""
             
-            # Calculate final token estimate
-            total_tokens = self._estimate_tokens(prompt)
+            # Calculate final token estimate (the system instruction is sent with every request)
+            total_tokens = self._estimate_tokens(ANSWER_SYSTEM_INSTRUCTION) + self._estimate_tokens(prompt)
             
             result = {
                 'prompt': prompt,
@@ -1,10 +1,38 @@
+import asyncio
+import functools
+import hashlib
+import random
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from loguru import logger
 import google.generativeai as genai
 
+from .. import db
 from ..config import settings
+from ..providers.genai_client import configure_genai
+from ..repositories.chunks import ChunksRepository
+
+# Blocking Google embedding calls of indexing batches run here rather than in the
+# event loop's default executor, which other blocking work shares and which
+# asyncio.run() would create and tear down for every window.
+_EMBED_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, settings.RAG_EMBED_MAX_CONCURRENCY),
+    thread_name_prefix="rag-embed",
+)
+
+
+
+class _PendingQueries:
+    """Query texts collected on one event loop, waiting to be embedded together."""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.items: List[Tuple[str, asyncio.Future]] = []
+        self.flushed = False
 
 
 class RAGEmbeddingService:
@@ -12,9 +40,28 @@ class RAGEmbeddingService:
     
     def __init__(self):
         self.model_name = settings.RAG_EMBEDDING_MODEL  # text-embedding-004
-        self.batch_size = 128  # Google API batch limit
+        self.max_batch_size = 128  # Google API batch limit
+        self.min_batch_size = 8
+        self.batch_size = self.max_batch_size  # Adapted to rate limiting, see _record_batch
         self.max_retries = 3
         self.base_delay = 1.0  # Base delay for exponential backoff
+        self.max_delay = 30.0  # Cap on the computed backoff
+        
+        # Batch size controller state: halve on rate limiting, grow back while latency stays flat
+        self._batch_lock = threading.Lock()
+        self._ema_latency_per_item: Optional[float] = None
+        self._last_rate_limited = float('-inf')
+        self.rate_limit_cooldown = 30.0  # Seconds after a 429 before batches grow again
+        # Reads embeddings off an embed_content result; probed on the first batch
+        self._extract_embeddings: Optional[Callable[[Any], List[Any]]] = None
+        self.max_concurrency = max(1, settings.RAG_EMBED_MAX_CONCURRENCY)  # Batch calls in flight
+        
+        # Embeddings by cache key (model + text hash), in front of the embedding_cache table
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_size = settings.RAG_EMBED_CACHE_SIZE
+        self._persist = settings.RAG_EMBED_CACHE_PERSIST
+        self.chunks_repo = ChunksRepository()
         
         # Prefer Google AI embeddings if key provided; otherwise fall back to local embeddings
         api_key = settings.GOOGLE_API_KEY or settings.GEMINI_API_KEY
@@ -23,7 +70,7 @@ class RAGEmbeddingService:
 
         if self._use_google:
             try:
-                genai.configure(api_key=api_key)
+                configure_genai(api_key)
                 logger.info("RAGEmbeddingService: Using Google embeddings")
             except Exception as e:
                 logger.warning(f"Failed to configure Google embeddings, falling back to local: {e}")
@@ -36,83 +83,197 @@ class RAGEmbeddingService:
             except Exception as e:
                 logger.error(f"Failed to initialize local embedding provider: {e}")
                 self._local_provider = None
+
+        # Synchronous callers reach the async local provider through one long-lived loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        if self._local_provider is not None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="rag-embed-loop", daemon=True).start()
+        
+        # Concurrent Google query embeddings waiting to share one request
+        self._pending_queries: Optional[_PendingQueries] = None
+        self.query_batch_max_size = settings.EMBED_BATCH_MAX_SIZE
+        self.query_batch_max_wait = settings.EMBED_BATCH_MAX_WAIT_MS / 1000.0
+        
+        # text-embedding-* models return unit-length vectors, so normalizing them again is wasted work
+        self._provider_returns_normalized = self._use_google and self.model_name.startswith("text-embedding-")
+        
+        # Pick the backend once; _embed_batch(texts, out=None, task_type=...) embeds one batch
+        if not self._use_google and self._local_provider is not None:
+            self._embed_batch = self._embed_batch_local
+        else:
+            self._embed_batch = self._embed_batch_google
     
-    def _exponential_backoff(self, attempt: int) -> float:
-        """Calculate exponential backoff delay."""
-        return self.base_delay * (2 ** attempt)
-    
-    def _normalize_vector(self, vector: np.ndarray) -> np.ndarray:
-        """Normalize vector to unit length."""
-        norm = np.linalg.norm(vector)
-        if norm == 0:
-            return vector
-        return vector / norm
+    def _exponential_backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Calculate the delay before retrying.
+        
+        Uses the server-requested delay when the error carries one; otherwise a
+        random delay up to base_delay * 2**attempt (capped at max_delay), so
+        clients limited at the same moment do not retry in lockstep.
+        """
+        retry_after = self._retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(self.base_delay, min(self.max_delay, self.base_delay * (2 ** attempt)))
     
-    def _embed_batch(self, texts: List[str]) -> np.ndarray:
-        """Embed a batch of texts with retry logic."""
-        # Local fallback path
-        if not self._use_google and self._local_provider is not None:
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """Retry delay requested by the server, from RetryInfo details or a Retry-After header."""
+        for detail in getattr(error, 'details', None) or []:
+            delay = getattr(detail, 'retry_delay', None)
+            if delay is not None and hasattr(delay, 'seconds'):
+                return delay.seconds + delay.nanos / 1e9
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        if headers:
             try:
-                import asyncio
-                # Handle async call properly
-                vecs = asyncio.run(self._local_provider.embed_texts(texts))
-                # Normalize each embedding to unit length
-                normalized = np.array([self._normalize_vector(v) for v in vecs], dtype=np.float32)
-                return normalized
-            except Exception as e:
-                logger.error(f"Local embedding failed: {e}")
-                raise
-
+                return float(headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                pass
+        return None
+    
+    @staticmethod
+    def _embeddings_accessor(result: Any) -> Optional[Callable[[Any], List[Any]]]:
+        """Pick how to read embeddings off an embed_content result.
+        
+        The result type is fixed for a given SDK version, so the accessor is
+        probed once and reused for later batches.
+        """
+        if hasattr(result, 'embedding'):
+            return lambda r: [r.embedding]  # Single text case
+        if hasattr(result, 'embeddings'):
+            return lambda r: r.embeddings  # Batch case
+        if isinstance(result, dict):
+            if 'embedding' in result:
+                return lambda r: [r['embedding']]
+            if 'embeddings' in result:
+                return lambda r: r['embeddings']
+        return None
+    
+    def _record_batch(self, size: int, latency: float) -> None:
+        """Grow the batch size after a successful call while per-item latency stays flat."""
+        per_item = latency / max(1, size)
+        with self._batch_lock:
+            ema = self._ema_latency_per_item
+            self._ema_latency_per_item = per_item if ema is None else 0.8 * ema + 0.2 * per_item
+            if (
+                self.batch_size < self.max_batch_size
+                and time.monotonic() - self._last_rate_limited >= self.rate_limit_cooldown
+                and (ema is None or per_item <= 1.25 * ema)
+            ):
+                self.batch_size = min(self.max_batch_size, int(self.batch_size * 1.2) + 1)
+    
+    def _record_rate_limited(self) -> None:
+        """Halve the batch size after a 429 / quota error."""
+        with self._batch_lock:
+            self._last_rate_limited = time.monotonic()
+            if self.batch_size > self.min_batch_size:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                logger.info(f"Rate limited; embedding batch size reduced to {self.batch_size}")
+    
+    def _normalize_batch(self, arr: np.ndarray) -> np.ndarray:
+        """Normalize each row of a 2-D array to unit length (in place when already float32)."""
+        arr = np.ascontiguousarray(arr, dtype=np.float32)
+        # Row dot products via einsum: no (n, D) temporary for the squares, unlike linalg.norm
+        squared_norms = np.einsum('ij,ij->i', arr, arr)
+        squared_norms[squared_norms == 0] = 1.0  # leave zero rows as they are
+        # One reciprocal per row, then a multiply across the row instead of a divide
+        arr *= (1.0 / np.sqrt(squared_norms))[:, None]
+        return arr
+    
+    def _embed_batch_local(self, texts: List[str], out: Optional[np.ndarray] = None,
+                           task_type: str = "retrieval_document") -> np.ndarray:
+        """Embed a batch of texts with the local provider (task_type is not used).
+        
+        Args:
+            texts: Batch of texts
+            out: Optional (len(texts), D) float32 destination, written in place
+            task_type: Accepted for a signature shared with _embed_batch_google
+        
+        Returns:
+            np.ndarray: Normalized embeddings (out, when given)
+        """
+        try:
+            # Run on the service's loop instead of creating one per call
+            vecs = asyncio.run_coroutine_threadsafe(
+                self._local_provider.embed_texts(texts), self._loop
+            ).result()
+            # Normalize each embedding to unit length
+            if out is None:
+                return self._normalize_batch(np.array(vecs, dtype=np.float32))
+            out[...] = vecs
+            return self._normalize_batch(out)
+        except Exception as e:
+            logger.error(f"Local embedding failed: {e}")
+            raise
+    
+    def _embed_batch_google(self, texts: List[str], out: Optional[np.ndarray] = None,
+                            task_type: str = "retrieval_document") -> np.ndarray:
+        """Embed a batch of texts with Google's embedding model, with retry logic.
+        
+        Args:
+            texts: Batch of texts
+            out: Optional (len(texts), D) float32 destination, written in place
+            task_type: Google embedding task type (retrieval_document or retrieval_query)
+        
+        Returns:
+            np.ndarray: Normalized embeddings (out, when given)
+        """
         for attempt in range(self.max_retries):
             try:
                 # Use Google's embedding model
+                started = time.monotonic()
                 result = genai.embed_content(
                     model=f"models/{self.model_name}",
                     content=texts,
-                    task_type="retrieval_document"
+                    task_type=task_type
                 )
+                if task_type == "retrieval_document":
+                    # Single queries would skew the per-item latency of indexing batches
+                    self._record_batch(len(texts), time.monotonic() - started)
                 
-                # Extract embeddings
-                embeddings = []
-                if hasattr(result, 'embedding'):
-                    # Single text case
-                    embeddings = [result.embedding]
-                elif hasattr(result, 'embeddings'):
-                    # Batch case
-                    embeddings = result.embeddings
-                else:
-                    # Try to access as dict
-                    if isinstance(result, dict):
-                        if 'embedding' in result:
-                            embeddings = [result['embedding']]
-                        elif 'embeddings' in result:
-                            embeddings = result['embeddings']
+                # Extract embeddings with the accessor matching the SDK's response shape
+                extract = self._extract_embeddings
+                try:
+                    embeddings = extract(result) if extract is not None else []
+                except (AttributeError, KeyError, TypeError):
+                    extract = None
+                if extract is None:
+                    extract = self._embeddings_accessor(result)
+                    self._extract_embeddings = extract
+                    embeddings = extract(result) if extract is not None else []
                 
                 if not embeddings:
                     raise ValueError("No embeddings returned from API")
                 
                 # Handle the case where Google API returns [array_of_all_embeddings] instead of [emb1, emb2, ...]
-                if len(embeddings) == 1 and len(texts) > 1:
-                    # Google API returned all embeddings as a single array
-                    embeddings_array = np.array(embeddings[0], dtype=np.float32)
+                if len(embeddings) == 1:
+                    # Google API returned all embeddings as a single array (or a
+                    # single embedding); view it as (len(texts), D) without copying
+                    embeddings_array = np.asarray(embeddings[0], dtype=np.float32).reshape(len(texts), -1)
+                    if out is not None:
+                        out[...] = embeddings_array
+                        embeddings_array = out
                 else:
-                    # Normal case: list of individual embeddings
-                    embeddings_array = np.array(embeddings, dtype=np.float32)
-                
-                # Normalize each embedding to unit length
-                normalized_embeddings = np.array([
-                    self._normalize_vector(emb) for emb in embeddings_array
-                ])
+                    # Normal case: list of individual embeddings; fill the destination row by row
+                    embeddings_array = out if out is not None else np.empty(
+                        (len(embeddings), len(embeddings[0])), dtype=np.float32
+                    )
+                    for i, embedding in enumerate(embeddings):
+                        embeddings_array[i] = embedding
                 
-                return normalized_embeddings
+                # Normalize each embedding to unit length (in place), unless the model already did
+                if self._provider_returns_normalized:
+                    return embeddings_array
+                return self._normalize_batch(embeddings_array)
                 
             except Exception as e:
                 error_msg = str(e).lower()
                 
                 # Check for rate limiting
                 if "429" in error_msg or "rate limit" in error_msg or "quota" in error_msg:
+                    self._record_rate_limited()
                     if attempt < self.max_retries - 1:
-                        delay = self._exponential_backoff(attempt)
+                        delay = self._exponential_backoff(attempt, e)
                         logger.warning(
                             f"Rate limited on attempt {attempt + 1}, "
                             f"retrying in {delay:.1f}s: {e}"
@@ -127,7 +288,7 @@ class RAGEmbeddingService:
                     "503" in error_msg or
                     "502" in error_msg
                 ):
-                    delay = self._exponential_backoff(attempt)
+                    delay = self._exponential_backoff(attempt, e)
                     logger.warning(
                         f"Retryable error on attempt {attempt + 1}, "
                         f"retrying in {delay:.1f}s: {e}"
@@ -142,41 +303,102 @@ class RAGEmbeddingService:
         raise Exception(f"Failed to embed batch after {self.max_retries} attempts")
     
     def embed_texts(self, texts: List[str]) -> np.ndarray:
-        """Embed multiple texts with batching and retry logic.
+        """Embed multiple texts with batching, retry logic and the embedding cache.
         
         Args:
             texts: List of texts to embed
         
         Returns:
-            np.ndarray: Array of normalized embeddings with shape (n, EMBED_DIM)
+            np.ndarray: C-contiguous float32 array of normalized embeddings with shape
+                (n, EMBED_DIM); vector stores can take it without a defensive copy
         """
         if not texts:
             return np.array([], dtype=np.float32).reshape(0, settings.EMBED_DIM)
         
+        keys, found, missing = self._lookup_cached(texts)
+        # Called from indexing and prefetch threads: embedding_cache access is handed to
+        # the DB executor so it never runs alongside another thread's transaction
+        if missing and self._persist:
+            try:
+                found.update(self._remember(db.call_db(self._load_persisted, missing)))
+                missing = [key for key in missing if key not in found]
+            except Exception as e:
+                logger.warning(f"Failed to read embedding cache: {e}")
+        if not missing:
+            return self._assemble(keys, found)
+        
+        texts_by_key = dict(zip(keys, texts))
+        embedded = self._embed_uncached([texts_by_key[key] for key in missing])
+        new = self._remember(dict(zip(missing, embedded)))
+        if self._persist:
+            try:
+                db.call_db(self.chunks_repo.store_cached_embeddings, new)
+            except Exception as e:
+                logger.warning(f"Failed to write embedding cache: {e}")
+        if len(missing) == len(keys):
+            # No hits and no repeats: rows are already in order (ascontiguousarray is a no-op here)
+            return np.ascontiguousarray(embedded, dtype=np.float32)
+        found.update(new)
+        return self._assemble(keys, found)
+    
+    def iter_embed_texts(self, texts: Iterable[str]) -> Iterator[np.ndarray]:
+        """Embed texts lazily, yielding one array per window of texts.
+        
+        Each window holds as many API batches as are sent concurrently. The
+        next window is embedded in a background thread while the caller
+        processes the current one (and while texts keeps producing input), so
+        at most two windows of embeddings are resident at a time.
+        
+        Args:
+            texts: Texts to embed (any iterable, consumed as needed)
+        
+        Yields:
+            np.ndarray: Normalized embeddings of the next window, in input order
+        """
+        window_size = self.batch_size * self.max_concurrency
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-embed-window") as pool:
+            pending: Optional[Future] = None
+            window = []
+            for text in texts:
+                window.append(text)
+                if len(window) >= window_size:
+                    future = pool.submit(self.embed_texts, window)
+                    if pending is not None:
+                        yield pending.result()
+                    pending = future
+                    window = []
+            if window:
+                future = pool.submit(self.embed_texts, window)
+                if pending is not None:
+                    yield pending.result()
+                pending = future
+            if pending is not None:
+                yield pending.result()
+    
+    def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        """Embed texts with the provider, in batches."""
         try:
-            all_embeddings = []
+            batches = self._batches(texts)
             
-            # Process in batches
-            for i in range(0, len(texts), self.batch_size):
-                batch = texts[i:i + self.batch_size]
-                
-                logger.debug(f"Embedding batch {i//self.batch_size + 1}/{(len(texts)-1)//self.batch_size + 1} "
-                           f"({len(batch)} texts)")
-                
-                batch_embeddings = self._embed_batch(batch)
-                all_embeddings.append(batch_embeddings)
-                
-                # Small delay between batches to be respectful
-                if i + self.batch_size < len(texts):
-                    time.sleep(0.1)
-            
-            # Concatenate all embeddings
-            if not all_embeddings:
-                result = np.array([], dtype=np.float32).reshape(0, settings.EMBED_DIM)
-            elif len(all_embeddings) == 1:
-                result = all_embeddings[0]  # Single batch, no need to stack
+            if self._use_google and len(batches) > 1 and not self._in_event_loop():
+                # Network-bound: overlap the batch round trips
+                result = asyncio.run(self._embed_batches_async(batches, len(texts)))
             else:
-                result = np.vstack(all_embeddings)  # Multiple batches, stack them
+                # The first batch gives the embedding width; later batches are
+                # written straight into their rows of the output
+                result = None
+                offset = 0
+                for n, batch in enumerate(batches):
+                    logger.debug(f"Embedding batch {n + 1}/{len(batches)} ({len(batch)} texts)")
+                    if result is not None:
+                        self._embed_batch(batch, out=result[offset:offset + len(batch)])
+                    elif len(batches) == 1:
+                        result = self._embed_batch(batch)
+                    else:
+                        first = self._embed_batch(batch)
+                        result = np.empty((len(texts), first.shape[1]), dtype=np.float32)
+                        result[:len(batch)] = first
+                    offset += len(batch)
             
             logger.info(f"Successfully embedded {len(texts)} texts, output shape: {result.shape}")
             return result
@@ -185,6 +407,111 @@ class RAGEmbeddingService:
             logger.error(f"Error embedding {len(texts)} texts: {e}")
             raise e
     
+    def _lookup_cached(self, texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], List[str]]:
+        """Cache keys of texts, the in-memory hits, and the distinct keys still missing."""
+        # The model is part of the key: embeddings of different models are not interchangeable
+        namespace = (f"google:{self.model_name}" if self._use_google else "local") + "\0"
+        keys = [
+            hashlib.blake2b((namespace + text).encode("utf-8"), digest_size=16).hexdigest()
+            for text in texts
+        ]
+        found: Dict[str, np.ndarray] = {}
+        with self._cache_lock:
+            for key in keys:
+                vec = self._cache.get(key)
+                if vec is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vec
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        return keys, found, missing
+    
+    def _load_persisted(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Read embeddings from the embedding_cache table, back at unit length."""
+        stored = self.chunks_repo.get_cached_embeddings(keys)
+        if not stored:
+            return stored
+        # Quantized vectors come back slightly off unit length
+        matrix = self._normalize_batch(np.stack(list(stored.values())))
+        return dict(zip(stored, matrix))
+    
+    def _remember(self, entries: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Add embeddings to the in-memory cache, evicting the least recently used."""
+        # Copy rows so a cached vector does not keep its whole batch matrix alive
+        entries = {key: np.array(vec, dtype=np.float32) for key, vec in entries.items()}
+        if self._cache_size <= 0:
+            return entries
+        with self._cache_lock:
+            for key, vec in entries.items():
+                self._cache[key] = vec
+                self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return entries
+    
+    @staticmethod
+    def _assemble(keys: List[str], found: Dict[str, np.ndarray]) -> np.ndarray:
+        """Stack the embedding of each key, in order, into one C-contiguous (n, D) array."""
+        # Stack each distinct key once, then expand repeats with one fancy-indexing gather
+        positions: Dict[str, int] = {}
+        inverse = np.fromiter((positions.setdefault(key, len(positions)) for key in keys),
+                              dtype=np.intp, count=len(keys))
+        if len(positions) == len(keys):
+            return np.stack([found[key] for key in keys])
+        return np.stack([found[key] for key in positions])[inverse]
+    
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        """Split texts into API-sized batches."""
+        size = self.batch_size  # May be adapted concurrently
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+    
+    @staticmethod
+    def _in_event_loop() -> bool:
+        """Whether this thread already runs an event loop (asyncio.run cannot be used then)."""
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+    
+    async def _embed_batches_async(self, batches: List[List[str]], total: int) -> np.ndarray:
+        """Embed batches concurrently into one (total, D) array, keeping their order.
+        
+        Args:
+            batches: Batches of texts, each at most batch_size long
+            total: Number of texts across all batches
+        
+        Returns:
+            np.ndarray: Normalized embeddings
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        out: Optional[np.ndarray] = None
+        
+        async def embed(batch: List[str], offset: int) -> None:
+            nonlocal out
+            loop = asyncio.get_running_loop()
+            async with semaphore:
+                if out is not None:
+                    rows = out[offset:offset + len(batch)]
+                    await loop.run_in_executor(_EMBED_EXECUTOR, self._embed_batch, batch, rows)
+                    return
+                embeddings = await loop.run_in_executor(_EMBED_EXECUTOR, self._embed_batch, batch)
+            # The first batch to finish gives the embedding width
+            if out is None:
+                out = np.empty((total, embeddings.shape[1]), dtype=np.float32)
+            out[offset:offset + len(batch)] = embeddings
+        
+        offsets = np.cumsum([0] + [len(batch) for batch in batches[:-1]]).tolist()
+        logger.debug(f"Embedding {len(batches)} batches, up to {self.max_concurrency} at a time")
+        results = await asyncio.gather(
+            *(embed(batch, offset) for batch, offset in zip(batches, offsets)),
+            return_exceptions=True
+        )
+        # Every batch has finished (retries included) before the first error is raised
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return out
+    
     async def embed_query(self, text: str) -> List[float]:
         """Embed a single query text.
         
@@ -198,58 +525,69 @@ class RAGEmbeddingService:
             return [0.0] * settings.EMBED_DIM  # Return zero vector for empty text
         
         try:
-            # Local fallback path
+            # Local fallback path: await the provider on this loop so concurrent queries coalesce
             if not self._use_google and self._local_provider is not None:
-                # Handle async call properly in async context
                 vecs = await self._local_provider.embed_texts([text])
-                vec = vecs[0]
-                vec = self._normalize_vector(np.array(vec, dtype=np.float32))
-                return vec.tolist()
-
-            for attempt in range(self.max_retries):
-                try:
-                    # Use retrieval_query task type for queries
-                    result = genai.embed_content(
-                        model=f"models/{self.model_name}",
-                        content=text,
-                        task_type="retrieval_query"
-                    )
-                    
-                    # Extract embedding
-                    embedding = None
-                    if hasattr(result, 'embedding'):
-                        embedding = result.embedding
-                    elif isinstance(result, dict) and 'embedding' in result:
-                        embedding = result['embedding']
-                    
-                    if embedding is None:
-                        raise ValueError("No embedding returned from API")
-                    
-                    # Convert to numpy array and normalize
-                    embedding_array = np.array(embedding, dtype=np.float32)
-                    normalized_embedding = self._normalize_vector(embedding_array)
-                    
-                    return normalized_embedding.tolist()
-                    
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    
-                    # Handle rate limiting and retryable errors
-                    if ("429" in error_msg or "rate limit" in error_msg or 
-                        "timeout" in error_msg or "connection" in error_msg) and attempt < self.max_retries - 1:
-                        delay = self._exponential_backoff(attempt)
-                        logger.warning(f"Query embedding retry {attempt + 1}, waiting {delay:.1f}s: {e}")
-                        time.sleep(delay)
-                        continue
-                    
-                    raise e
+                return self._normalize_batch(np.array(vecs, dtype=np.float32))[0].tolist()
+            
+            # Queries arriving within EMBED_BATCH_MAX_WAIT_MS share one embedding request
+            loop = asyncio.get_running_loop()
+            batch = self._pending_queries
+            if batch is None or batch.flushed or batch.loop is not loop:
+                batch = _PendingQueries(loop)
+                self._pending_queries = batch
+                loop.call_later(self.query_batch_max_wait, self._flush_queries, batch)
             
-            raise Exception(f"Failed to embed query after {self.max_retries} attempts")
+            future = loop.create_future()
+            batch.items.append((text, future))
+            if len(batch.items) >= self.query_batch_max_size:
+                self._flush_queries(batch)
+            
+            embedding = await future
+            return embedding.tolist()
             
         except Exception as e:
             logger.error(f"Error embedding query text: {e}")
             raise e
     
+    def _flush_queries(self, batch: _PendingQueries) -> None:
+        """Embed the queries collected in batch with one request.
+        
+        Same retry and normalization as indexing batches, off the event loop. Not on
+        _EMBED_EXECUTOR: a query must not queue behind an indexing run's batches.
+        """
+        if batch.flushed:
+            return
+        batch.flushed = True
+        if self._pending_queries is batch:
+            self._pending_queries = None
+        
+        items = [(text, future) for text, future in batch.items if not future.done()]
+        if not items:
+            return
+        embedded = batch.loop.run_in_executor(
+            None, self._embed_batch, [text for text, _ in items], None, "retrieval_query"
+        )
+        embedded.add_done_callback(functools.partial(self._deliver_queries, items))
+    
+    @staticmethod
+    def _deliver_queries(items: List[Tuple[str, asyncio.Future]], embedded: asyncio.Future) -> None:
+        """Resolve each query's future with its row of the batch result."""
+        if embedded.cancelled():
+            for _, future in items:
+                future.cancel()
+            return
+        if embedded.exception() is not None:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(embedded.exception())
+            return
+        
+        embeddings = embedded.result()
+        for (_, future), embedding in zip(items, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+    
     def get_embedding_dimension(self) -> int:
         """Get the dimension of embeddings produced by this service."""
         if self._local_provider is not None and not self._use_google:
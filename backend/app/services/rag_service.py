@@ -1,21 +1,32 @@
 import time
+import asyncio
 import hashlib
-from typing import Dict, List, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, AsyncIterator, Iterator, Tuple
+import numpy as np
 from loguru import logger
 import google.generativeai as genai
 
 from ..config import settings
+from ..providers.genai_client import configure_genai
 from ..repositories.documents import DocumentsRepository
 from ..repositories.chunks import ChunksRepository
 from ..services.doc_parse_service import DocParseService
 from ..services.chunk_service import ChunkService
 from ..services.rag_embedding_service import rag_embedding_service
 from ..services.mmr_service import mmr_service
-from ..services.prompt_packer import prompt_packer
+from ..services.prompt_packer import prompt_packer, ANSWER_SYSTEM_INSTRUCTION
 from ..services.gemini_direct_service import gemini_direct_service
+from ..services.semantic_cache import semantic_cache
 from .. import db
 
 
+def _preview(content: str, limit: int = 200) -> str:
+    """First limit characters of content, with an ellipsis when it was cut."""
+    return content if len(content) <= limit else content[:limit] + '...'
+
+
 class RAGService:
     """Service for orchestrating RAG (Retrieval-Augmented Generation) operations."""
     
@@ -31,16 +42,94 @@ class RAGService:
         self.mmr_lambda = settings.RAG_MMR_LAMBDA  # 0.5
         self.similarity_threshold = settings.RAG_SIMILARITY_THRESHOLD  # 0.3
         self.generation_model = settings.RAG_GENERATION_MODEL  # gemini-1.5-flash
+        self.workspace_max_docs = settings.RAG_WORKSPACE_MAX_DOCS
+
+        # Cached {dim: (document_ids, centroid matrix)}; reset whenever a document is indexed
+        self._centroids: Optional[Dict[int, tuple]] = None
+        self._centroids_lock = threading.RLock()
+
+        # In-memory LRU of generated answers: key -> (monotonic time, result)
+        self._answer_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._answer_cache_max = settings.RAG_ANSWER_CACHE_SIZE
+        self._answer_cache_ttl = settings.RAG_ANSWER_CACHE_TTL
+
+        # Chunks stored since document_chunks statistics were last refreshed
+        self._inserts_since_analyze = 0
+        self._last_analyze = 0.0
+        self._analyze_lock = threading.Lock()
         
         # Configure Google AI for generation (optional)
         api_key = settings.GOOGLE_API_KEY or settings.GEMINI_API_KEY
         self._generation_enabled = bool(api_key)
+        self.model = None
         if self._generation_enabled:
             try:
-                genai.configure(api_key=api_key)
+                configure_genai(api_key)
+                # Built once and shared by every answer call; the fixed instruction is the
+                # system instruction, so each request shares the same leading prefix
+                self.model = genai.GenerativeModel(
+                    self.generation_model,
+                    system_instruction=ANSWER_SYSTEM_INSTRUCTION
+                )
+                self._generation_config = genai.types.GenerationConfig(
+                    max_output_tokens=500,  # Limit response length
+                    temperature=0.1,  # Low temperature for factual responses
+                    top_p=0.8,
+                    top_k=40
+                )
             except Exception as e:
                 logger.warning(f"Failed to configure Google generation, will use fallback answers: {e}")
                 self._generation_enabled = False
+                self.model = None
+    
+    def _maybe_analyze(self, inserted: int) -> None:
+        """Refresh document_chunks statistics once enough chunks have been stored.
+        
+        ANALYZE scans the whole table, so it runs after RAG_ANALYZE_EVERY stored
+        chunks and at most once per RAG_ANALYZE_MIN_INTERVAL_S, not per document.
+        
+        Args:
+            inserted: Number of chunks just stored
+        """
+        with self._analyze_lock:
+            self._inserts_since_analyze += inserted
+            now = time.monotonic()
+            if (self._inserts_since_analyze < settings.RAG_ANALYZE_EVERY
+                    or now - self._last_analyze < settings.RAG_ANALYZE_MIN_INTERVAL_S):
+                return
+            self._inserts_since_analyze = 0
+            self._last_analyze = now
+        
+        try:
+            db.call_db(db.db_execute, "ANALYZE document_chunks")
+        except Exception as e:
+            logger.warning(f"Failed to run ANALYZE: {e}")
+    
+    @staticmethod
+    def _answer_cache_key(cache_scope: str, query: str) -> str:
+        """Cache key for a query (whitespace-normalized) against one document version."""
+        normalized = ' '.join(query.split())
+        return hashlib.sha256(f"{cache_scope}:{normalized}".encode('utf-8')).hexdigest()
+    
+    def _get_cached_answer(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached answer, dropping it if expired."""
+        hit = self._answer_cache.get(cache_key)
+        if hit is None:
+            return None
+        if time.monotonic() - hit[0] >= self._answer_cache_ttl:
+            del self._answer_cache[cache_key]
+            return None
+        self._answer_cache.move_to_end(cache_key)
+        return hit[1]
+    
+    def _remember_answer(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """Put an answer in the LRU, evicting the least recently used."""
+        if self._answer_cache_max <= 0:
+            return
+        self._answer_cache[cache_key] = (time.monotonic(), result)
+        self._answer_cache.move_to_end(cache_key)
+        while len(self._answer_cache) > self._answer_cache_max:
+            self._answer_cache.popitem(last=False)
     
     def _get_advisory_lock_id(self, document_id: str) -> int:
         """Generate a consistent advisory lock ID for a document.
@@ -65,15 +154,14 @@ class RAGService:
         Returns:
             List of citation objects with page_number, similarity_score, and text
         """
-        citations = []
-        for context in contexts:
-            citation = {
+        return [
+            {
                 'page_number': context.get('page_start', 1),
                 'similarity_score': context.get('score', 0.0),
-                'text': context.get('content', '')[:200] + ('...' if len(context.get('content', '')) > 200 else '')
+                'text': _preview(context.get('content', ''))
             }
-            citations.append(citation)
-        return citations
+            for context in contexts
+        ]
     
     def _try_acquire_lock(self, document_id: str) -> bool:
         """
@@ -86,29 +174,25 @@ class RAGService:
             bool: True if lock acquired, False otherwise
         """
         try:
-            # For SQLite, we'll use a simple table-based locking mechanism
-            # Check if document is already being processed
-            existing_lock = db.db_query_one(
-                "SELECT document_id FROM processing_locks WHERE document_id = ?",
-                (document_id,)
+            # One atomic statement: insert the lock row, or take over a row left behind
+            # by a worker that died mid-index. A row comes back iff the lock is ours.
+            acquired = db.call_db(
+                db.db_query_all,
+                """
+                INSERT INTO processing_locks (document_id, created_at) VALUES (?, datetime('now'))
+                ON CONFLICT(document_id) DO UPDATE SET created_at = excluded.created_at
+                WHERE processing_locks.created_at < datetime('now', ?)
+                RETURNING document_id
+                """,
+                (document_id, f"-{settings.RAG_INDEX_LOCK_STALE_MINUTES} minutes")
             )
             
-            if existing_lock:
+            if not acquired:
                 logger.info(f"Document {document_id} is already being processed")
                 return False
             
-            # Try to insert a lock record
-            try:
-                db.db_execute(
-                    "INSERT INTO processing_locks (document_id, created_at) VALUES (?, datetime('now'))",
-                    (document_id,)
-                )
-                logger.info(f"Acquired processing lock for document {document_id}")
-                return True
-            except Exception:
-                # Lock already exists (race condition)
-                logger.info(f"Failed to acquire lock for document {document_id} (race condition)")
-                return False
+            logger.info(f"Acquired processing lock for document {document_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"Error acquiring advisory lock for {document_id}: {e}")
@@ -122,7 +206,8 @@ class RAGService:
         """
         try:
             # Remove the lock record from processing_locks table
-            db.db_execute(
+            db.call_db(
+                db.db_execute,
                 "DELETE FROM processing_locks WHERE document_id = ?",
                 (document_id,)
             )
@@ -134,6 +219,9 @@ class RAGService:
     def ensure_index(self, document_id: str) -> Dict[str, Any]:
         """Ensure document is indexed for RAG queries.
         
+        Runs on a worker thread; parsing and embedding stay there, while every
+        database step is handed to the DB executor (db.call_db).
+        
         Args:
             document_id: Document identifier
         
@@ -144,10 +232,9 @@ class RAGService:
         
         try:
             # Check if already indexed
-            if self.chunks_repo.exists(document_id):
-                # Use count_by_document instead of topk_exact with zero vector
-                chunk_count = self.chunks_repo.count_by_document(document_id)
-                
+            # One COUNT answers both "indexed?" and "how many chunks?"
+            chunk_count = db.call_db(self.chunks_repo.count_by_document, document_id)
+            if chunk_count:
                 logger.info(f"Document {document_id} already indexed with {chunk_count} chunks")
                 return {
                     'chunks': chunk_count,
@@ -166,8 +253,8 @@ class RAGService:
             
             try:
                 # Double-check after acquiring lock
-                if self.chunks_repo.exists(document_id):
-                    chunk_count = self.chunks_repo.count_by_document(document_id)
+                chunk_count = db.call_db(self.chunks_repo.count_by_document, document_id)
+                if chunk_count:
                     return {
                         'chunks': chunk_count,
                         'status': 'already_indexed',
@@ -175,7 +262,7 @@ class RAGService:
                     }
                 
                 # Get document
-                document = self.documents_repo.get(document_id)
+                document = db.call_db(self.documents_repo.get, document_id)
                 if not document:
                     raise ValueError(f"Document {document_id} not found")
                 
@@ -194,13 +281,8 @@ class RAGService:
                             file_extension = Path(original_filename).suffix
                             full_file_path = storage_dir / f"{document_id}{file_extension}"
                         else:
-                            # Fallback: try to find the file with common extensions
-                            full_file_path = None
-                            for ext in ['.pdf', '.txt', '.md', '.doc', '.docx']:
-                                candidate_path = storage_dir / f"{document_id}{ext}"
-                                if candidate_path.exists():
-                                    full_file_path = candidate_path
-                                    break
+                            # Fallback: find the stored file whatever its extension (one directory scan)
+                            full_file_path = next(storage_dir.glob(f"{document_id}.*"), None)
                             if not full_file_path:
                                 raise ValueError(f"Document file not found for {document_id}")
                     else:
@@ -233,7 +315,8 @@ class RAGService:
                     if text:
                         normalized_pages.append({
                             'page_num': page_num,
-                            'text': text
+                            'text': text,
+                            'blocks': page.get('blocks')
                         })
                 
                 if not normalized_pages:
@@ -244,11 +327,31 @@ class RAGService:
                         'latency_ms': int((time.time() - start_time) * 1000)
                     }
                 
-                # Generate chunks
+                # Chunk and embed in a single pass: chunks are embedded window by window
+                # as they are produced, and the next window's API calls run while
+                # this thread counts tokens and chunks the following text
                 logger.info(f"Generating chunks for document {document_id} ({len(normalized_pages)} pages)")
-                chunks = self.chunk_service.make_chunks(document_id, normalized_pages)
+                chunks_with_embeddings = []
+                
+                def contents() -> Iterator[str]:
+                    for chunk in self.chunk_service.iter_chunks(document_id, normalized_pages):
+                        chunks_with_embeddings.append(chunk)
+                        yield chunk['content']
                 
-                if not chunks:
+                embedding_sum = None
+                offset = 0
+                for embeddings in rag_embedding_service.iter_embed_texts(contents()):
+                    batch = chunks_with_embeddings[offset:offset + len(embeddings)]
+                    offset += len(embeddings)
+                    # Stored so prompt packing can budget stored chunks without re-tokenizing
+                    token_counts = prompt_packer.count_tokens([chunk['content'].strip() for chunk in batch])
+                    batch_sum = embeddings.sum(axis=0)
+                    embedding_sum = batch_sum if embedding_sum is None else embedding_sum + batch_sum
+                    for chunk, embedding, token_count in zip(batch, embeddings, token_counts):
+                        chunk['embedding'] = embedding  # float32 row; converted when stored
+                        chunk['token_count'] = token_count
+                
+                if not chunks_with_embeddings:
                     logger.warning(f"No chunks generated for document {document_id}")
                     return {
                         'chunks': 0,
@@ -256,32 +359,13 @@ class RAGService:
                         'latency_ms': int((time.time() - start_time) * 1000)
                     }
                 
-                # Generate embeddings
-                logger.info(f"Generating embeddings for {len(chunks)} chunks")
-                chunk_texts = [chunk['content'] for chunk in chunks]
-                embeddings = rag_embedding_service.embed_texts(chunk_texts)
-                
-                # Prepare chunks with embeddings
-                chunks_with_embeddings = []
-                for i, chunk in enumerate(chunks):
-                    chunks_with_embeddings.append({
-                        'chunk_index': chunk['chunk_index'],
-                        'content': chunk['content'],
-                        'page_start': chunk['page_start'],
-                        'page_end': chunk['page_end'],
-                        'embedding': embeddings[i].tolist()
-                    })
-                
                 # Store in database
                 logger.info(f"Storing {len(chunks_with_embeddings)} chunks in database")
-                stored_count = self.chunks_repo.bulk_upsert(document_id, chunks_with_embeddings)
+                stored_count = db.call_db(self.chunks_repo.bulk_upsert, document_id, chunks_with_embeddings)
+                # The centroid is normalized, so the sum gives the same direction as the mean
+                self._store_centroid(document_id, embedding_sum.reshape(1, -1))
                 
-                # Run ANALYZE for better query performance (PostgreSQL)
-                try:
-                    if hasattr(db, 'db_execute'):
-                        db.db_execute("ANALYZE document_chunks")
-                except Exception as e:
-                    logger.warning(f"Failed to run ANALYZE: {e}")
+                self._maybe_analyze(stored_count)
                 
                 logger.info(
                     f"Successfully indexed document {document_id}: {stored_count} chunks, "
@@ -307,6 +391,86 @@ class RAGService:
                 'latency_ms': int((time.time() - start_time) * 1000)
             }
     
+    def _store_centroid(self, document_id: str, embeddings: np.ndarray) -> None:
+        """Persist the normalized mean of a document's chunk embeddings."""
+        try:
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            if matrix.size == 0:
+                return
+            centroid = matrix.mean(axis=0)
+            norm = np.linalg.norm(centroid)
+            if norm > 0:
+                centroid /= norm
+            db.call_db(self.chunks_repo.upsert_centroid, document_id, centroid)
+        except Exception as e:
+            logger.warning(f"Failed to store centroid for document {document_id}: {e}")
+        finally:
+            with self._centroids_lock:
+                self._centroids = None
+
+    def _load_centroids(self) -> Dict[int, tuple]:
+        with self._centroids_lock:
+            if self._centroids is None:
+                # Backfill documents indexed before centroids were stored
+                stored = {row['document_id'] for row in self.chunks_repo.get_all_centroids()}
+                for document_id in self.chunks_repo.list_indexed_document_ids():
+                    if document_id not in stored:
+                        try:
+                            self._store_centroid(document_id, self.chunks_repo.get_embeddings(document_id))
+                        except Exception as e:
+                            logger.warning(f"Failed to backfill centroid for document {document_id}: {e}")
+
+                # Group by dimension in case documents were indexed with different embedding models
+                grouped: Dict[int, tuple] = {}
+                for row in self.chunks_repo.get_all_centroids():
+                    ids, vecs = grouped.setdefault(row['vec'].shape[0], ([], []))
+                    ids.append(row['document_id'])
+                    vecs.append(row['vec'])
+                self._centroids = {dim: (ids, np.vstack(vecs)) for dim, (ids, vecs) in grouped.items()}
+            return self._centroids
+
+    def rank_documents(self, query_embedding: List[float], document_ids: List[str],
+                       limit: Optional[int] = None) -> List[str]:
+        """Pick the indexed documents most likely to answer a query.
+
+        Scores each document by cosine similarity between the query and the
+        centroid of its chunk embeddings, so workspace queries only run the
+        full RAG pipeline on the best few documents.
+
+        Args:
+            query_embedding: Normalized query vector
+            document_ids: Documents to choose from
+            limit: Maximum number of documents (defaults to RAG_WORKSPACE_MAX_DOCS)
+
+        Returns:
+            List[str]: Indexed document ids, most similar first
+        """
+        limit = limit or self.workspace_max_docs
+        query = np.asarray(query_embedding, dtype=np.float32)
+        ids, matrix = self._load_centroids().get(query.shape[0], ([], None))
+
+        allowed = set(document_ids)
+        positions = np.fromiter((i for i, doc_id in enumerate(ids) if doc_id in allowed), dtype=np.int64)
+        if positions.size == 0:
+            return []
+
+        scores = matrix[positions] @ query
+        k = min(limit, positions.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [ids[positions[i]] for i in top]
+
+    def _generate_answer_stream(self, prompt: str) -> Iterator[str]:
+        """Yield answer text chunks as the generative model produces them."""
+        response = self.model.generate_content(
+            prompt,
+            generation_config=self._generation_config,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
     def _generate_answer(self, prompt: str) -> str:
         """Generate answer using Google's generative model.
         
@@ -317,19 +481,9 @@ class RAGService:
             str: Generated answer
         """
         try:
-            model = genai.GenerativeModel(self.generation_model)
-            
-            # Configure generation parameters
-            generation_config = genai.types.GenerationConfig(
-                max_output_tokens=500,  # Limit response length
-                temperature=0.1,  # Low temperature for factual responses
-                top_p=0.8,
-                top_k=40
-            )
-            
-            response = model.generate_content(
+            response = self.model.generate_content(
                 prompt,
-                generation_config=generation_config
+                generation_config=self._generation_config
             )
             
             if response and response.text:
@@ -356,12 +510,7 @@ class RAGService:
             return "No relevant information found in the document."
         
         # Create bullet points from top contexts
-        points = []
-        for i, context in enumerate(contexts[:5]):  # Max 5 points
-            content = context['content'][:200]  # Truncate to 200 chars
-            if len(context['content']) > 200:
-                content += "..."
-            points.append(f"• {content}")
+        points = [f"• {_preview(context['content'])}" for context in contexts[:5]]  # Max 5 points
         
         fallback = "Based on the document content:\n\n" + "\n\n".join(points)
         
@@ -370,12 +519,86 @@ class RAGService:
         
         return fallback
     
-    async def answer(self, query: str, document_id: str) -> Dict[str, Any]:
+    async def _full_document_answer(self, query: str, document_id: str,
+                                    query_embedding: Optional[List[float]], stream: bool):
+        """Answer from the whole document: a result dict, or an event stream when stream is set."""
+        if stream:
+            return gemini_direct_service.query_stream(query, document_id, query_embedding)
+        return await gemini_direct_service.query_with_full_document(query, document_id, query_embedding)
+
+    async def _retrieve(self, query: str, document_id: str, query_embedding: Optional[List[float]],
+                        start_time: float, stream: bool = False) -> tuple:
+        """Select the contexts for a query.
+
+        Returns:
+            (result, None) when the query is answered without retrieval (document not
+            indexed, or no usable candidates), otherwise (None, selected_contexts).
+            With stream set, a full-document answer comes back as an event stream
+            instead of a result dict.
+        """
+        # Generate query embedding
+        if query_embedding is None:
+            logger.debug(f"Generating query embedding for: {query[:100]}...")
+            query_embedding = await rag_embedding_service.embed_query(query)
+        
+        # Retrieve candidate chunks
+        candidates = await db.run_db(
+            self.chunks_repo.topk_exact,
+            document_id, 
+            query_embedding, 
+            candidate_k=self.candidate_k,
+            return_embeddings=True
+        )
+        
+        if not candidates:
+            # Only this (rare) path pays for telling "not indexed" from "indexed, nothing usable"
+            if not await db.run_db(self.chunks_repo.exists, document_id):
+                logger.warning(f"Document {document_id} not indexed")
+                return ({
+                    'answer': 'Document is not indexed yet. Please wait for indexing to complete.',
+                    'citations': [],
+                    'latency_ms': int((time.time() - start_time) * 1000),
+                    'fallback': False,
+                    'status': 'not_indexed'
+                }, None)
+            logger.info(f"No candidates found for query, trying Gemini direct query for document {document_id}")
+            return await self._full_document_answer(query, document_id, query_embedding, stream), None
+        
+        # Filter candidates by similarity threshold. topk_exact returns candidates
+        # best first, so the ones above the threshold are a prefix of the list.
+        scores = np.fromiter((candidate.get('score', 0.0) for candidate in candidates),
+                             dtype=np.float64, count=len(candidates))
+        keep = int(np.count_nonzero(scores >= self.similarity_threshold))
+        filtered_candidates = candidates[:keep]
+        
+        logger.debug(
+            f"Filtered {len(candidates)} candidates to {len(filtered_candidates)} "
+            f"above threshold {self.similarity_threshold}"
+        )
+        
+        if not filtered_candidates:
+            logger.info(f"No candidates above threshold {self.similarity_threshold}, trying Gemini direct query for document {document_id}")
+            return await self._full_document_answer(query, document_id, query_embedding, stream), None
+        
+        # Apply MMR for diversity on filtered candidates: stack their embeddings into one
+        # (n, d) matrix and reuse the scores array from the threshold pass
+        if self.top_k >= keep:
+            selected_indices = range(keep)
+        else:
+            matrix = np.stack([np.asarray(candidate['embedding'], dtype=np.float32)
+                               for candidate in filtered_candidates])
+            selected_indices = mmr_service.mmr_matrix(matrix, scores[:keep], self.top_k, self.mmr_lambda)
+        selected_contexts = [filtered_candidates[i] for i in selected_indices]
+        return None, selected_contexts
+
+    async def answer(self, query: str, document_id: str,
+                     query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """Answer a query using RAG on the specified document.
         
         Args:
             query: User query
             document_id: Document identifier
+            query_embedding: Precomputed query embedding (computed here if omitted)
         
         Returns:
             Dict with 'answer', 'citations', 'latency_ms', 'fallback' fields
@@ -391,51 +614,28 @@ class RAGService:
                     'fallback': False
                 }
             
-            # Check if document is indexed
-            if not self.chunks_repo.exists(document_id):
-                logger.warning(f"Document {document_id} not indexed")
+            # Same (or, once embedded, a paraphrased) question on the same document
+            # version: skip retrieval and generation
+            document = await db.run_db(self.documents_repo.get, document_id)
+            cache_scope = f"rag:{document_id}:{document.get('updated_at')}" if document else None
+            cache_key = self._answer_cache_key(cache_scope, query) if cache_scope else None
+            cached = self._get_cached_answer(cache_key) if cache_key else None
+            if cached is None and cache_scope and semantic_cache.answers_enabled:
+                if query_embedding is None:
+                    query_embedding = await rag_embedding_service.embed_query(query)
+                cached = semantic_cache.lookup(cache_scope, query_embedding)
+            if cached is not None:
+                logger.info(f"RAG answer cache hit for document {document_id}")
                 return {
-                    'answer': 'Document is not indexed yet. Please wait for indexing to complete.',
-                    'citations': [],
+                    **cached,
+                    'citations': [dict(citation) for citation in cached['citations']],
                     'latency_ms': int((time.time() - start_time) * 1000),
-                    'fallback': False,
-                    'status': 'not_indexed'
+                    'cache_hit': True
                 }
             
-            # Generate query embedding
-            logger.debug(f"Generating query embedding for: {query[:100]}...")
-            query_embedding = await rag_embedding_service.embed_query(query)
-            
-            # Retrieve candidate chunks
-            candidates = self.chunks_repo.topk_exact(
-                document_id, 
-                query_embedding, 
-                candidate_k=self.candidate_k,
-                return_embeddings=True
-            )
-            
-            if not candidates:
-                logger.info(f"No candidates found for query, trying Gemini direct query for document {document_id}")
-                return gemini_direct_service.query_with_full_document(query, document_id)
-            
-            # Filter candidates by similarity threshold
-            filtered_candidates = [
-                candidate for candidate in candidates 
-                if candidate.get('score', 0.0) >= self.similarity_threshold
-            ]
-            
-            logger.debug(
-                f"Filtered {len(candidates)} candidates to {len(filtered_candidates)} "
-                f"above threshold {self.similarity_threshold}"
-            )
-            
-            if not filtered_candidates:
-                logger.info(f"No candidates above threshold {self.similarity_threshold}, trying Gemini direct query for document {document_id}")
-                return gemini_direct_service.query_with_full_document(query, document_id)
-            
-            # Apply MMR for diversity on filtered candidates
-            selected_indices = mmr_service.mmr(filtered_candidates, self.top_k, self.mmr_lambda)
-            selected_contexts = [filtered_candidates[i] for i in selected_indices]
+            result, selected_contexts = await self._retrieve(query, document_id, query_embedding, start_time)
+            if result is not None:
+                return result
             
             # Pack prompt
             logger.debug("Packing prompt with contexts")
@@ -453,7 +653,8 @@ class RAGService:
             if self._generation_enabled:
                 try:
                     logger.debug("Generating answer")
-                    answer = self._generate_answer(prompt)
+                    # The SDK call blocks; keep it off the event loop
+                    answer = await asyncio.to_thread(self._generate_answer, prompt)
                     
                     # Convert citations to proper format
                     formatted_citations = self._format_citations_for_frontend(selected_contexts)
@@ -472,7 +673,12 @@ class RAGService:
                         f"{result['contexts_used']} contexts, {tokens_in_est} tokens"
                     )
                     
-                    return result
+                    if cache_key:
+                        self._remember_answer(cache_key, result)
+                        if query_embedding is not None and semantic_cache.answers_enabled:
+                            semantic_cache.insert(cache_scope, query_embedding, result)
+                    # Callers may annotate citations; keep the cached ones untouched
+                    return {**result, 'citations': [dict(citation) for citation in result['citations']]}
                 except Exception as gen_error:
                     logger.error(f"Generation failed, using fallback: {gen_error}")
 
@@ -497,6 +703,73 @@ class RAGService:
                 'error': str(e)
             }
 
+    async def answer_stream(self, query: str, document_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an answer for a query on the specified document.
+        
+        Yields 'token' events ({'text': ...}) as the answer is generated, then one
+        'done' event carrying the remaining answer() fields (citations, latency_ms,
+        fallback, ...), or an 'error' event if the query fails.
+        
+        Args:
+            query: User query
+            document_id: Document identifier
+        """
+        start_time = time.time()
+        streamed = False
+        
+        try:
+            result, selected_contexts = await self._retrieve(query, document_id, None, start_time, stream=True)
+            if result is not None and not isinstance(result, dict):
+                # Full-document answer, streamed token by token
+                async for event in result:
+                    streamed = True
+                    yield event
+                return
+            if result is not None:
+                yield {'event': 'token', 'data': {'text': result.get('answer', '')}}
+                yield {'event': 'done', 'data': {k: v for k, v in result.items() if k != 'answer'}}
+                return
+            
+            pack_result = prompt_packer.pack(query, selected_contexts)
+            formatted_citations = self._format_citations_for_frontend(selected_contexts)
+            
+            if self._generation_enabled:
+                try:
+                    # The SDK stream is blocking; pull each chunk on a worker thread
+                    chunks = self._generate_answer_stream(pack_result['prompt'])
+                    end = object()
+                    while (text := await asyncio.to_thread(next, chunks, end)) is not end:
+                        streamed = True
+                        yield {'event': 'token', 'data': {'text': text}}
+                    
+                    yield {'event': 'done', 'data': {
+                        'citations': formatted_citations,
+                        'latency_ms': int((time.time() - start_time) * 1000),
+                        'fallback': False,
+                        'tokens_in_est': pack_result['tokens_in_est'],
+                        'contexts_used': pack_result['contexts_used']
+                    }}
+                    return
+                except Exception as gen_error:
+                    if streamed:
+                        raise
+                    logger.error(f"Generation failed, using fallback: {gen_error}")
+            
+            fallback_answer = self._create_fallback_answer(selected_contexts, pack_result['citations'])
+            yield {'event': 'token', 'data': {'text': fallback_answer}}
+            yield {'event': 'done', 'data': {
+                'citations': formatted_citations,
+                'latency_ms': int((time.time() - start_time) * 1000),
+                'fallback': True
+            }}
+        
+        except Exception as e:
+            logger.error(f"Error in RAG answer stream for document {document_id}: {e}")
+            yield {'event': 'error', 'data': {
+                'error': str(e),
+                'latency_ms': int((time.time() - start_time) * 1000)
+            }}
+
 
 # Global instance
 rag_service = RAGService()
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from ..config import settings
+
+
+class SemanticCache:
+    """Answer cache that also hits on paraphrased queries.
+
+    Entries are grouped per document scope (document id plus version) and looked
+    up by the cosine similarity of query embeddings. Each scope holds at most
+    SEMANTIC_CACHE_MAX_ENTRIES answers and at most SEMANTIC_CACHE_MAX_SCOPES
+    scopes are kept; both are evicted least recently used. A scope is small, so
+    a lookup is one NumPy matrix-vector product over its stacked embeddings.
+    """
+
+    def __init__(self):
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self.max_scopes = settings.SEMANTIC_CACHE_MAX_SCOPES
+        self.ttl = settings.SEMANTIC_CACHE_TTL
+
+        self._lock = threading.Lock()
+        # scope -> OrderedDict(entry id -> (monotonic time, unit vector, result))
+        self._scopes: "OrderedDict[str, OrderedDict[int, Tuple[float, np.ndarray, Dict[str, Any]]]]" = OrderedDict()
+        # scope -> (entry ids, stacked vectors), rebuilt after the scope changes
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_scopes > 0
+
+    @property
+    def answers_enabled(self) -> bool:
+        """Whether RAG and direct answers use the cache (SEMANTIC_CACHE_THRESHOLD > 0)."""
+        return self.enabled and self.threshold > 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        if not vec.size or norm == 0:
+            return None
+        return vec / norm
+
+    def _matrix(self, scope: str) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            entries = self._scopes[scope]
+            ids = list(entries)
+            cached = (ids, np.stack([entries[entry_id][1] for entry_id in ids]))
+            self._matrices[scope] = cached
+        return cached
+
+    def lookup(self, scope: str, embedding: List[float],
+               threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached result of the most similar earlier query, if similar enough.
+
+        Args:
+            scope: Cache scope, e.g. document id and version
+            embedding: Query embedding
+            threshold: Minimum cosine similarity (defaults to SEMANTIC_CACHE_THRESHOLD)
+
+        Returns:
+            Optional[Dict[str, Any]]: The cached result, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+        threshold = self.threshold if threshold is None else threshold
+        if threshold <= 0:
+            return None
+
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not entries:
+                return None
+            ids, matrix = self._matrix(scope)
+            if matrix.shape[1] != query.shape[0]:
+                return None
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold:
+                return None
+
+            entry_id = ids[best]
+            created, _, result = entries[entry_id]
+            if time.monotonic() - created >= self.ttl:
+                del entries[entry_id]
+                self._matrices.pop(scope, None)
+                return None
+
+            entries.move_to_end(entry_id)
+            self._scopes.move_to_end(scope)
+            logger.debug(f"Semantic cache hit for scope {scope} (similarity {similarities[best]:.3f})")
+            return result
+
+    def insert(self, scope: str, embedding: List[float], result: Dict[str, Any]) -> None:
+        """Cache a result under the query embedding that produced it.
+
+        Args:
+            scope: Cache scope, e.g. document id and version
+            embedding: Query embedding
+            result: Result to return for similar queries
+        """
+        if not self.enabled:
+            return
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is None:
+                entries = self._scopes[scope] = OrderedDict()
+            elif entries and next(iter(entries.values()))[1].shape != vec.shape:
+                # Embedding model changed; earlier vectors are not comparable
+                entries.clear()
+            self._scopes.move_to_end(scope)
+
+            entries[self._next_id] = (time.monotonic(), vec, result)
+            self._next_id += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._matrices.pop(scope, None)
+
+            while len(self._scopes) > self.max_scopes:
+                evicted, _ = self._scopes.popitem(last=False)
+                self._matrices.pop(evicted, None)
+
+
+# Global instance
+semantic_cache = SemanticCache()
@@ -11,6 +11,13 @@ from loguru import logger
 
 from ..config import settings
 
+# Handle optional Google Cloud Storage client
+try:
+    from google.cloud import storage
+    GCS_AVAILABLE = True
+except ImportError:
+    GCS_AVAILABLE = False
+
 _SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9._-]+")
 
 
@@ -30,9 +37,15 @@ class StorageService:
         self.bucket_name = settings.GCS_BUCKET
         self.prefix = settings.GCS_UPLOAD_PREFIX.rstrip("/") + "/" if settings.GCS_UPLOAD_PREFIX else ""
         self.client = storage.Client()
+        # Bucket handle is built once; every operation below reuses it (and the client's session)
+        self._bucket = self.client.bucket(self.bucket_name)
 
     def _sanitize_filename(self, filename: str) -> str:
-        cleaned = _SAFE_NAME_RE.sub("-", filename.strip()) or "file"
+        filename = filename.strip()
+        # Common case: already only [A-Za-z0-9._-], so the regex has nothing to replace
+        if filename.isascii() and filename.replace(".", "").replace("_", "").replace("-", "").isalnum():
+            return filename[:128]
+        cleaned = _SAFE_NAME_RE.sub("-", filename) or "file"
         return cleaned[:128]
 
     def build_object_name(self, document_id: str, filename: str) -> str:
@@ -42,8 +55,7 @@ class StorageService:
     def create_signed_upload(self, object_name: str, content_type: str) -> SignedUpload:
         if settings.GCS_SIGNED_URL_EXPIRATION_SECONDS <= 0:
             raise RuntimeError("Signed URL expiration must be positive")
-        bucket = self.client.bucket(self.bucket_name)
-        blob = bucket.blob(object_name)
+        blob = self._bucket.blob(object_name)
         expiration = dt.timedelta(seconds=settings.GCS_SIGNED_URL_EXPIRATION_SECONDS)
         upload_url = blob.generate_signed_url(
             version="v4",
@@ -60,17 +72,20 @@ class StorageService:
 
     def download_to_tempfile(self, object_name: str) -> str:
         """Download object to a temporary file and return the path."""
-        bucket = self.client.bucket(self.bucket_name)
-        blob = bucket.blob(object_name)
+        blob = self._bucket.blob(object_name)
         tmp_fd, tmp_path = tempfile.mkstemp(prefix="kakuti-", suffix=object_name.split('/')[-1])
-        os.close(tmp_fd)
-        blob.download_to_filename(tmp_path)
+        # Stream into the descriptor mkstemp already opened instead of closing and reopening by name
+        try:
+            with os.fdopen(tmp_fd, "wb") as tmp_file:
+                blob.download_to_file(tmp_file)
+        except Exception:
+            os.remove(tmp_path)
+            raise
         logger.info("Downloaded %s to temp path %s", object_name, tmp_path)
         return tmp_path
 
     def delete_object(self, object_name: str) -> None:
-        bucket = self.client.bucket(self.bucket_name)
-        blob = bucket.blob(object_name)
+        blob = self._bucket.blob(object_name)
         blob.delete(if_exists=True)
         logger.info("Deleted GCS object %s", object_name)
 
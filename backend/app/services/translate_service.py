@@ -1,18 +1,250 @@
-from typing import List, Dict, Optional
+import asyncio
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, List, Dict, Optional, Tuple
 from loguru import logger
 from .. import db
+from ..config import settings
 from ..repositories.translations import TranslationRepository
 from ..repositories.documents import DocumentsRepository as DocumentRepository
+from .rag_embedding_service import rag_embedding_service
+from .semantic_cache import semantic_cache
 
 # Handle optional LLM provider
 try:
     from ..providers import get_llm_provider
+    from ..providers.http_client import rate_limit_headers
     LLM_AVAILABLE = True
 except ImportError:
     LLM_AVAILABLE = False
 
 
+# A call slower per character than this multiple of the running average counts as congestion
+LATENCY_SPIKE_FACTOR = 2.0
+
+# Runs of spaces and tabs, collapsed in cache keys so spacing variants share an entry
+_HORIZONTAL_SPACE = re.compile(r"[ \t]+")
+
+# Blank lines separate paragraphs; the captured separator is kept for reassembly
+_PARAGRAPH_BREAK = re.compile(r"(\n\s*\n)")
+
+# Text made only of digits, punctuation, symbols and whitespace is returned as is
+_UNTRANSLATABLE = re.compile(r"[\d\W_]+")
+
+# Letters of scripts written by only one target language (Japanese needs kana, see _skip_reason).
+# Cyrillic, Arabic and Devanagari are shared by several languages, so ru/ar/hi are not detected
+_TARGET_SCRIPTS = {
+    "ja": re.compile(r"[\u3040-\u30ff\u31f0-\u31ff\u4e00-\u9fff]"),
+    "ko": re.compile(r"[\uac00-\ud7af\u1100-\u11ff\u3130-\u318f]"),
+}
+_KANA = re.compile(r"[\u3040-\u30ff\u31f0-\u31ff]")
+# Share of letters that must be in the target script for text to count as already translated
+TARGET_SCRIPT_RATIO = 0.9
+
+
+def _skip_reason(text: str, target_lang: str) -> Optional[str]:
+    """Why text needs no translation into target_lang (as a result source), or None if it does."""
+    if _UNTRANSLATABLE.fullmatch(text):
+        return "Untranslatable Input"
+    script = _TARGET_SCRIPTS.get(target_lang)
+    if script is None:
+        return None
+    # Kanji alone could just as well be Chinese
+    if target_lang == "ja" and not _KANA.search(text):
+        return None
+    letters = sum(1 for ch in text if ch.isalpha())
+    in_script = len(script.findall(text))
+    if letters and in_script >= TARGET_SCRIPT_RATIO * letters:
+        return "Already In Target Language"
+    return None
+
+
+# Attempts per translation for transient provider errors, and the backoff between them
+TRANSLATE_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+_TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+# Remaining request quota at or below this share of the limit, or this many requests, holds new calls
+LOW_QUOTA_RATIO = 0.1
+LOW_QUOTA_REQUESTS = 2
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """Whether an LLM error is worth retrying: rate limit, 5xx, timeout or refused connection."""
+    error_type = str(type(error))
+    if "ConnectError" in error_type or "Timeout" in error_type:
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status in _TRANSIENT_STATUS:
+        return True
+    error_msg = str(error).lower()
+    return "429" in error_msg or "rate limit" in error_msg or "quota" in error_msg
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Seconds to wait before retry number attempt + 1.
+
+    Honors a Retry-After header (in seconds) when the error carries one; otherwise
+    a random delay up to RETRY_BASE_DELAY * 2**attempt, capped at RETRY_MAX_DELAY.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return min(RETRY_MAX_DELAY, max(0.0, float(headers.get("retry-after"))))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in a header value such as '20', '20ms', '1.5s' or '6m0s'."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _quota_pause(headers: Dict[str, str]) -> Optional[float]:
+    """Seconds to hold new calls when rate-limit headers report the request quota nearly used up."""
+    try:
+        remaining = int(headers["x-ratelimit-remaining-requests"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    try:
+        limit = int(headers.get("x-ratelimit-limit-requests"))
+    except (TypeError, ValueError):
+        limit = None
+    if remaining > LOW_QUOTA_REQUESTS and (limit is None or remaining > LOW_QUOTA_RATIO * limit):
+        return None
+    pause = (_parse_duration(headers.get("retry-after"))
+             or _parse_duration(headers.get("x-ratelimit-reset-requests")))
+    return min(RETRY_MAX_DELAY, pause if pause is not None else RETRY_BASE_DELAY)
+
+
+class _AdaptiveConcurrency:
+    """Limit on concurrent LLM calls that adapts to the provider, AIMD style.
+
+    Each call that completes normally raises the limit by 1/limit, about one per
+    round of calls (additive increase). A transient provider error, or a call
+    much slower per character than the running average, halves it (multiplicative
+    decrease), at most once per round: only calls started after the last decrease
+    can trigger another. The limit stays within [1, max_limit]. hold() also
+    keeps new calls from starting for a while when the provider reports its
+    quota nearly used up.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        self._ema_latency_per_char: Optional[float] = None
+        self._last_decrease = 0.0
+        self._resume_at = 0.0
+
+    @asynccontextmanager
+    async def slot(self, size: int) -> AsyncIterator[None]:
+        """Hold one call slot for the duration of the block.
+
+        Args:
+            size: Length of the text being translated, to normalize latency
+        """
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if _is_transient_error(e):
+                self._decrease(started)
+            raise
+        else:
+            self._record(started, time.monotonic() - started, size)
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _record(self, started: float, latency: float, size: int) -> None:
+        per_char = latency / max(1, size)
+        ema = self._ema_latency_per_char
+        self._ema_latency_per_char = per_char if ema is None else 0.8 * ema + 0.2 * per_char
+        if ema is not None and per_char > LATENCY_SPIKE_FACTOR * ema:
+            self._decrease(started)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def hold(self, seconds: float, started: float) -> None:
+        """Start no new calls for the given time and back the limit off for this round."""
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        self._decrease(started)
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            return  # Already backed off for this round of calls
+        self._last_decrease = time.monotonic()
+        self.limit = max(1.0, self.limit / 2)
+        logger.info(f"Translation concurrency reduced to {int(self.limit)}")
+
+
+
+class _RateWindow:
+    """Sliding one-minute window of requests and tokens sent to the provider.
+
+    acquire() waits until one more request of the given size fits under the
+    requests-per-minute and tokens-per-minute quotas, then books it. A limit of
+    0 disables that check; a request larger than the whole token quota is let
+    through once the window is empty.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._sent: Deque[Tuple[float, int]] = deque()  # (monotonic time, tokens)
+        self._tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    async def acquire(self, tokens: int) -> None:
+        while True:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0][0] >= self.WINDOW:
+                self._tokens -= self._sent.popleft()[1]
+            
+            fits_requests = self.rpm <= 0 or len(self._sent) < self.rpm
+            fits_tokens = self.tpm <= 0 or not self._sent or self._tokens + tokens <= self.tpm
+            if fits_requests and fits_tokens:
+                self._sent.append((now, tokens))
+                self._tokens += tokens
+                return
+            # Wait for the oldest booking to leave the window, then re-check
+            await asyncio.sleep(self._sent[0][0] + self.WINDOW - now)
+
+
 class TranslateService:
+    # Fixed SQL text, so sqlite3's per-connection statement cache reuses the compiled statements
+    _SELECT_SQL = "SELECT translations FROM translation_cache WHERE cache_key = ?"
+    _UPSERT_SQL = "INSERT OR REPLACE INTO translation_cache (cache_key, translations) VALUES (?, ?)"
+    # Set once translation_cache has been created in this process
+    _cache_table_ready = False
+
     def __init__(self):
         self.llm = None
         if LLM_AVAILABLE:
@@ -23,13 +255,31 @@ class TranslateService:
                 logger.error(f"Error initializing LLM provider: {e}")
         else:
             logger.warning("LLM not available")
-        
+        self._provider_name = self.llm.__class__.__name__ if self.llm else "Mock Provider"
+
         self.translation_repo = TranslationRepository()
         self.document_repo = DocumentRepository()
+        # Hot entries in front of translation_cache: (text, target language) -> translated text.
+        # Keyed on the pair itself, so a memory hit needs no key normalization or digest
+        self._mem: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._mem_max = settings.TRANSLATE_MEMORY_CACHE_SIZE
+        # Caps LLM translation calls in flight, backing off when the provider pushes back
+        self._concurrency = _AdaptiveConcurrency(settings.TRANSLATE_MAX_CONCURRENCY)
+        # Proactive quota pacing, so bursts wait here instead of drawing 429s
+        self._rate_window = _RateWindow(settings.TRANSLATE_RPM, settings.TRANSLATE_TPM)
+        # Recent failures: (text, target language) -> (fallback result, expiry), so an outage is not retried per call
+        self._neg_cache: "OrderedDict[Tuple[str, str], Tuple[Dict, float]]" = OrderedDict()
+        self._neg_ttl = settings.TRANSLATE_NEGATIVE_TTL
+        self._semantic_threshold = settings.TRANSLATE_SEMANTIC_THRESHOLD
+        # Circuit breaker: after enough consecutive failures every call falls back until _degraded_until
+        self._consecutive_failures = 0
+        self._degraded_until = 0.0
         self._init_cache_table()
 
     def _init_cache_table(self):
         """Initialize the translation cache table if it doesn't exist."""
+        if TranslateService._cache_table_ready:
+            return
         try:
             db.execute("""
                 CREATE TABLE IF NOT EXISTS translation_cache (
@@ -39,6 +289,7 @@ class TranslateService:
                 )
             """)
             db.CONN.commit()
+            TranslateService._cache_table_ready = True
             logger.info("Translation cache table initialized")
         except Exception as e:
             logger.error(f"Error initializing cache table: {e}")
@@ -47,9 +298,7 @@ class TranslateService:
         """
         Get the name of the current translation provider.
         """
-        if self.llm is None:
-            return "Mock Provider"
-        return self.llm.__class__.__name__
+        return self._provider_name
 
     async def translate_document(self, doc_id: str, target_lang: str) -> Optional[dict]:
         """
@@ -57,8 +306,8 @@ class TranslateService:
         Returns the translation if successful, None if document not found.
         """
         # Check if translation already exists
-        existing_translation = self.translation_repo.get_document_translation_by_language(
-            doc_id, target_lang
+        existing_translation = await db.run_db(
+            self.translation_repo.get_document_translation_by_language, doc_id, target_lang
         )
         if existing_translation:
             logger.info(f"Found existing translation for document {doc_id} in {target_lang}")
@@ -66,97 +315,380 @@ class TranslateService:
             return existing_translation
 
         # Get document content
-        document = self.document_repo.get(doc_id)
+        document = await db.run_db(self.document_repo.get, doc_id)
         if not document:
             logger.error(f"Document {doc_id} not found")
             return None
 
         # Get document body
-        doc_body = self.document_repo.get_document_body(doc_id)
+        doc_body = await db.run_db(self.document_repo.get_document_body, doc_id)
         if not doc_body:
             logger.error(f"Document body for {doc_id} not found")
             return None
 
         # Translate title and body
+        pending: List[Tuple[str, str]] = []
         try:
-            title_translation = await self._translate_text(document["title"], target_lang) if document["title"] else {"text": None, "source": None}
-            body_translation = await self._translate_text(doc_body["body"], target_lang) if doc_body["body"] else {"text": None, "source": None}
+            # Title and body are independent LLM calls; run them concurrently. New
+            # translations are collected in pending and cached with one write.
+            title_translation, body_translation = await asyncio.gather(
+                self._translate_or_none(document["title"], target_lang, pending),
+                self._translate_body(doc_body["body"], target_lang, pending),
+            )
             
             # Create translation record
-            translation_id = self.translation_repo.create_translation(
+            translation_id = await db.run_db(
+                self.translation_repo.create_translation,
                 doc_id=doc_id,
                 target_language=target_lang,
                 title=title_translation["text"],
                 body=body_translation["text"],
             )
             
-            return self.translation_repo.get_translation(translation_id)
+            return await db.run_db(self.translation_repo.get_translation, translation_id)
             
         except Exception as e:
             logger.error(f"Translation failed for document {doc_id}: {e}")
             return None
+        finally:
+            await self._flush_cache(pending)
 
-    async def _translate_text(self, text: str, target_lang: str) -> Dict:
+    async def translate_languages(self, text: str, target_langs: List[str]) -> Dict[str, Dict]:
         """
-        Translate a single piece of text to the target language.
-        Returns a dictionary containing the translated text and its source.
+        Translate one text into several target languages concurrently.
+        Returns a mapping of target language to _translate_text's result.
+        """
+        unique = list(dict.fromkeys(target_langs))
+        pending: List[Tuple[str, str]] = []
+        try:
+            results = await asyncio.gather(*(self._translate_text(text, lang, pending) for lang in unique))
+        finally:
+            await self._flush_cache(pending)
+        return dict(zip(unique, results))
+
+    async def translate_stream(self, text: str, target_lang: str) -> AsyncIterator[Dict]:
+        """
+        Like _translate_text, but yields 'token' events as the provider generates the
+        translation and a final 'done' event with the source. Cached and fallback
+        results are emitted as a single token. The complete translation is cached as usual.
         """
         if not text:
-            return {"text": "", "source": "Empty Input"}
-            
-        # Generate a cache key for the text
-        cache_key = f"{text}_{target_lang}"
+            yield {"event": "done", "data": {"source": "Empty Input"}}
+            return
+        skip = _skip_reason(text, target_lang)
+        if skip is not None:
+            yield {"event": "token", "data": {"text": text}}
+            yield {"event": "done", "data": {"source": skip}}
+            return
+
+        key = (text, target_lang)
+        result = await self._lookup(key)
+        if result is None and not self.llm:
+            result = {"text": text, "source": "No Provider Available"}
+        if result is None and self._degraded_until > time.monotonic():
+            result = {"text": text, "source": "Fallback (Provider Degraded)"}
+        embedding = None
+        if result is None:
+            similar, embedding = await self._semantic_lookup(text, target_lang)
+            if similar is not None:
+                result = {"text": similar, "source": "Semantic Cache"}
+
+        if result is None:
+            parts: List[str] = []
+            started = time.monotonic()
+            rate_limit_headers.set(None)
+            try:
+                if self._rate_window.enabled:
+                    await self._rate_window.acquire(2 * max(1, len(text) // 4))
+                async with self._concurrency.slot(len(text)):
+                    async for chunk in self.llm.translate_stream(text, target_lang):
+                        parts.append(chunk)
+                        yield {"event": "token", "data": {"text": chunk}}
+            except Exception as e:
+                if parts:
+                    logger.error(f"Translation stream failed mid-answer: {e}")
+                    yield {"event": "error", "data": {"error": str(e)}}
+                    return
+                logger.error(f"Translation failed: {e}")
+                result = {"text": text, "source": f"Fallback ({self._provider_name} error)"}
+                self._record_failure(key, result)
+                result = dict(result)
+            else:
+                translated = "".join(parts)
+                self._observe_quota(started)
+                self._consecutive_failures = 0
+                self._remember(key, translated)
+                self._remember_semantic(target_lang, embedding, translated)
+                await self._flush_cache([(self._cache_key(text, target_lang), translated)])
+                yield {"event": "done", "data": {"source": self._provider_name}}
+                return
+
+        yield {"event": "token", "data": {"text": result["text"]}}
+        yield {"event": "done", "data": {"source": result["source"]}}
+
+    async def _flush_cache(self, pending: List[Tuple[str, str]]) -> None:
+        """Write the collected (cache_key, translation) rows to translation_cache in one transaction."""
+        if not pending:
+            return
+        try:
+            await db.run_db(self._store_cached, pending)
+        except Exception as cache_error:
+            logger.warning("Skipping {} translation cache writes due to error: {}", len(pending), cache_error)
+
+    async def _translate_or_none(self, text: Optional[str], target_lang: str,
+                                 pending: Optional[List[Tuple[str, str]]] = None) -> Dict:
+        if not text:
+            return {"text": None, "source": None}
+        return await self._translate_text(text, target_lang, pending)
+
+    @staticmethod
+    def _split_paragraphs(body: str, max_chars: int) -> List[Tuple[str, str]]:
+        """
+        Split body into chunks of whole paragraphs of at most max_chars (a longer
+        paragraph is its own chunk). Returns (chunk, separator after it) pairs, so
+        joining every chunk with its separator gives back the original layout.
+        """
+        parts = _PARAGRAPH_BREAK.split(body)
+        chunks = []
+        current, current_len = [], 0
+        for paragraph, separator in zip(parts[::2], parts[1::2] + [""]):
+            if current and current_len + len(paragraph) > max_chars:
+                chunks.append(("".join(current[:-1]), current[-1]))
+                current, current_len = [], 0
+            current += [paragraph, separator]
+            current_len += len(paragraph) + len(separator)
+        if current:
+            chunks.append(("".join(current[:-1]), current[-1]))
+        return chunks
+
+    async def _translate_body(self, body: Optional[str], target_lang: str,
+                              pending: Optional[List[Tuple[str, str]]] = None) -> Dict:
+        """
+        Translate a document body chunk by chunk, concurrently.
+        Each chunk is cached on its own, so a repeated or unchanged paragraph
+        group is not sent to the LLM again.
+        """
+        if not body:
+            return {"text": None, "source": None}
+        chunks = self._split_paragraphs(body, settings.TRANSLATE_CHUNK_CHARS)
+        if len(chunks) == 1:
+            return await self._translate_text(body, target_lang, pending)
         
-        # Check translation cache
-        cached_translation = db.query_one(
-            "SELECT translations FROM translation_cache WHERE cache_key = ?",
-            (cache_key,)
-        )
+        # Whitespace-only chunks are kept as they are; repeated chunks (headers,
+        # disclaimers) are translated once
+        unique = list(dict.fromkeys(chunk for chunk, _ in chunks if chunk.strip()))
+        results = await asyncio.gather(*(self._translate_text(chunk, target_lang, pending) for chunk in unique))
+        translated = dict(zip(unique, results))
+        parts, sources = [], set()
+        for chunk, separator in chunks:
+            if chunk in translated:
+                result = translated[chunk]
+                chunk = result["text"]
+                sources.add(result["source"])
+            parts += [chunk, separator]
+        return {"text": "".join(parts), "source": sources.pop() if len(sources) == 1 else "Mixed"}
+
+    @staticmethod
+    def _cache_key(text: str, target_lang: str) -> str:
+        """
+        Fixed-size translation_cache key for a translation request.
+        A 128-bit digest keeps the primary key 32 characters long instead of the
+        full source text. Leading and trailing whitespace and repeated spaces do
+        not change the key; line breaks do.
+        """
+        text = _HORIZONTAL_SPACE.sub(" ", text.strip())
+        payload = f"{target_lang}\0{text}".encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _select_cached(self, cache_key: str) -> Optional[str]:
+        result = db.CONN.execute(self._SELECT_SQL, (cache_key,)).fetchone()
+        return result["translations"] if result else None
+
+    def _store_cached(self, rows: List[Tuple[str, str]]) -> None:
+        # The connection context manager commits (or rolls back) the whole batch
+        with db.CONN:
+            db.CONN.executemany(self._UPSERT_SQL, rows)
+
+    def _remember(self, key: Tuple[str, str], translated: str) -> None:
+        """Put a translation in the in-memory LRU, evicting the least recently used."""
+        if self._mem_max <= 0:
+            return
+        self._mem[key] = translated
+        self._mem.move_to_end(key)
+        while len(self._mem) > self._mem_max:
+            self._mem.popitem(last=False)
+
+    def _recent_failure(self, key: Tuple[str, str]) -> Optional[Dict]:
+        """Return the cached fallback result for a recently failed translation, if still fresh."""
+        entry = self._neg_cache.get(key)
+        if entry is None:
+            return None
+        result, expires = entry
+        if expires <= time.monotonic():
+            del self._neg_cache[key]
+            return None
+        return dict(result)
+
+    def _record_failure(self, key: Tuple[str, str], result: Dict) -> None:
+        """Remember a fallback result and trip the circuit breaker after repeated failures."""
+        now = time.monotonic()
+        if self._neg_ttl > 0:
+            self._neg_cache[key] = (result, now + self._neg_ttl)
+            self._neg_cache.move_to_end(key)
+            while len(self._neg_cache) > max(1, self._mem_max):
+                self._neg_cache.popitem(last=False)
+
+        self._consecutive_failures += 1
+        threshold = settings.TRANSLATE_BREAKER_THRESHOLD
+        if threshold > 0 and self._consecutive_failures >= threshold and self._degraded_until <= now:
+            self._degraded_until = now + self._neg_ttl
+            logger.warning(
+                f"{self._consecutive_failures} consecutive translation failures, "
+                f"falling back for {self._neg_ttl:.0f}s"
+            )
+
+    async def _lookup(self, key: Tuple[str, str]) -> Optional[Dict]:
+        """
+        Answer a (text, target language) pair from the memory LRU, the recent-failure
+        cache or translation_cache. Returns None when the text has to go to the provider.
+        """
+        # Repeated strings are answered from memory without touching SQLite
+        translated = self._mem.get(key)
+        if translated is not None:
+            self._mem.move_to_end(key)
+            return {"text": translated, "source": "Memory Cache"}
+
+        # A text that just failed is not retried against the provider until the entry expires
+        failed = self._recent_failure(key)
+        if failed is not None:
+            return failed
+        
+        # Check translation cache (on the DB executor, off the event loop)
+        cached_translation = await db.run_db(self._select_cached, self._cache_key(*key))
         
-        if cached_translation:
+        if cached_translation is not None:
             logger.info("Found cached translation")
+            self._remember(key, cached_translation)
             return {
-                "text": cached_translation["translations"],
+                "text": cached_translation,
                 "source": "Database Cache"
             }
+        return None
+
+    async def _semantic_lookup(self, text: str, target_lang: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """
+        Look for the translation of a near-identical earlier text.
+        Returns (translation or None, text embedding or None when the layer is off or embedding failed).
+        """
+        if self._semantic_threshold <= 0 or not semantic_cache.enabled:
+            return None, None
+        try:
+            embedding = await rag_embedding_service.embed_query(text)
+        except Exception as e:
+            logger.debug(f"Skipping semantic translation cache: {e}")
+            return None, None
+        hit = semantic_cache.lookup(f"translate:{target_lang}", embedding, self._semantic_threshold)
+        return (hit["text"] if hit else None), embedding
+
+    def _remember_semantic(self, target_lang: str, embedding: Optional[List[float]], translated: str) -> None:
+        if embedding is not None:
+            semantic_cache.insert(f"translate:{target_lang}", embedding, {"text": translated})
+
+    async def _call_llm(self, text: str, target_lang: str) -> str:
+        """
+        Translate text with the LLM provider, retrying transient errors with backoff.
+        Each attempt is paced by the rate window and holds one adaptive concurrency slot.
+        """
+        for attempt in range(TRANSLATE_MAX_ATTEMPTS):
+            if self._rate_window.enabled:
+                # About 4 characters per token, for the text and a translation of similar length.
+                # Paced before taking a slot, so quota waits do not count as provider latency
+                await self._rate_window.acquire(2 * max(1, len(text) // 4))
+            started = time.monotonic()
+            rate_limit_headers.set(None)
+            try:
+                async with self._concurrency.slot(len(text)):
+                    translated = await self.llm.translate(text, target_lang)
+            except Exception as e:
+                if attempt == TRANSLATE_MAX_ATTEMPTS - 1 or not _is_transient_error(e):
+                    raise
+                delay = _retry_delay(attempt, e)
+                logger.warning(f"Translation attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                self._observe_quota(started)
+                return translated
+
+    def _observe_quota(self, started: float) -> None:
+        """Slow down before the provider starts refusing, based on the last response's rate-limit headers."""
+        headers = rate_limit_headers.get()
+        pause = _quota_pause(headers) if headers else None
+        if pause is not None:
+            logger.info(f"Provider quota nearly used up, holding new translation calls for {pause:.1f}s")
+            self._concurrency.hold(pause, started)
+
+    async def _translate_text(self, text: str, target_lang: str,
+                              pending: Optional[List[Tuple[str, str]]] = None) -> Dict:
+        """
+        Translate a single piece of text to the target language.
+        Returns a dictionary containing the translated text and its source.
+        A new translation is written to translation_cache right away, or appended
+        to pending as (cache_key, translation) when the caller batches the writes.
+        """
+        if not text:
+            return {"text": "", "source": "Empty Input"}
+        # Numbers, punctuation and text already in the target script never reach the caches or the LLM
+        skip = _skip_reason(text, target_lang)
+        if skip is not None:
+            return {"text": text, "source": skip}
+            
+        key = (text, target_lang)
+        cached = await self._lookup(key)
+        if cached is not None:
+            return cached
             
         if not self.llm:
             logger.warning("No LLM provider available, returning original text")
             return {"text": text, "source": "No Provider Available"}
+
+        if self._degraded_until > time.monotonic():
+            return {"text": text, "source": "Fallback (Provider Degraded)"}
+
+        similar, embedding = await self._semantic_lookup(text, target_lang)
+        if similar is not None:
+            return {"text": similar, "source": "Semantic Cache"}
             
         try:
-            translated = await self.llm.translate(text, target_lang)
+            translated = await self._call_llm(text, target_lang)
+            self._consecutive_failures = 0
+            self._remember(key, translated)
+            self._remember_semantic(target_lang, embedding, translated)
 
-            try:
-                db.execute(
-                    "INSERT OR REPLACE INTO translation_cache (cache_key, translations) VALUES (?, ?)",
-                    (cache_key, translated)
-                )
-                db.CONN.commit()
-            except Exception as cache_error:
-                logger.warning(
-                    "Skipping translation cache write for key {} due to error: {}",
-                    cache_key,
-                    cache_error,
-                )
+            cache_key = self._cache_key(text, target_lang)
+            if pending is not None:
+                pending.append((cache_key, translated))
+            else:
+                await self._flush_cache([(cache_key, translated)])
 
             return {
                 "text": translated,
-                "source": self.get_provider_name()
+                "source": self._provider_name
             }
         except Exception as e:
             # Check if it's a network connection error
             if "httpx.ConnectError" in str(type(e)) or "ConnectError" in str(type(e)):
                 logger.error(f"Network connection error during translation: {e}")
                 fallback_text = text or ""
-                return {
+                result = {
                     "text": fallback_text,
                     "source": f"Fallback (Network Error)"
                 }
             else:
                 logger.error(f"Translation failed: {e}")
                 fallback_text = text or ""
-                return {
+                result = {
                     "text": fallback_text,
-                    "source": f"Fallback ({self.get_provider_name()} error)"
+                    "source": f"Fallback ({self._provider_name} error)"
                 }
+            self._record_failure(key, result)
+            return dict(result)
@@ -0,0 +1,246 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from .. import db
+from ..config import settings
+
+# Handle optional FAISS dependency
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    faiss = None
+    FAISS_AVAILABLE = False
+
+
+def pack_vector(vec: np.ndarray, dtype: str = "float32") -> bytes:
+    """Serialize an embedding for doc_embeddings.
+
+    float16 halves the blob; int8 stores a float32 scale followed by one byte per
+    dimension. The format is recovered from the blob size in unpack_vector.
+    """
+    vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+    if vec.size <= 4:
+        # Blob sizes of the reduced formats would be ambiguous
+        return vec.tobytes()
+    if dtype == "float16":
+        return vec.astype(np.float16).tobytes()
+    if dtype == "int8":
+        peak = float(np.abs(vec).max()) if vec.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        codes = np.round(vec / scale).astype(np.int8)
+        return np.float32(scale).tobytes() + codes.tobytes()
+    return vec.tobytes()
+
+
+def unpack_vector(blob: bytes, dim: int) -> np.ndarray:
+    """Decode a doc_embeddings blob written by pack_vector back to float32."""
+    blob = bytes(blob)
+    if len(blob) == dim * 2:
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if len(blob) == dim + 4:
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class VectorIndexService:
+    """In-memory nearest-neighbour index over the document embeddings in `doc_embeddings`.
+
+    Uses FAISS when installed (flat inner-product for small corpora, IVF once the
+    corpus is large enough to train it) and a vectorized NumPy scan otherwise.
+    VECTOR_INDEX_QUANTIZATION stores FAISS codes as int8 (sq8) or PQ codes (pq)
+    to cut the bytes scanned per query; quantized hits are re-ranked against the
+    FP32 vectors.
+    With VECTOR_INDEX_USE_GPU and a GPU build of FAISS, unfiltered searches run on
+    a GPU replica; the CPU index is kept for filtered searches and as fallback.
+    Vectors are L2-normalized, so inner product equals cosine similarity.
+    """
+
+    def __init__(self):
+        self.ivf_threshold = settings.VECTOR_INDEX_IVF_THRESHOLD
+        self.nprobe = settings.VECTOR_INDEX_NPROBE
+        self.quantization = settings.VECTOR_INDEX_QUANTIZATION
+        self.refine_factor = max(1, settings.VECTOR_INDEX_REFINE_FACTOR)
+        self._gpu_resources = self._init_gpu() if settings.VECTOR_INDEX_USE_GPU else None
+
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._dim: Optional[int] = None
+        self._index = None
+        self._gpu_index = None
+        self._is_ivf = False
+        self._is_quantized = False
+        self._matrix: Optional[np.ndarray] = None
+        self._rowids: Optional[np.ndarray] = None
+        self._pos_by_rowid: Dict[int, int] = {}
+        self._doc_by_rowid: Dict[int, str] = {}
+        self._rowid_by_doc: Dict[str, int] = {}
+
+    def _init_gpu(self):
+        if not FAISS_AVAILABLE or not hasattr(faiss, "StandardGpuResources"):
+            logger.warning("VECTOR_INDEX_USE_GPU set but FAISS has no GPU support; using CPU index")
+            return None
+        if faiss.get_num_gpus() == 0:
+            logger.warning("VECTOR_INDEX_USE_GPU set but no GPU detected; using CPU index")
+            return None
+        return faiss.StandardGpuResources()
+
+    def _codec(self, dim: int, ivf: bool) -> str:
+        """FAISS factory string for the vector storage part of the index."""
+        if self.quantization == "pq" and ivf:
+            # 8 dimensions per 8-bit sub-quantizer: 32x smaller than FP32
+            if dim % 8 == 0:
+                return f"PQ{dim // 8}"
+            logger.warning(f"PQ needs dim divisible by 8 (got {dim}); using SQ8")
+            return "SQ8"
+        if self.quantization in ("sq8", "pq"):
+            # PQ codebooks need far more training vectors than a flat index has; SQ8 instead
+            return "SQ8"
+        return "Flat"
+
+    def invalidate(self) -> None:
+        """Mark the index stale; it is rebuilt on the next search.
+
+        Call after the new embedding is committed. search() clears the flag before
+        its rebuild reads doc_embeddings, so an invalidate() that lands during a
+        rebuild is not lost.
+        """
+        self._dirty = True
+
+    def _build(self, dim: int) -> None:
+        rows = db.query_all("SELECT rowid AS rid, doc_id, dim, vec FROM doc_embeddings")
+        rows = [row for row in rows if row['dim'] == dim]
+
+        self._dim = dim
+        self._doc_by_rowid = {row['rid']: row['doc_id'] for row in rows}
+        self._pos_by_rowid = {row['rid']: i for i, row in enumerate(rows)}
+        self._rowid_by_doc = {row['doc_id']: row['rid'] for row in rows}
+        self._rowids = np.fromiter((row['rid'] for row in rows), dtype=np.int64, count=len(rows))
+
+        matrix = np.empty((len(rows), dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            matrix[i] = unpack_vector(row['vec'], dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        self._matrix = matrix
+
+        self._index = None
+        self._gpu_index = None
+        self._is_ivf = False
+        self._is_quantized = False
+        if FAISS_AVAILABLE and len(rows):
+            if len(rows) >= self.ivf_threshold:
+                nlist = max(1, int(np.sqrt(len(rows))))
+                codec = self._codec(dim, ivf=True)
+                index = faiss.index_factory(dim, f"IVF{nlist},{codec}", faiss.METRIC_INNER_PRODUCT)
+                index.train(matrix)
+                index.nprobe = self.nprobe
+                self._is_ivf = True
+            else:
+                codec = self._codec(dim, ivf=False)
+                index = faiss.IndexIDMap(faiss.index_factory(dim, codec, faiss.METRIC_INNER_PRODUCT))
+                index.train(matrix)
+            self._is_quantized = codec != "Flat"
+            index.add_with_ids(matrix, self._rowids)
+            self._index = index
+            if self._gpu_resources is not None:
+                try:
+                    self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
+                except Exception as e:
+                    logger.warning(f"Failed to move vector index to GPU, using CPU: {e}")
+
+        logger.info(
+            f"Built vector index: {len(rows)} vectors, dim={dim}, "
+            f"backend={'faiss-ivf' if self._is_ivf else 'faiss-flat' if self._index is not None else 'numpy'}"
+            f"{f' ({self.quantization})' if self._is_quantized else ''}"
+            f"{' (gpu)' if self._gpu_index is not None else ''}"
+        )
+
+    def search(self, query_embedding: np.ndarray, k: int = 10,
+               doc_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return up to k (doc_id, cosine similarity) pairs, best first.
+
+        Args:
+            query_embedding: Query vector
+            k: Number of results
+            doc_ids: Optional candidate filter; candidates are scored exactly
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        with self._lock:
+            if self._dirty or self._dim != query.shape[0]:
+                # Cleared before _build reads the rows: a write that invalidates during
+                # the rebuild sets it again and is picked up by the next search
+                self._dirty = False
+                try:
+                    self._build(query.shape[0])
+                except Exception:
+                    self._dirty = True
+                    raise
+
+            candidates = None
+            if doc_ids:
+                candidates = np.fromiter(
+                    (self._rowid_by_doc[d] for d in set(doc_ids) if d in self._rowid_by_doc),
+                    dtype=np.int64,
+                )
+                if candidates.size == 0:
+                    return []
+
+            total = len(self._rowids) if candidates is None else candidates.size
+            k = min(k, total)
+            if k <= 0:
+                return []
+
+            if candidates is not None:
+                return self._search_candidates(query, k, candidates)
+            if self._index is not None:
+                return self._search_faiss(query, k)
+            return self._search_numpy(query, k)
+
+    def _search_candidates(self, query: np.ndarray, k: int,
+                           candidates: np.ndarray) -> List[Tuple[str, float]]:
+        # An explicit candidate list is small enough to score exactly. Searching the IVF
+        # with an ID selector would drop candidates outside the nprobe probed lists
+        positions = np.fromiter((self._pos_by_rowid[int(rid)] for rid in candidates),
+                                dtype=np.int64, count=candidates.size)
+        scores = self._matrix[positions] @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._doc_by_rowid[int(candidates[i])], float(scores[i])) for i in top]
+
+    def _search_faiss(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        index = self._gpu_index if self._gpu_index is not None else self._index
+        total = len(self._rowids)
+        fetch = min(total, k * self.refine_factor) if self._is_quantized else k
+        scores, ids = index.search(np.ascontiguousarray(query.reshape(1, -1)), fetch)
+        ids = ids[0][ids[0] != -1]
+        if self._is_quantized:
+            # Re-rank the approximate hits with exact FP32 inner products
+            positions = np.fromiter((self._pos_by_rowid[int(rid)] for rid in ids), dtype=np.int64, count=ids.size)
+            exact = self._matrix[positions] @ query
+            order = np.argsort(-exact)[:k]
+            return [(self._doc_by_rowid[int(ids[i])], float(exact[i])) for i in order]
+        return [
+            (self._doc_by_rowid[int(rid)], float(score))
+            for rid, score in zip(ids, scores[0])
+        ]
+
+    def _search_numpy(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        rowids = self._rowids
+        scores = self._matrix @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._doc_by_rowid[int(rowids[i])], float(scores[i])) for i in top]
+
+
+# Global instance
+vector_index_service = VectorIndexService()